@@ -0,0 +1,346 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end throughput benchmark of the query pipeline against the local fake LLM server.
+
+    python benchmarks/bench_pipeline.py [--queries 1 4 50 500] [--driver service runtime workers]
+                                        [--mode wave combined] [--latency lognormal:0.4,0.5]
+                                        [--error-rate 0.02] [--rate-limit-rate 0.02]
+                                        [--record PATH | --replay PATH [--replay-latency-scale 1]]
+
+Starts benchmarks/fake_llm_server.py in a child process and points both SDKs at it through
+ANTHROPIC_BASE_URL / OPENAI_BASE_URL, so everything from prompt building to retries, rate
+limiting, streaming and post-processing runs for real. Three drivers:
+
+  * service: AIService.process_query_with_variants for every query, gathered on one loop.
+  * runtime: the UI path - a JobRunner job on a ServiceRuntime background loop, with the
+    calling thread polling the job store the way the app does.
+  * workers: `python -m src.worker --workers N` processes sharing a temporary job store and
+    rate budget, running one submitted job. Wall time runs from the first claim to the last
+    result (worker start-up excluded); stage latencies come from the results' spans, and
+    peak memory is the parent's only.
+
+Each size runs on a fresh service (cold rate limiters, empty in-memory response cache and
+angle index) and reports wall time, p50/p95 latency per stage (measured around each API call,
+so it includes waits for the rate limiter and semaphores), API requests per query as seen by
+the server, input/output tokens per query, the mean uniqueness score (each variant's highest
+similarity to a sibling; lower is better) and the tracemalloc peak. Several --mode values run
+every size once per mode, e.g. to compare today's "wave" path with the one-call "combined" mode. tracemalloc slows the run down; pass --no-trace-memory for clean
+wall times. --record saves every provider call of the run to a cassette (src/cassette.py); --replay
+answers the same sizes and modes from it without the fake server, at full speed by default,
+so the timings are the pipeline's own work (prompt building, post-processing, scheduling):
+compare them across commits to catch throughput regressions. API keys come from the usual settings sources (see src/settings.py) and are
+never sent anywhere but the fake server.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCHMARKS_DIR, "..")))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_llm_server import add_server_arguments
+from src.ai_integrations import AIService
+from src.angle_index import AngleIndex
+from src.cassette import Cassette
+from src.config import VARIANT_EXECUTION_MODES
+from src.instrumentation import iter_result_spans, summarize_results
+from src.job_queue import JobRunner, JobStore, FINISHED_JOB_STATUSES
+from src.response_cache import ResponseCache
+from src.scheduler import PrioritySlots
+from src.service_runtime import ServiceRuntime
+
+QUERY_TOPICS = [
+    "How are small e-commerce brands cutting return rates this season?",
+    "What is one overlooked way startups can reduce customer acquisition cost?",
+    "Which hiring mistakes do first-time founders regret most?",
+    "How should remote teams run effective quarterly planning?",
+    "What do finance leaders wish marketing teams understood about budgets?",
+]
+
+
+def build_queries(count):
+    return [
+        {
+            "id": i + 1,
+            "text": f"{QUERY_TOPICS[i % len(QUERY_TOPICS)]} (benchmark query {i + 1})",
+            "client_info": {"name": f"Client {i % 7}", "guidelines": "Founder of a mid-size agency. Practical, specific advice only."},
+        }
+        for i in range(count)
+    ]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(args):
+    port = _free_port()
+    command = [
+        sys.executable, os.path.join(BENCHMARKS_DIR, "fake_llm_server.py"), "--port", str(port),
+        "--latency", args.latency, "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate), "--retry-after", str(args.retry_after),
+        "--stream-chunks", str(args.stream_chunks), "--seed", str(args.seed),
+        "--batch-seconds", str(args.batch_seconds),
+    ]
+    process = subprocess.Popen(command)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{base_url}/health", timeout=1).raise_for_status()
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("The fake LLM server did not start.")
+
+
+def time_stages(service, samples):
+    """Records the duration of every API call the service makes, keyed by pipeline stage."""
+    cached_call = service._cached_call
+
+    async def timed_call(stage, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await cached_call(stage, *args, **kwargs)
+        finally:
+            samples.setdefault(stage, []).append(time.perf_counter() - started)
+
+    service._cached_call = timed_call
+
+
+def make_service(concurrency, cassette=None):
+    service = AIService(response_cache=ResponseCache(":memory:"), angle_index=AngleIndex(":memory:"), cassette=cassette)
+    if concurrency:
+        service.provider_semaphores = {provider: PrioritySlots(service.scheduler, concurrency) for provider in service.provider_semaphores}
+    return service
+
+
+async def run_service_driver(queries, parameters, args, samples):
+    service = make_service(args.concurrency, args.cassette)
+    time_stages(service, samples)
+    on_event = (lambda event: None) if args.stream else None
+    started = time.perf_counter()
+
+    async def one_query(query):
+        result = await service.process_query_with_variants(query["id"], query["text"], query["client_info"], parameters, on_event=on_event)
+        samples.setdefault("query", []).append(time.perf_counter() - started)
+        return result
+
+    try:
+        results = await asyncio.gather(*(one_query(query) for query in queries))
+        return results, time.perf_counter() - started
+    finally:
+        await service.close()
+
+
+def run_runtime_driver(queries, parameters, args, samples):
+    class BenchRuntime(ServiceRuntime):
+        async def _create_service(self):
+            return make_service(args.concurrency, args.cassette)
+
+    runtime = BenchRuntime()
+    time_stages(runtime.ai_service, samples)
+    store = JobStore(":memory:")
+    job_runner = JobRunner(runtime, store)
+    client_info_map = {query["id"]: query["client_info"] for query in queries}
+    process_query = runtime.ai_service.process_query_with_variants
+    started = time.perf_counter()
+
+    async def timed_query(*args, **kwargs):
+        result = await process_query(*args, **kwargs)
+        samples.setdefault("query", []).append(time.perf_counter() - started)
+        return result
+
+    runtime.ai_service.process_query_with_variants = timed_query
+    try:
+        job_id = job_runner.submit(queries, client_info_map, parameters)
+        while True:
+            job = store.get_job(job_id)
+            if job["status"] in FINISHED_JOB_STATUSES:
+                break
+            time.sleep(0.05)
+        wall = time.perf_counter() - started
+        if job["status"] != "done":
+            raise RuntimeError(f"Benchmark job {job['status']}: {job['error']}")
+        return store.load_results(job_id), wall
+    finally:
+        job_runner.close()
+        runtime.close()
+        store.close()
+
+
+def run_workers_driver(queries, parameters, args, samples):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        store_path = os.path.join(cache_dir, "jobs.sqlite3")
+        store = JobStore(store_path)
+        command = [
+            sys.executable, "-m", "src.worker", "--workers", str(args.workers),
+            "--store", store_path, "--rate-limit-store", os.path.join(cache_dir, "rate_limits.sqlite3"),
+            "--poll-seconds", "0.1",
+        ]
+        # A fresh HARO_CACHE_DIR gives the workers an empty response cache and angle index.
+        env = {**os.environ, "HARO_CACHE_DIR": cache_dir}
+        if args.cassette is not None:
+            # Each worker process records to (or replays from) its own "{pid}" file.
+            env.update(HARO_CASSETTE=args.cassette.mode, HARO_CASSETTE_PATH=args.record or args.replay,
+                       HARO_CASSETTE_LATENCY_SCALE=str(args.replay_latency_scale))
+        workers = subprocess.Popen(command, cwd=os.path.dirname(BENCHMARKS_DIR), env=env)
+        try:
+            client_info_map = {query["id"]: query["client_info"] for query in queries}
+            job_id = store.create_job(queries, client_info_map, parameters)
+            while True:
+                job = store.get_job(job_id)
+                if job["status"] in FINISHED_JOB_STATUSES:
+                    break
+                if workers.poll() is not None:
+                    raise RuntimeError("The worker processes exited early.")
+                time.sleep(0.05)
+            if job["status"] != "done":
+                raise RuntimeError(f"Benchmark job {job['status']}: {job['error']}")
+            results = store.load_results(job_id)
+        finally:
+            workers.terminate()
+            workers.wait()
+            store.close()
+    for result in results:
+        for span in iter_result_spans(result):
+            samples.setdefault(span["stage"], []).append(span["duration_seconds"])
+    return results, job["finished_at"] - job["started_at"]
+
+
+def percentiles(values):
+    if not values:
+        return "-", "-"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"{p50:.2f}", f"{p95:.2f}"
+
+
+def run_one(driver, mode, count, args, base_url):
+    parameters = {"variant_execution_mode": mode, "general_instructions": ""}
+    queries = build_queries(count)
+    samples = {}
+    if base_url is not None:
+        httpx.post(f"{base_url}/stats/reset").raise_for_status()
+    replayed_before = dict(args.cassette.stats) if args.cassette is not None else None
+    if args.trace_memory:
+        tracemalloc.start()
+    if driver == "service":
+        results, wall = asyncio.run(run_service_driver(queries, parameters, args, samples))
+    elif driver == "workers":
+        results, wall = run_workers_driver(queries, parameters, args, samples)
+    else:
+        results, wall = run_runtime_driver(queries, parameters, args, samples)
+    peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    if base_url is not None:
+        server_stats = httpx.get(f"{base_url}/stats").json()
+    else:
+        # Replay: the cassette stands in for the server; a miss is a request whose prompt changed.
+        calls = {key: args.cassette.stats[key] - replayed_before[key] for key in ("replayed", "misses")}
+        server_stats = {"cassette": {"requests": calls["replayed"] + calls["misses"], "rate_limited": 0, "errors": calls["misses"]}}
+    requests = sum(counts["requests"] for counts in server_stats.values())
+    variants = [variant for result in results for variant in result["variants"]]
+    stage_totals = summarize_results(results)["stages"].values()
+    similarities = [variant["max_similarity"] for variant in variants if "max_similarity" in variant]
+    return {
+        "driver": driver,
+        "mode": mode,
+        "queries": count,
+        "wall_seconds": round(wall, 3),
+        "queries_per_second": round(count / wall, 3),
+        "api_requests_per_query": round(requests / count, 2),
+        "rate_limited": sum(counts["rate_limited"] for counts in server_stats.values()),
+        "server_errors": sum(counts["errors"] for counts in server_stats.values()),
+        "failed_variants": sum(1 for variant in variants if variant["status"] != "Success"),
+        "input_tokens_per_query": round(sum(stats["input_tokens"] for stats in stage_totals) / count),
+        "output_tokens_per_query": round(sum(stats["output_tokens"] for stats in stage_totals) / count),
+        "mean_max_similarity": round(float(np.mean(similarities)), 3) if similarities else None,
+        "peak_traced_mb": round(peak / 1e6, 1) if peak is not None else None,
+        "stages": {stage: dict(zip(("p50", "p95"), percentiles(values)), calls=len(values)) for stage, values in samples.items()},
+        "server": server_stats,
+    }
+
+
+def print_report(report):
+    print(f"\n{report['driver']} / {report['mode']} x {report['queries']} queries: {report['wall_seconds']:.2f}s wall, "
+          f"{report['queries_per_second']:.2f} queries/s, {report['api_requests_per_query']} API requests/query, "
+          f"{report['rate_limited']} x 429, {report['server_errors']} x 5xx, {report['failed_variants']} failed variants, "
+          f"peak traced memory {report['peak_traced_mb'] if report['peak_traced_mb'] is not None else '-'} MB")
+    print(f"  {report['input_tokens_per_query']} input / {report['output_tokens_per_query']} output tokens per query, "
+          f"mean max similarity {report['mean_max_similarity'] if report['mean_max_similarity'] is not None else '-'}")
+    print(f"  {'stage':<18}{'calls':>8}{'p50 s':>9}{'p95 s':>9}")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<18}{stats['calls']:>8}{stats['p50']:>9}{stats['p95']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 4, 50, 500])
+    parser.add_argument("--driver", nargs="+", choices=["service", "runtime", "workers"], default=["service", "runtime"])
+    parser.add_argument("--mode", nargs="+", choices=VARIANT_EXECUTION_MODES, default=["wave"])
+    parser.add_argument("--no-stream", dest="stream", action="store_false",
+                        help="Service driver only: request whole responses instead of streaming (the runtime driver follows STREAM_RESPONSES).")
+    parser.add_argument("--concurrency", type=int, default=None, help="Override CONCURRENT_AI_CALLS_PER_PROVIDER for the run.")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes for the workers driver.")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false")
+    parser.add_argument("--json", help="Also write the reports to this file.")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", help="Record every provider call to this cassette (may contain {pid}).")
+    cassette.add_argument("--replay", help="Replay the provider calls from this cassette instead of starting the fake server.")
+    parser.add_argument("--replay-latency-scale", type=float, default=0.0,
+                        help="Replayed responses wait this many times their recorded latency (0: full speed).")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server, base_url = None, None
+    if args.replay:
+        args.cassette = Cassette("replay", args.replay, args.replay_latency_scale)
+    else:
+        server, base_url = start_fake_server(args)
+        os.environ["ANTHROPIC_BASE_URL"] = base_url
+        os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+        args.cassette = Cassette("record", args.record) if args.record else None
+    reports = []
+    try:
+        for driver in args.driver:
+            for mode in args.mode:
+                for count in args.queries:
+                    report = run_one(driver, mode, count, args, base_url)
+                    print_report(report)
+                    reports.append(report)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if args.cassette is not None:
+            args.cassette.close()
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3)
+    print(f"\nProcess max RSS: {max_rss:.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
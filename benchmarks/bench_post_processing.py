@@ -0,0 +1,120 @@
+# benchmarks/bench_post_processing.py
+"""
+Parity check and micro-benchmark for src/post_processing.py against the legacy functions.
+
+    python benchmarks/bench_post_processing.py [--texts 2000] [--repeat 5] [--seed 7] [--date-rate 0.25]
+
+Every generated text is run through both implementations, function by function and as the
+full chain; any difference is printed and the script exits with status 1. Timings are the
+best of --repeat runs over the whole corpus.
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import legacy_post_processing as legacy
+from src import post_processing
+
+WORDS = (
+    "we our team found that clients shoppers brands the a small shift in how posts get tagged "
+    "changed everything one client struggling with returns saw conversions jump after testing "
+    "captions inventory checkout friction creators video trust reviews margin"
+).split()
+DATE_SNIPPETS = [
+    "2024", "in 1999", "March 3, 2021", "march 12019", "12/05/2020", "1-2-2019", "Q3 2023", "q12019",
+    "this year", "Next  year", "2023 12:30:45", ", 2018", "today", "Yesterday", "recent months",
+    "upcoming quarter", "past weeks", "this 2024 year", "Q1 3000",
+]
+LABELS = ["", "", "", "Variant 2: ", "  variant 10:   ", "VARIANT 3:"]
+
+
+def _sentence(rng, date_rate):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    if rng.random() < date_rate:
+        words.insert(rng.randrange(len(words)), rng.choice(DATE_SNIPPETS))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!", ""])
+
+
+def _paragraph(rng, sentences, date_rate):
+    return (" " if rng.random() < 0.9 else "  ").join(_sentence(rng, date_rate) for _ in range(sentences))
+
+
+def build_corpus(count, seed, date_rate=0.25):
+    """Mixes the shapes the models actually return: one blob, two or more paragraphs, odd spacing."""
+    rng = random.Random(seed)
+    corpus = ["", " ", "Variant 1:", "2024", "today"]
+    while len(corpus) < count:
+        shape = rng.random()
+        if shape < 0.3:
+            paragraphs = [_paragraph(rng, rng.randint(1, 14), date_rate)]
+        elif shape < 0.8:
+            paragraphs = [_paragraph(rng, rng.randint(1, 8), date_rate), _paragraph(rng, rng.randint(1, 8), date_rate)]
+        else:
+            paragraphs = [_paragraph(rng, rng.randint(1, 5), date_rate) for _ in range(rng.randint(3, 6))]
+        separator = rng.choice(["\n\n", "\n", "\r\n\r\n", "\n \n"])
+        corpus.append(rng.choice(LABELS) + separator.join(paragraphs))
+    return corpus
+
+
+def legacy_chain(text):
+    return legacy.format_two_paragraphs(legacy.remove_dates(legacy.remove_variant_label_prefix(text)))
+
+
+CHECKS = [
+    ("remove_variant_label_prefix", legacy.remove_variant_label_prefix, post_processing.remove_variant_label_prefix),
+    ("remove_dates", legacy.remove_dates, post_processing.remove_dates),
+    ("format_two_paragraphs", legacy.format_two_paragraphs, post_processing.format_two_paragraphs),
+    ("full chain", legacy_chain, post_processing.process_text),
+]
+
+
+def check_parity(corpus):
+    mismatches = 0
+    for name, old, new in CHECKS:
+        for text in corpus:
+            expected, actual = old(text), new(text)
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"MISMATCH in {name}:\n  input:    {text!r}\n  legacy:   {expected!r}\n  compiled: {actual!r}")
+    return mismatches
+
+
+def best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--date-rate", type=float, default=0.25, help="Share of sentences containing a date or timeframe.")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.texts, args.seed, args.date_rate)
+    mismatches = check_parity(corpus)
+    print(f"Parity: {len(corpus)} texts x {len(CHECKS)} checks, {mismatches} mismatches.")
+
+    print(f"\n{'function':<30}{'legacy us/text':>16}{'compiled us/text':>18}{'speedup':>10}")
+    rows = CHECKS + [("process_batch", lambda texts: [legacy_chain(t) for t in texts], post_processing.process_batch)]
+    for name, old, new in rows:
+        if name == "process_batch":
+            old_time = best_time(lambda: old(corpus), args.repeat)
+            new_time = best_time(lambda: new(corpus), args.repeat)
+        else:
+            old_time = best_time(lambda: [old(t) for t in corpus], args.repeat)
+            new_time = best_time(lambda: [new(t) for t in corpus], args.repeat)
+        per_text = 1e6 / len(corpus)
+        print(f"{name:<30}{old_time * per_text:>16.1f}{new_time * per_text:>18.1f}{old_time / new_time:>9.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
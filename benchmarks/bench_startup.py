@@ -0,0 +1,110 @@
+# benchmarks/bench_startup.py
+"""
+Start-up cost of the headless entry points, measured with `python -X importtime`.
+
+    python benchmarks/bench_startup.py [--modules src.worker src.batch_cli] [--repeat 5] [--budget-ms 1500]
+
+Each module is imported in a fresh interpreter --repeat times; the report shows the best
+cumulative import time of the module, the wall time of the whole process, and the slowest
+of its direct imports. The script exits with status 1 when a module is over
+--budget-ms or imports any of the UI-only packages (Streamlit, pandas, python-docx), so it
+can gate changes that would make spawning workers slow again.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_MODULES = ["src.config", "src.ai_integrations", "src.job_queue", "src.worker", "src.batch_cli"]
+UI_ONLY_PACKAGES = ("streamlit", "pandas", "docx")
+# Prints the UI-only packages left in sys.modules after importing the module under test.
+# A plain import statement: importtime does not time importlib.import_module().
+PROBE = "import sys; import {module}; print(','.join(p for p in {packages!r} if p in sys.modules))"
+
+
+def parse_importtime(stderr):
+    """(module, cumulative microseconds, nesting level) per line of -X importtime output, in output order."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            continue  # the header line
+        name = fields[2].rstrip()
+        level = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), cumulative, level))
+    return imports
+
+
+def direct_imports(imports, module):
+    """The modules `module` imported itself: importtime prints them, one level deeper, just before it."""
+    for index, (name, _, level) in enumerate(imports):
+        if name == module and level == 0:
+            children = []
+            for child, cumulative, child_level in reversed(imports[:index]):
+                if child_level == 0:
+                    break
+                if child_level == 1:
+                    children.append((cumulative, child))
+            return children
+    return []
+
+
+def measure(module):
+    """One fresh interpreter importing `module`: (cumulative import µs, wall seconds, imports, UI packages loaded)."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, packages=UI_ONLY_PACKAGES)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr.splitlines()[-1] if completed.stderr else ''}")
+    imports = parse_importtime(completed.stderr)
+    loaded = [package for package in completed.stdout.strip().split(",") if package]
+    cumulative = next((us for name, us, level in imports if name == module and level == 0), 0)
+    return cumulative, wall, imports, loaded
+
+
+def run(module, repeat):
+    best = None
+    for _ in range(repeat):
+        result = measure(module)
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Maximum cumulative import time per module.")
+    parser.add_argument("--top", type=int, default=5, help="Slowest direct imports listed per module.")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module in args.modules:
+        cumulative_us, wall, imports, loaded = run(module, max(1, args.repeat))
+        print(f"\n{module}: {cumulative_us / 1000:.1f} ms import, {wall * 1000:.0f} ms process wall, {len(imports)} modules")
+        for us, name in sorted(direct_imports(imports, module), reverse=True)[:args.top]:
+            print(f"  {us / 1000:>8.1f} ms  {name}")
+        if cumulative_us / 1000 > args.budget_ms:
+            failures.append(f"{module} takes {cumulative_us / 1000:.0f} ms to import (budget {args.budget_ms:.0f} ms)")
+        if loaded:
+            failures.append(f"{module} imports UI-only packages: {', '.join(loaded)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+# benchmarks/fake_llm_server.py
+"""
+A local stand-in for the Anthropic Messages and OpenAI Chat Completions APIs, for benchmarks.
+
+    python benchmarks/fake_llm_server.py [--port 8399] [--latency lognormal:0.4,0.5]
+                                         [--error-rate 0.0] [--rate-limit-rate 0.0]
+
+Point the SDKs at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8399 and
+OPENAI_BASE_URL=http://127.0.0.1:8399/v1. Both plain and streamed (SSE) responses are served,
+with usage blocks and rate-limit headers shaped like the real ones, so the service's stream
+readers, token accounting and rate limiter run their real code paths.
+
+Angle requests (OpenAI calls without a system message) get a hyphenated list of angles;
+every other request gets two paragraphs of words drawn from a synthetic vocabulary, seeded
+per request, so sibling variants do not look alike to the uniqueness engine. Structured
+requests (an Anthropic forced tool call or an OpenAI json_schema response format) get
+{"variants": [{"variant": N, "answer": ...}]} with one answer per "[Variant N]" tag in the
+prompt, and take as long as that many plain answers, since generation time grows with output.
+
+The Message Batches and Batch (files + batches) APIs are served too, for the bulk mode
+(src/bulk_batch.py): each request in a job is answered like the live endpoint would, and the
+job ends --batch-seconds after it was created, with --error-rate of its requests failed.
+
+GET /stats returns per-endpoint counts of requests (batch jobs count once), injected errors
+and 429s; POST /stats/reset clears them.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+_SYLLABLES = ["ka", "lo", "mi", "ren", "tas", "vo", "pel", "dri", "sun", "gar", "ne", "bru", "fi", "tol", "max", "qua"]
+_VARIANT_TAG = re.compile(r"\[Variant (\d+)\]")
+VOCABULARY = sorted({
+    "".join(random.Random(i).choice(_SYLLABLES) for _ in range(1 + i % 3))
+    for i in range(4000)
+})
+
+
+def parse_latency(spec):
+    """
+    `fixed:S`, `uniform:LOW,HIGH` or `lognormal:MEDIAN,SIGMA` (seconds) -> a function of a
+    random.Random returning one sampled latency.
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0.0, sigma)
+    raise ValueError(f"Unsupported latency spec '{spec}'.")
+
+
+class FakeLLMServer:
+    def __init__(self, latency="lognormal:0.4,0.5", error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, stream_chunks=20, num_angles=5, requests_per_minute=10000,
+                 tokens_per_minute=10000000, seed=0, batch_seconds=0.0, openai_batch_status="completed",
+                 failing_custom_ids=()):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.num_angles = num_angles
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.rng = random.Random(seed)
+        self.counter = itertools.count()
+        self.stats = {}
+        # Batch jobs end `batch_seconds` after they are created. OpenAI ones end with
+        # `openai_batch_status` (an "expired" or "failed" job still returns its output), and
+        # the requests in `failing_custom_ids` end in the error results, as do `error_rate` of the rest.
+        self.batch_seconds = batch_seconds
+        self.openai_batch_status = openai_batch_status
+        self.failing_custom_ids = set(failing_custom_ids)
+        self.files = {}
+        self.batches = {}
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/v1/messages", self.anthropic_messages)
+        app.router.add_post("/v1/chat/completions", self.openai_chat)
+        app.router.add_post("/v1/messages/batches", self.anthropic_create_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}", self.anthropic_get_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}/results", self.anthropic_batch_results)
+        app.router.add_post("/v1/files", self.openai_create_file)
+        app.router.add_get("/v1/files/{file_id}/content", self.openai_file_content)
+        app.router.add_post("/v1/batches", self.openai_create_batch)
+        app.router.add_get("/v1/batches/{batch_id}", self.openai_get_batch)
+        app.router.add_get("/stats", self.get_stats)
+        app.router.add_post("/stats/reset", self.reset_stats)
+        app.router.add_get("/health", lambda request: web.json_response({"ok": True}))
+        return app
+
+    def _count(self, endpoint, key):
+        counts = self.stats.setdefault(endpoint, {"requests": 0, "errors": 0, "rate_limited": 0, "streamed": 0})
+        counts[key] += 1
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def reset_stats(self, request):
+        self.stats = {}
+        return web.json_response({"ok": True})
+
+    def _injected_failure(self, endpoint, headers):
+        """A 429 or 5xx response when the dice say so, else None."""
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self._count(endpoint, "rate_limited")
+            return web.json_response(
+                {"type": "error", "error": {"type": "rate_limit_error", "message": "Fake rate limit."}},
+                status=429, headers={**headers, "retry-after": str(self.retry_after)}
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count(endpoint, "errors")
+            return web.json_response(
+                {"type": "error", "error": {"type": "overloaded_error", "message": "Fake server error."}},
+                status=529 if endpoint == "anthropic" else 500, headers=headers
+            )
+        return None
+
+    def _answer_text(self, body):
+        seed = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        rng = random.Random(f"{seed}-{next(self.counter)}")
+
+        def sentence():
+            return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(8, 14))).capitalize() + "."
+
+        return "\n\n".join(" ".join(sentence() for _ in range(4)) for _ in range(2))
+
+    def _variants_input(self, body):
+        """The answers of a structured request, one per "[Variant N]" tag in its last message."""
+        content = body.get("messages", [{}])[-1].get("content", "")
+        numbers = sorted({int(n) for n in _VARIANT_TAG.findall(content if isinstance(content, str) else json.dumps(content))})
+        return {"variants": [{"variant": n, "answer": self._answer_text({**body, "variant": n})} for n in numbers]}
+
+    def _angles_text(self, body):
+        rng = random.Random(next(self.counter))
+        return "\n".join(
+            f"- {' '.join(rng.choice(VOCABULARY) for _ in range(8)).capitalize()}."
+            for _ in range(self.num_angles)
+        )
+
+    def _anthropic_message(self, body):
+        """A Messages API reply to `body`, its text and how many answers it holds."""
+        tool_choice = body.get("tool_choice") or {}
+        if tool_choice.get("type") == "tool":
+            tool_input = self._variants_input(body)
+            answers = max(1, len(tool_input["variants"]))
+            text = json.dumps(tool_input)
+            content = [{"type": "tool_use", "id": f"toolu_fake{next(self.counter)}", "name": tool_choice["name"], "input": tool_input}]
+        else:
+            answers = 1
+            text = self._answer_text(body)
+            content = [{"type": "text", "text": text}]
+        usage = {"input_tokens": self._prompt_tokens(body), "output_tokens": len(text) // 4,
+                 "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        message = {"id": f"msg_fake{next(self.counter)}", "type": "message", "role": "assistant",
+                   "model": body.get("model", "fake"), "stop_reason": "end_turn", "stop_sequence": None,
+                   "content": content, "usage": usage}
+        return message, text, answers
+
+    def _openai_completion(self, body):
+        """A Chat Completions reply to `body`, its text and how many answers it holds."""
+        is_angles = not any(message.get("role") == "system" for message in body.get("messages", []))
+        answers = 1
+        if (body.get("response_format") or {}).get("type") == "json_schema":
+            structured = self._variants_input(body)
+            answers = max(1, len(structured["variants"]))
+            text = json.dumps(structured)
+        else:
+            text = self._angles_text(body) if is_angles else self._answer_text(body)
+        prompt_tokens = self._prompt_tokens(body)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                 "total_tokens": prompt_tokens + len(text) // 4, "prompt_tokens_details": {"cached_tokens": 0}}
+        completion = {"id": f"chatcmpl-fake{next(self.counter)}", "object": "chat.completion", "created": int(time.time()),
+                      "model": body.get("model", "fake"), "usage": usage, "choices": [
+                          {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}
+                      ]}
+        return completion, text, answers
+
+    @staticmethod
+    def _prompt_tokens(body):
+        # About 4 characters per token, like the service's own estimate.
+        return max(1, len(json.dumps(body.get("system", "")) + json.dumps(body.get("messages", []))) // 4)
+
+    def _chunks(self, text):
+        words = text.split(" ")
+        size = max(1, -(-len(words) // self.stream_chunks))
+        return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+    async def _stream(self, request, latency, events, headers):
+        """Sends `events` (already encoded SSE frames): ~30% of the latency before the first one, the rest spread over the others."""
+        response = web.StreamResponse(headers={**headers, "Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await asyncio.sleep(latency * 0.3)
+        gap = latency * 0.7 / max(1, len(events) - 1)
+        for i, frame in enumerate(events):
+            if i:
+                await asyncio.sleep(gap)
+            await response.write(frame.encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    def _anthropic_headers(self):
+        reset = datetime.fromtimestamp(time.time() + 60, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+        return {
+            "anthropic-ratelimit-requests-limit": str(self.requests_per_minute),
+            "anthropic-ratelimit-requests-remaining": str(self.requests_per_minute - 1),
+            "anthropic-ratelimit-requests-reset": reset,
+            "anthropic-ratelimit-tokens-limit": str(self.tokens_per_minute),
+            "anthropic-ratelimit-tokens-remaining": str(self.tokens_per_minute - 1),
+            "anthropic-ratelimit-tokens-reset": reset,
+        }
+
+    def _openai_headers(self):
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(self.requests_per_minute - 1),
+            "x-ratelimit-reset-requests": "6ms",
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-tokens": str(self.tokens_per_minute - 1),
+            "x-ratelimit-reset-tokens": "6ms",
+        }
+
+    async def anthropic_messages(self, request):
+        body = await request.json()
+        headers = self._anthropic_headers()
+        self._count("anthropic", "requests")
+        latency = self.sample_latency(self.rng)
+        failure = self._injected_failure("anthropic", headers)
+        if failure is not None:
+            await asyncio.sleep(latency * 0.1)
+            return failure
+
+        message, text, answers = self._anthropic_message(body)
+        latency *= answers
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return web.json_response(message, headers=headers)
+
+        self._count("anthropic", "streamed")
+        usage = message["usage"]
+        events = [("message_start", {"type": "message_start", "message": {**message, "content": [], "stop_reason": None,
+                                                                            "usage": {**usage, "output_tokens": 1}}}),
+                  ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})]
+        events += [("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}})
+                   for chunk in self._chunks(text)]
+        events += [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                   ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": usage["output_tokens"]}}),
+                   ("message_stop", {"type": "message_stop"})]
+        frames = [f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events]
+        return await self._stream(request, latency, frames, headers)
+
+    async def openai_chat(self, request):
+        body = await request.json()
+        headers = self._openai_headers()
+        self._count("openai", "requests")
+        latency = self.sample_latency(self.rng)
+        failure = self._injected_failure("openai", headers)
+        if failure is not None:
+            await asyncio.sleep(latency * 0.1)
+            return failure
+
+        reply, text, answers = self._openai_completion(body)
+        latency *= answers
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return web.json_response(reply, headers=headers)
+
+        self._count("openai", "streamed")
+        completion = {key: reply[key] for key in ("id", "created", "model")}
+        usage = reply["usage"]
+        chunks = [{**completion, "object": "chat.completion.chunk", "choices": [
+            {"index": 0, "finish_reason": None, "delta": {"content": chunk}}
+        ]} for chunk in self._chunks(text)]
+        chunks[-1]["choices"][0]["finish_reason"] = "stop"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunks.append({**completion, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        frames = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks] + ["data: [DONE]\n\n"]
+        return await self._stream(request, latency, frames, headers)
+
+    # --- Batch APIs: every request of a job is answered when it is created. ---
+
+    def _batch_request_fails(self, endpoint, custom_id):
+        if custom_id in self.failing_custom_ids or self.rng.random() < self.error_rate:
+            self._count(endpoint, "errors")
+            return True
+        return False
+
+    def _batch_ended(self, batch):
+        return time.time() >= batch["created"] + self.batch_seconds
+
+    async def anthropic_create_batch(self, request):
+        body = await request.json()
+        self._count("anthropic_batch", "requests")
+        batch_id = f"msgbatch_fake{next(self.counter)}"
+        results = []
+        for entry in body["requests"]:
+            if self._batch_request_fails("anthropic_batch", entry["custom_id"]):
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "Fake server error."}}}
+            else:
+                result = {"type": "succeeded", "message": self._anthropic_message(entry["params"])[0]}
+            results.append({"custom_id": entry["custom_id"], "result": result})
+        self.batches[batch_id] = {"created": time.time(), "results": results,
+                                  "results_url": f"{request.url.origin()}/v1/messages/batches/{batch_id}/results"}
+        return web.json_response(self._anthropic_batch(batch_id))
+
+    def _anthropic_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        ended = self._batch_ended(batch)
+        errored = sum(1 for entry in batch["results"] if entry["result"]["type"] == "errored")
+        timestamp = datetime.fromtimestamp(batch["created"], tz=timezone.utc).isoformat().replace("+00:00", "Z")
+        return {
+            "id": batch_id, "type": "message_batch", "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else len(batch["results"]), "succeeded": len(batch["results"]) - errored if ended else 0,
+                               "errored": errored if ended else 0, "canceled": 0, "expired": 0},
+            "created_at": timestamp, "expires_at": timestamp, "ended_at": timestamp if ended else None,
+            "archived_at": None, "cancel_initiated_at": None, "results_url": batch["results_url"] if ended else None,
+        }
+
+    async def anthropic_get_batch(self, request):
+        batch_id = request.match_info["batch_id"]
+        if batch_id not in self.batches:
+            return web.json_response({"type": "error", "error": {"type": "not_found_error", "message": "No such batch."}}, status=404)
+        return web.json_response(self._anthropic_batch(batch_id))
+
+    async def anthropic_batch_results(self, request):
+        batch = self.batches.get(request.match_info["batch_id"])
+        if batch is None or not self._batch_ended(batch):
+            return web.json_response({"type": "error", "error": {"type": "not_found_error", "message": "No results yet."}}, status=404)
+        lines = "".join(json.dumps(entry) + "\n" for entry in batch["results"])
+        return web.Response(body=lines.encode("utf-8"), content_type="application/binary")
+
+    def _openai_file(self, file_id):
+        content, filename, purpose = self.files[file_id]
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def _store_file(self, content, filename, purpose):
+        file_id = f"file-fake{next(self.counter)}"
+        self.files[file_id] = (content, filename, purpose)
+        return file_id
+
+    async def openai_create_file(self, request):
+        form = await request.post()
+        upload = form["file"]
+        file_id = self._store_file(upload.file.read(), upload.filename, form.get("purpose", "batch"))
+        return web.json_response(self._openai_file(file_id))
+
+    async def openai_file_content(self, request):
+        file_id = request.match_info["file_id"]
+        if file_id not in self.files:
+            return web.json_response({"error": {"message": "No such file.", "type": "invalid_request_error"}}, status=404)
+        return web.Response(body=self.files[file_id][0], content_type="application/octet-stream")
+
+    async def openai_create_batch(self, request):
+        body = await request.json()
+        self._count("openai_batch", "requests")
+        outputs, errors = [], []
+        for line in self.files[body["input_file_id"]][0].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            result = {"id": f"batch_req_fake{next(self.counter)}", "custom_id": entry["custom_id"]}
+            if not self._batch_request_fails("openai_batch", entry["custom_id"]):
+                outputs.append({**result, "error": None, "response": {
+                    "status_code": 200, "request_id": result["id"], "body": self._openai_completion(entry["body"])[0]
+                }})
+            elif self.openai_batch_status == "expired":
+                errors.append({**result, "response": None, "error": {
+                    "code": "batch_expired", "message": "This request could not be executed before the completion window expired."
+                }})
+            else:
+                errors.append({**result, "error": None, "response": {
+                    "status_code": 500, "request_id": result["id"],
+                    "body": {"error": {"message": "Fake server error.", "type": "server_error"}}
+                }})
+
+        def store(entries, suffix):
+            if not entries:
+                return None
+            content = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+            return self._store_file(content, f"{body['input_file_id']}_{suffix}.jsonl", "batch_output")
+
+        batch_id = f"batch_fake{next(self.counter)}"
+        self.batches[batch_id] = {
+            "created": time.time(), "input_file_id": body["input_file_id"], "endpoint": body["endpoint"],
+            "completion_window": body["completion_window"], "total": len(outputs) + len(errors), "failed": len(errors),
+            "output_file_id": store(outputs, "output"), "error_file_id": store(errors, "error"),
+        }
+        return web.json_response(self._openai_batch(batch_id))
+
+    def _openai_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        ended = self._batch_ended(batch)
+        return {
+            "id": batch_id, "object": "batch", "endpoint": batch["endpoint"], "errors": None,
+            "input_file_id": batch["input_file_id"], "completion_window": batch["completion_window"],
+            "status": self.openai_batch_status if ended else "in_progress",
+            "output_file_id": batch["output_file_id"] if ended else None,
+            "error_file_id": batch["error_file_id"] if ended else None,
+            "created_at": int(batch["created"]), "metadata": None,
+            "request_counts": {"total": batch["total"], "completed": batch["total"] - batch["failed"] if ended else 0,
+                               "failed": batch["failed"] if ended else 0},
+        }
+
+    async def openai_get_batch(self, request):
+        batch_id = request.match_info["batch_id"]
+        if batch_id not in self.batches:
+            return web.json_response({"error": {"message": "No such batch.", "type": "invalid_request_error"}}, status=404)
+        return web.json_response(self._openai_batch(batch_id))
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:0.4,0.5",
+                        help="Response time distribution: fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA (seconds).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 5xx error.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with a 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with each 429.")
+    parser.add_argument("--stream-chunks", type=int, default=20)
+    parser.add_argument("--batch-seconds", type=float, default=0.0, help="Time from creating a batch job to its end.")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8399)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = FakeLLMServer(
+        latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, stream_chunks=args.stream_chunks, seed=args.seed,
+        batch_seconds=args.batch_seconds
+    )
+    web.run_app(server.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/legacy_post_processing.py
+"""
+The post-processing functions as they were before src/post_processing.py, kept verbatim as
+the reference for the parity check in bench_post_processing.py. Do not "fix" or optimize.
+"""
+
+import re
+
+def format_two_paragraphs(text):
+    if not text: return ''
+    cleaned_text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
+    paragraphs = [p.strip() for p in cleaned_text.split('\n') if p.strip()]
+    if len(paragraphs) == 1:
+        original_text = paragraphs[0]
+        words = original_text.split(' ')
+        split_point_idx = -1
+        midpoint = len(words) // 2
+        for i in range(max(0, midpoint - 20), min(len(words), midpoint + 20)):
+            if words[i].endswith('.') or words[i].endswith('?') or words[i].endswith('!'):
+                split_point_idx = i + 1
+                break
+        if split_point_idx == -1:
+            split_point_idx = midpoint
+        first_para_words = words[:split_point_idx]
+        second_para_words = words[split_point_idx:]
+        paragraphs = [
+            ' '.join(first_para_words).strip(),
+            ' '.join(second_para_words).strip()
+        ]
+        paragraphs = [p for p in paragraphs if p]
+    if len(paragraphs) > 2:
+        paragraphs = [paragraphs[0], ' '.join(paragraphs[1:])]
+    elif len(paragraphs) < 2:
+        if len(paragraphs) == 1 and len(paragraphs[0].split(' ')) > 80:
+            words = paragraphs[0].split(' ')
+            midpoint = len(words) // 2
+            paragraphs = [' '.join(words[:midpoint]), ' '.join(words[midpoint:])]
+        else:
+            return text
+    p1_words = paragraphs[0].split(' ')
+    p2_words = paragraphs[1].split(' ')
+    while len(p1_words) > 60 and len(p2_words) < 60 and len(p1_words) > 50:
+        p2_words.insert(0, p1_words.pop())
+    while len(p2_words) > 60 and len(p1_words) < 60 and len(p2_words) > 50:
+        p1_words.append(p2_words.pop(0))
+    p1_words = p1_words[:65]
+    p2_words = p2_words[:65]
+    if len(p1_words) < 30 and len(p2_words) > 70:
+        words_to_move = min(30 - len(p1_words), len(p2_words) - 50)
+        p1_words.extend(p2_words[:words_to_move])
+        p2_words = p2_words[words_to_move:]
+    if len(p2_words) < 30 and len(p1_words) > 70:
+        words_to_move = min(30 - len(p2_words), len(p1_words) - 50)
+        p2_words.insert(0, *p1_words[len(p1_words) - words_to_move:])
+        p1_words = p1_words[:len(p1_words) - words_to_move]
+    return ' '.join(p1_words) + '\n\n' + ' '.join(p2_words)
+
+
+def remove_variant_label_prefix(text):
+    if not text: return ''
+    return re.sub(r'^\s*Variant\s*\d+:\s*', '', text, flags=re.IGNORECASE).strip()
+
+def remove_dates(text):
+    if not text: return ''
+    cleaned_text = text
+    cleaned_text = re.sub(r'\b(19|20)\d{2}\b', '', cleaned_text)
+    cleaned_text = re.sub(r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s*(19|20)\d{2}\b', '', cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r'\b\d{1,2}\/\d{1,2}\/(19|20)\d{2}\b', '', cleaned_text)
+    cleaned_text = re.sub(r'\b\d{1,2}-\d{1,2}-(19|20)\d{2}\b', '', cleaned_text)
+    cleaned_text = re.sub(r'\b(Q[1-4])\s*(\d{4})\b', '', cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r'\b(this|next|last|current)\s+year\b', '', cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r'\b(\d{4})\s*(\d{2}:\d{2}:\d{2})\b', '', cleaned_text)
+    cleaned_text = re.sub(r',\s*(19|20)\d{2}\b', '', cleaned_text)
+    cleaned_text = re.sub(r'\b(today|tomorrow|yesterday)\b', '', cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r'\b(recent|upcoming|past)\s+(month|year|quarter|week)s?\b', '', cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r'\s{2,}', ' ', cleaned_text).strip()
+    return cleaned_text
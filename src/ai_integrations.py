@@ -1,7 +1,10 @@
 # src/ai_integrations.py
 
 import asyncio
-import re
+import functools
+import importlib.util
+import json
+import time
 
 from openai import AsyncOpenAI
 # FIX IS HERE: Import AsyncAnthropic for async operations
@@ -10,37 +13,324 @@ import httpx
 from src.config import (
     ANTHROPIC_API_KEY, CLAUDE_MODEL,
     OPENAI_API_KEY, OPENAI_MODEL,
-    NUM_VARIANTS_PER_QUERY
+    NUM_VARIANTS_PER_QUERY, CONCURRENT_AI_CALLS_PER_PROVIDER, VARIANT_EXECUTION_MODE,
+    UNIQUENESS_MAX_REGENERATIONS,
+    HTTP2_ENABLED, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS, HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_TIMEOUT_SECONDS,
+    COMBINED_DRAFTING_MAX_TOKENS, COMBINED_POLISH_MAX_TOKENS,
+    ANGLE_INDEX_ENABLED, POLISH_POLICY, PROMPT_CACHE_MIN_TOKENS, HEDGING_ENABLED, HEDGE_STAGES, HEDGE_PERCENTILE, HEDGE_MIN_DELAY_SECONDS, HEDGE_MAX_EXTRA_FRACTION
 )
-from src.utils import get_logger, safe_async_call
-from src.prompt_manager import PromptManager
+from src.utils import get_logger, safe_async_call, is_retryable_error, error_status_code, retry_after_seconds
+from src.rate_control import build_rate_limiters, build_circuit_breakers, estimate_request_tokens
+from src.prompt_manager import PromptManager, count_tokens
+from src.response_cache import ResponseCache
+from src.angle_index import AngleIndex
+from src.cassette import cassette_from_settings
+from src.answer_validator import AnswerValidator
+from src.instrumentation import record_span
+from src.hedging import LatencyTracker, convert_request
+from src.scheduler import QueryScheduler, PrioritySlots
+from src.structured_output import VARIANTS_SCHEMA, parse_variant_answers
+from src.post_processing import process_text
+from src.uniqueness import avoid_phrases, too_similar_indices, max_sibling_similarity
 
 logger = get_logger(__name__)
 
+def build_http_client(cassette=None):
+    """
+    Tuned keep-alive connection pool for one provider. HTTP/2 is used when the optional
+    `h2` package is installed, multiplexing concurrent calls over a single TLS connection.
+    With a `cassette` (src/cassette.py), calls are recorded around that pool or replayed.
+    """
+    http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+    options = {}
+    if cassette is not None:
+        options["transport"] = cassette.transport(httpx.AsyncHTTPTransport(http2=http2, limits=limits))
+    return httpx.AsyncClient(
+        http2=http2, limits=limits,
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        **options
+    )
+
 class AIService:
-    def __init__(self):
+    def __init__(self, response_cache=None, rate_limiters=None, angle_index=None, cassette=None):
         # Perplexity client is removed as per last instruction.
         # FIX IS HERE: Use AsyncAnthropic for Claude client
-        self.claude_client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
-        self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        # SDK-level retries are disabled; safe_async_call and the rate limiter own retry behaviour.
+        # Record/replay of the provider calls: the given cassette, else the one HARO_CASSETTE configures.
+        self.cassette = cassette if cassette is not None else cassette_from_settings()
+        self.claude_client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0, http_client=build_http_client(self.cassette))
+        self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, http_client=build_http_client(self.cassette))
         self.prompt_manager = PromptManager()
+        # Priority order of the queries running on this service (deadline, client tier).
+        self.scheduler = QueryScheduler()
+        # Call slots per provider, shared by every query and variant running on this service.
+        self.provider_semaphores = {
+            provider: PrioritySlots(self.scheduler, limit)
+            for provider, limit in CONCURRENT_AI_CALLS_PER_PROVIDER.items()
+        }
+        # Pass build_rate_limiters(shared_path=...) to share the budget with other processes.
+        self.rate_limiters = rate_limiters if rate_limiters is not None else build_rate_limiters()
+        self.circuit_breakers = build_circuit_breakers(self.provider_semaphores)
+        # Under a cassette the on-disk stores would answer some calls from earlier runs, so a
+        # recording would miss them and a replay would skip them: both start empty instead.
+        store_path = {"path": ":memory:"} if self.cassette is not None else {}
+        self._owns_response_cache = response_cache is None
+        self.response_cache = response_cache if response_cache is not None else ResponseCache(**store_path)
+        self._owns_angle_index = angle_index is None and ANGLE_INDEX_ENABLED
+        self.angle_index = angle_index if angle_index is not None else (AngleIndex(**store_path) if ANGLE_INDEX_ENABLED else None)
+        self.answer_validator = AnswerValidator()
+        # Input tokens reported by the providers per stage, split by provider prompt-cache use.
+        self.input_token_usage = {}
+        # Recent call durations and hedge counts per hedged stage.
+        self.latency_trackers = {stage: LatencyTracker() for stage in HEDGE_STAGES}
+        self.hedge_counts = {stage: {"calls": 0, "hedges": 0, "hedge_wins": 0} for stage in HEDGE_STAGES}
+        # "combined" mode: variants requested, and the ones sent back to per-variant calls per stage.
+        self.combined_counts = {"variants": 0, "drafting_fallbacks": 0, "polish_fallbacks": 0}
+
+    def _limited(self, provider, func, read_stream=None, span=None, latency_tracker=None, sent=None):
+        """
+        Wraps a `with_raw_response` API coroutine function so each attempt fails fast on an
+        open circuit, waits for the provider's rate budget and a call slot (handed out by
+        query priority, see src/scheduler.py), and feeds the returned rate-limit headers back
+        into the limiter. Retry back-off sleeps happen outside the slot. With `read_stream`,
+        the streamed body is consumed inside the slot and its result returned. The half-open
+        circuit's trial call always resolves the breaker. Every attempt is counted on `span`,
+        if given. A successful attempt's duration, from getting its slot to its full response,
+        goes to `latency_tracker`, and the `sent` future is resolved when the first attempt
+        gets its slot.
+        """
+        slots = self.provider_semaphores[provider]
+        limiter = self.rate_limiters[provider]
+        breaker = self.circuit_breakers[provider]
+
+        async def call(*args, **kwargs):
+            if span is not None:
+                span.record_attempt()
+            trial = breaker.before_call()
+            try:
+                await limiter.acquire(estimate_request_tokens(kwargs))
+
+                async def attempt():
+                    if sent is not None and not sent.done():
+                        sent.set_result(None)
+                    started = time.perf_counter()
+                    try:
+                        raw_response = await func(*args, **kwargs)
+                        limiter.update_from_headers(raw_response.headers)
+                        response = raw_response.parse()
+                        if read_stream is not None:
+                            response = await read_stream(response)
+                    except Exception as e:
+                        status_code = error_status_code(e)
+                        if status_code == 429:
+                            breaker.record_success()
+                            limiter.pause(retry_after_seconds(e) or 1.0)
+                        elif is_retryable_error(e):
+                            breaker.record_failure()
+                        elif status_code is not None:
+                            breaker.record_success()
+                        raise
+                    if latency_tracker is not None:
+                        latency_tracker.record(time.perf_counter() - started)
+                    return response
+
+                response = await slots.run(attempt)
+                breaker.record_success()
+                return response
+            finally:
+                if trial:
+                    # A success or a classified error already moved the breaker on; a cancelled
+                    # trial or any other error must not leave it half-open.
+                    breaker.record_abandoned()
+        return call
+
+    async def _cached_call(self, stage, provider, func, extract_text, on_text=None, spans=None, **request):
+        """
+        Sends one API request and returns its text, answering identical requests for
+        cache-enabled stages from the response cache without touching the network.
+        When `on_text` is given the response is streamed and `on_text` receives the
+        accumulated text after every chunk. Calls of stages in HEDGE_STAGES may be hedged
+        (see _hedged_fetch). The call is recorded as a span, appended to `spans` when given.
+        """
+        with record_span(stage, provider, request.get("model"), spans) as span:
+            cache_key = None
+            if self.response_cache.is_enabled(stage):
+                cache_key = self.response_cache.make_key(provider, request)
+                cached_text = self.response_cache.get(stage, cache_key)
+                if cached_text is not None:
+                    span.cache_hit = True
+                    if on_text:
+                        on_text(cached_text)
+                    return cached_text
+
+            hedge_delay = self._hedge_delay(stage)
+            if hedge_delay is None:
+                text = await self._fetch(stage, provider, func, extract_text, on_text, span, request)
+            else:
+                text = await self._hedged_fetch(stage, provider, func, extract_text, on_text, span, spans, hedge_delay, request)
+            if cache_key is not None and text:
+                self.response_cache.put(stage, cache_key, text)
+            return text
+
+    async def _fetch(self, stage, provider, func, extract_text, on_text, span, request, sent=None):
+        """
+        One request through retries, rate limits and circuit breaker, streamed when `on_text` is
+        given. Attempts of a hedged stage feed its latency tracker, except for the hedges themselves.
+        """
+        latency_tracker = None if span.hedge else self.latency_trackers.get(stage)
+        limited = functools.partial(self._limited, provider, func, span=span, latency_tracker=latency_tracker, sent=sent)
+        try:
+            if on_text is None:
+                response = await safe_async_call(limited(), **request)
+                self._record_usage(stage, provider, getattr(response, "usage", None), span)
+                text = extract_text(response)
+            else:
+                read_stream = functools.partial(
+                    _STREAM_READERS[provider], on_text=on_text,
+                    on_usage=functools.partial(self._record_usage, stage, provider, span=span)
+                )
+                stream_options = {"stream_options": {"include_usage": True}} if provider == "openai" else {}
+                text = await safe_async_call(limited(read_stream), stream=True, **stream_options, **request)
+        except asyncio.CancelledError:
+            # The losing side of a hedge: the prompt was sent (and billed) but no usage came back.
+            if span.attempts and not span.input_tokens:
+                span.record_usage(0, estimate_request_tokens({**request, "max_tokens": 0}), 0)
+            raise
+        return text
 
-    async def generate_angles(self, query_text, client_info):
-        prompt = self.prompt_manager.get_angle_generation_prompt(query_text, client_info, NUM_VARIANTS_PER_QUERY)
+    def _hedge_delay(self, stage):
+        """Seconds after which a call of `stage` gets a hedge request, or None if it should not be hedged."""
+        if not HEDGING_ENABLED or stage not in self.latency_trackers:
+            return None
+        self.hedge_counts[stage]["calls"] += 1
+        threshold = self.latency_trackers[stage].percentile(HEDGE_PERCENTILE)
+        return None if threshold is None else max(threshold, HEDGE_MIN_DELAY_SECONDS)
+
+    def _hedge_endpoint(self, stage, provider, request):
+        """Provider, API function, text extractor and request of the hedge for a call of `stage`."""
+        target = HEDGE_STAGES[stage]
+        hedge_provider, model = target["provider"], target["model"]
+        if hedge_provider == provider and model == request.get("model"):
+            hedge_request = request
+        else:
+            hedge_request = convert_request(request, provider, hedge_provider, model)
+        if hedge_provider == "anthropic":
+            return hedge_provider, self.claude_client.messages.with_raw_response.create, _claude_text, hedge_request
+        return hedge_provider, self.openai_client.chat.completions.with_raw_response.create, _openai_text, hedge_request
+
+    async def _hedged_fetch(self, stage, provider, func, extract_text, on_text, span, spans, delay, request):
+        """
+        Sends the request and, if no answer arrived `delay` seconds after it got a call slot and
+        the stage's hedge budget allows, a second non-streamed request as configured in
+        HEDGE_STAGES (a duplicate or a fallback provider/model), recorded as its own span with
+        `hedge` set. The first successful answer wins and the other request is cancelled; if
+        the hedge wins, `on_text` receives its full text once.
+        """
+        counts = self.hedge_counts[stage]
+        tasks = []
+        winner = None
         try:
-            response = await safe_async_call(
-                self.openai_client.chat.completions.create,
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.7
+            sent = asyncio.get_running_loop().create_future()
+            primary = asyncio.ensure_future(self._fetch(stage, provider, func, extract_text, on_text, span, request, sent))
+            tasks.append(primary)
+            # Time queued for a slot or the rate budget is not latency: the delay starts once it is sent.
+            await asyncio.wait({primary, sent}, return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or counts["hedges"] >= HEDGE_MAX_EXTRA_FRACTION * counts["calls"]:
+                return await primary
+
+            counts["hedges"] += 1
+            hedge_provider, hedge_func, hedge_extract, hedge_request = self._hedge_endpoint(stage, provider, request)
+            logger.info(f"{stage} call still running after {delay:.1f}s; hedging on {hedge_provider} ({hedge_request.get('model')}).")
+
+            async def run_hedge():
+                with record_span(stage, hedge_provider, hedge_request.get("model"), spans) as hedge_span:
+                    hedge_span.hedge = True
+                    return await self._fetch(stage, hedge_provider, hedge_func, hedge_extract, None, hedge_span, hedge_request)
+
+            hedge = asyncio.ensure_future(run_hedge())
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.cancelled() and task.exception() is None), None)
+        finally:
+            # Also reached when the caller is cancelled during the hedge delay: no request outlives it.
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if winner is None:
+            return primary.result()  # Both failed: raise the original request's error.
+        text = winner.result()
+        if winner is hedge:
+            counts["hedge_wins"] += 1
+            if on_text:
+                on_text(text)
+        return text
+
+    def cache_stats(self):
+        return {stage: dict(counts) for stage, counts in self.response_cache.stats.items()}
+
+    def prompt_token_stats(self):
+        return self.prompt_manager.token_report()
+
+    def _record_usage(self, stage, provider, usage, span=None):
+        """
+        Adds one response's input token usage, split into provider-cached and uncached tokens,
+        and records it with the output tokens on `span`, if given.
+        """
+        if usage is None:
+            return
+        if provider == "anthropic":
+            # input_tokens excludes cache reads and writes; writes are billed as (premium) uncached input.
+            cached = getattr(usage, "cache_read_input_tokens", None) or 0
+            uncached = (usage.input_tokens or 0) + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+            output = getattr(usage, "output_tokens", None) or 0
+        else:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) or 0
+            uncached = (usage.prompt_tokens or 0) - cached
+            output = getattr(usage, "completion_tokens", None) or 0
+        if span is not None:
+            span.record_usage(cached, uncached, output)
+        stats = self.input_token_usage.setdefault(stage, {"calls": 0, "cached_input_tokens": 0, "uncached_input_tokens": 0})
+        stats["calls"] += 1
+        stats["cached_input_tokens"] += cached
+        stats["uncached_input_tokens"] += uncached
+
+    def input_token_stats(self):
+        return {stage: dict(counts) for stage, counts in self.input_token_usage.items()}
+
+    async def generate_angles(self, query_text, client_info, spans=None):
+        """
+        Angles for a query. Near-duplicates of past queries reuse their angles (never ones
+        already delivered to the same client) without an API call, recorded as a cache-hit
+        span; weaker matches are passed to the prompt as seeds.
+        """
+        client_name = client_info.get("name", "N/A")
+        seeds = []
+        if self.angle_index is not None:
+            reused, seeds = self.angle_index.suggest(query_text, client_name, NUM_VARIANTS_PER_QUERY)
+            if reused:
+                with record_span("angles", spans=spans) as span:
+                    span.cache_hit = True
+                self.angle_index.add(query_text, client_name, reused)
+                return reused
+        try:
+            response_content = await self._cached_call(
+                "angles", "openai", self.openai_client.chat.completions.with_raw_response.create, _openai_text,
+                spans=spans, **self.build_angles_request(query_text, client_info, seeds[::-1])
             )
-            response_content = response.choices[0].message.content
-            angles = [line.strip().replace('- ', '') for line in response_content.split('\n') if line.strip().startswith('- ')]
-            if not angles:
-                 angles = [line.strip() for line in response_content.split('\n') if line.strip()][:NUM_VARIANTS_PER_QUERY]
+            angles = parse_angles(response_content)
+            if self.angle_index is not None:
+                self.angle_index.add(query_text, client_name, angles)
 
             logger.info(f"Generated {len(angles)} angles for query: {query_text[:50]}...")
             return angles
@@ -50,196 +340,551 @@ class AIService:
 
     # Perplexity_research method is removed
 
-    async def claude_drafting(self, query, client_info, general_instructions, angle, variant_num, previous_variant_max_num, dynamic_uniqueness_constraints):
+    # --- Request builders, shared by the interactive calls and the bulk batch mode ---
+
+    def build_angles_request(self, query_text, client_info, seed_angles=None):
+        prompt = self.prompt_manager.get_angle_generation_prompt(query_text, client_info, NUM_VARIANTS_PER_QUERY, seed_angles)
+        return {
+            "model": OPENAI_MODEL,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": 300,
+            "temperature": 0.7
+        }
+
+    def build_drafting_request(self, query, client_info, general_instructions, angle, variant_num, previous_variant_max_num, dynamic_uniqueness_constraints):
+        prompts = self.prompt_manager.get_claude_prompts(
+            query, client_info, general_instructions, angle,
+            variant_num, previous_variant_max_num, dynamic_uniqueness_constraints
+        )
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": 750,
+            "temperature": (0.92 if variant_num >= 4 else 0.85),
+            "system": _claude_system(prompts["system_prompt"]),
+            "messages": prompts["user_messages"]
+        }
+
+    def build_polish_request(self, query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints, fix_instructions=None):
+        prompts = self.prompt_manager.get_openai_prompts(
+            query, client_info, general_instructions, drafted_answer,
+            variant_num, dynamic_uniqueness_constraints, fix_instructions
+        )
+        # Static system prompt first: OpenAI caches a repeated request prefix automatically once
+        # it reaches PROMPT_CACHE_MIN_TOKENS.
+        return {
+            "model": OPENAI_MODEL,
+            "messages": [
+                {"role": "system", "content": prompts["system_prompt"]},
+                {"role": "user", "content": prompts["user_messages"][0]["content"]}
+            ],
+            "temperature": 0.65,
+            "max_tokens": 900
+        }
+
+    def build_combined_drafting_request(self, query, client_info, general_instructions, angles):
+        prompts = self.prompt_manager.get_combined_claude_prompts(query, client_info, general_instructions, angles)
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": COMBINED_DRAFTING_MAX_TOKENS,
+            "temperature": 0.9,
+            "system": _claude_system(prompts["system_prompt"]),
+            "messages": prompts["user_messages"],
+            # A forced tool call makes Claude return the answers as input matching the schema.
+            "tools": [{
+                "name": "submit_answers",
+                "description": "Submit every variant's answer.",
+                "input_schema": VARIANTS_SCHEMA,
+            }],
+            "tool_choice": {"type": "tool", "name": "submit_answers"},
+        }
+
+    def build_combined_polish_request(self, query, client_info, general_instructions, drafts, fix_instructions=None):
+        prompts = self.prompt_manager.get_combined_openai_prompts(query, client_info, general_instructions, drafts, fix_instructions)
+        return {
+            "model": OPENAI_MODEL,
+            "messages": [
+                {"role": "system", "content": prompts["system_prompt"]},
+                {"role": "user", "content": prompts["user_messages"][0]["content"]}
+            ],
+            "temperature": 0.65,
+            "max_tokens": COMBINED_POLISH_MAX_TOKENS,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "polished_answers", "strict": True, "schema": VARIANTS_SCHEMA},
+            },
+        }
+
+    async def claude_drafting(self, query, client_info, general_instructions, angle, variant_num, previous_variant_max_num, dynamic_uniqueness_constraints, on_text=None, spans=None):
         """
         Stage 1 (now): Claude AI for Drafting, directly from query and angle.
+        With `on_text`, the draft is streamed and `on_text` gets the text written so far.
+        The call's span is appended to `spans`, if given.
         """
-        prompts = self.prompt_manager.get_claude_prompts(
+        request = self.build_drafting_request(
             query, client_info, general_instructions, angle,
             variant_num, previous_variant_max_num, dynamic_uniqueness_constraints
         )
         try:
-            # self.claude_client is now AsyncAnthropic, so its .messages.create() method is awaitable
-            response = await safe_async_call(
-                self.claude_client.messages.create, # This should now work correctly
-                model=CLAUDE_MODEL,
-                max_tokens=750,
-                temperature=(0.92 if variant_num >= 4 else 0.85),
-                system=prompts["system_prompt"],
-                messages=prompts["user_messages"]
+            # self.claude_client is AsyncAnthropic, so its .messages.with_raw_response.create() method is awaitable
+            draft = await self._cached_call(
+                "drafting", "anthropic", self.claude_client.messages.with_raw_response.create, _claude_text,
+                on_text=on_text, spans=spans, **request
             )
-            draft = response.content[0].text
-            logger.info("Claude drafting successful.")
             return draft
         except Exception as e:
             logger.error(f"Error during Claude drafting: {e}")
             raise
 
-    async def openai_polish(self, query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints):
-        prompts = self.prompt_manager.get_openai_prompts(
+    async def openai_polish(self, query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints, on_text=None, spans=None, fix_instructions=None):
+        request = self.build_polish_request(
             query, client_info, general_instructions, drafted_answer,
-            variant_num, dynamic_uniqueness_constraints
+            variant_num, dynamic_uniqueness_constraints, fix_instructions
         )
         try:
-            response = await safe_async_call(
-                self.openai_client.chat.completions.create,
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": prompts["system_prompt"]},
-                    {"role": "user", "content": prompts["user_messages"][0]["content"]}
-                ],
-                temperature=0.65,
-                max_tokens=900
+            polished_answer = await self._cached_call(
+                "polish", "openai", self.openai_client.chat.completions.with_raw_response.create, _openai_text,
+                on_text=on_text, spans=spans, **request
             )
-            polished_answer = response.choices[0].message.content
-            logger.info("OpenAI polishing successful.")
             return polished_answer
         except Exception as e:
             logger.error(f"Error during OpenAI polishing: {e}")
             raise
 
-    async def process_single_variant(self, query_id, query_text, client_info, parameters, angle, existing_variants_for_uniqueness, variant_num, previous_variant_max_num):
+    def review_draft(self, draft, negative_phrases):
+        """The local validator's review of a draft (see AnswerValidator.review), or None when POLISH_POLICY polishes every draft."""
+        if POLISH_POLICY != "validate":
+            return None
+        review = self.answer_validator.review(draft, negative_phrases)
+        if review["failed_rules"]:
+            logger.info(f"Draft failed {', '.join(review['failed_rules'])}; {review['action']}.")
+        return review
+
+    async def polish_draft(self, query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints, on_text=None, spans=None):
+        """
+        The final answer for a draft: the draft itself or its local repair when the validator
+        allows it (no API call; the validation is recorded as a span), else the OpenAI polish
+        told about the failed rules. Returns the answer and the review (None without validation).
+        """
+        spans = [] if spans is None else spans
+        with record_span("validation", spans=spans):
+            review = self.review_draft(drafted_answer, dynamic_uniqueness_constraints)
+        if review is not None and review["action"] != "polish":
+            if on_text:
+                on_text(review["text"])
+            return review["text"], review
+        final_answer = await self.openai_polish(
+            query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints,
+            on_text=on_text, spans=spans, fix_instructions=review["instructions"] if review else None
+        )
+        return final_answer, review
+
+    def make_variant_result(self, query_id, angle, draft, final_answer, negative_constraints, post_processed=False, spans=None, review=None):
+        spans = [] if spans is None else spans
+        # Post-processing (already done by callers that use process_batch)
+        if post_processed:
+            processed_answer = final_answer
+        else:
+            with record_span("post_processing", spans=spans):
+                processed_answer = process_text(final_answer)
+
+        return {
+            "query_id": query_id,
+            "angle": angle,
+            "research_output": "N/A (Perplexity removed)",
+            "draft": draft,
+            "final_answer": processed_answer,
+            "status": "Success",
+            "negative_constraints_applied": negative_constraints,
+            "spans": spans,
+            "validation": None if review is None else {
+                "action": review["action"], "failed_rules": review["failed_rules"], "reading_ease": review["reading_ease"]
+            }
+        }
+
+    def make_failed_variant(self, query_id, angle, error, spans=None):
+        logger.error(f"Failed to process variant for query {query_id}, angle '{angle[:50]}...': {error}")
+        return {
+            "query_id": query_id,
+            "angle": angle,
+            "research_output": "Error",
+            "draft": "Error",
+            "final_answer": f"Error processing variant: {error}",
+            "status": "Failed",
+            "negative_constraints_applied": [],
+            "spans": [] if spans is None else spans
+        }
+
+    async def process_single_variant(self, query_id, query_text, client_info, parameters, angle, existing_variants_for_uniqueness, variant_num, previous_variant_max_num, on_event=None):
+        spans = []
         try:
             # Stage 1 (now): Claude Drafting
             draft = await self.claude_drafting(
                 query_text, client_info, parameters.get("general_instructions", ""),
                 angle,
-                variant_num, previous_variant_max_num, existing_variants_for_uniqueness
+                variant_num, previous_variant_max_num, existing_variants_for_uniqueness,
+                on_text=_stage_listener(on_event, query_id, variant_num, "draft"), spans=spans
             )
 
-            # Stage 2 (now): OpenAI Polish
-            final_answer = await self.openai_polish(
+            # Stage 2 (now): OpenAI Polish, unless the draft already passes the local checks
+            final_answer, review = await self.polish_draft(
                 query_text, client_info, parameters.get("general_instructions", ""),
-                draft, variant_num, existing_variants_for_uniqueness
+                draft, variant_num, existing_variants_for_uniqueness,
+                on_text=_stage_listener(on_event, query_id, variant_num, "polish"), spans=spans
             )
-            
-            # Post-processing
-            processed_answer = remove_variant_label_prefix(final_answer)
-            processed_answer = remove_dates(processed_answer)
-            processed_answer = format_two_paragraphs(processed_answer)
-
-            return {
-                "query_id": query_id,
-                "angle": angle,
-                "research_output": "N/A (Perplexity removed)",
-                "draft": draft,
-                "final_answer": processed_answer,
-                "status": "Success",
-                "negative_constraints_applied": existing_variants_for_uniqueness
-            }
+
+            result = self.make_variant_result(query_id, angle, draft, final_answer, existing_variants_for_uniqueness, spans=spans, review=review)
         except Exception as e:
-            logger.error(f"Failed to process variant for query {query_id}, angle '{angle[:50]}...': {e}")
-            return {
-                "query_id": query_id,
-                "angle": angle,
-                "research_output": "Error",
-                "draft": "Error",
-                "final_answer": f"Error processing variant: {e}",
-                "status": "Failed",
-                "negative_constraints_applied": []
-            }
+            result = self.make_failed_variant(query_id, angle, e, spans)
+        _emit_variant(on_event, variant_num, result)
+        return result
 
-    async def process_query_with_variants(self, query_id, query_text, client_info, parameters):
+    async def _run_variants_sequential(self, query_id, query_text, client_info, parameters, angles, on_event=None):
+        """Each variant waits for the previous one and avoids the distinctive phrases of all earlier final answers."""
         all_variants_for_query = []
         generated_final_answers_text = []
 
-        angles = await self.generate_angles(query_text, client_info)
-        if len(angles) < NUM_VARIANTS_PER_QUERY:
-            logger.warning(f"Only {len(angles)} angles generated for query {query_id}. Expected {NUM_VARIANTS_PER_QUERY}.")
-            for i in range(NUM_VARIANTS_PER_QUERY - len(angles)):
-                angles.append(f"Additional unique perspective {len(angles) + i + 1}")
-
-        for i, angle in enumerate(angles[:NUM_VARIANTS_PER_QUERY]):
+        for i, angle in enumerate(angles):
             variant_num = i + 1
             previous_variant_max_num = i
 
             variant_result = await self.process_single_variant(
                 query_id, query_text, client_info, parameters, angle,
-                generated_final_answers_text,
-                variant_num, previous_variant_max_num
+                avoid_phrases(generated_final_answers_text),
+                variant_num, previous_variant_max_num, on_event=on_event
             )
             all_variants_for_query.append(variant_result)
             if variant_result["status"] == "Success":
                 generated_final_answers_text.append(variant_result["final_answer"])
-            logger.info(f"Variant {variant_num}/{NUM_VARIANTS_PER_QUERY} for query {query_id} processed.")
+            logger.info(f"Variant {variant_num}/{len(angles)} for query {query_id} processed.")
+
+        return all_variants_for_query
+
+    async def _run_variants_parallel(self, query_id, query_text, client_info, parameters, angles, on_event=None):
+        """All variants run at once; each one's negative constraints are its sibling angles."""
+        tasks = [
+            self.process_single_variant(
+                query_id, query_text, client_info, parameters, angle,
+                _siblings(angles, i), i + 1, len(angles), on_event=on_event
+            )
+            for i, angle in enumerate(angles)
+        ]
+        return list(await asyncio.gather(*tasks))
+
+    async def _run_variants_wave(self, query_id, query_text, client_info, parameters, angles, on_event=None):
+        """
+        Drafts every variant at once against its sibling angles, then polishes every draft at
+        once with the sibling drafts' distinctive phrases as negative constraints, so only the
+        polish sees the others.
+        """
+        general_instructions = parameters.get("general_instructions", "")
+        variant_spans = [[] for _ in angles]
+
+        drafts = await asyncio.gather(*[
+            self.claude_drafting(
+                query_text, client_info, general_instructions, angle,
+                i + 1, len(angles), _siblings(angles, i),
+                on_text=_stage_listener(on_event, query_id, i + 1, "draft"), spans=variant_spans[i]
+            )
+            for i, angle in enumerate(angles)
+        ], return_exceptions=True)
+
+        async def polish(i, angle, draft):
+            if isinstance(draft, Exception):
+                result = self.make_failed_variant(query_id, angle, draft, variant_spans[i])
+                _emit_variant(on_event, i + 1, result)
+                return result
+            sibling_phrases = avoid_phrases([d for j, d in enumerate(drafts) if j != i and not isinstance(d, Exception)])
+            try:
+                final_answer, review = await self.polish_draft(
+                    query_text, client_info, general_instructions,
+                    draft, i + 1, sibling_phrases,
+                    on_text=_stage_listener(on_event, query_id, i + 1, "polish"), spans=variant_spans[i]
+                )
+                result = self.make_variant_result(query_id, angle, draft, final_answer, sibling_phrases, spans=variant_spans[i], review=review)
+            except Exception as e:
+                result = self.make_failed_variant(query_id, angle, e, variant_spans[i])
+            _emit_variant(on_event, i + 1, result)
+            return result
+
+        return list(await asyncio.gather(*[
+            polish(i, angle, draft) for i, (angle, draft) in enumerate(zip(angles, drafts))
+        ]))
+
+    async def _run_variants_combined(self, query_id, query_text, client_info, parameters, angles, on_event=None, spans=None):
+        """
+        One Claude call drafts every variant and one OpenAI call polishes every draft the local
+        validator does not accept, both as JSON (see src/structured_output.py); each call sees
+        all siblings. A variant missing or invalid in the drafting JSON runs the per-variant
+        path (process_single_variant); one missing from the polish JSON gets its own polish.
+        The two combined calls' spans go to `spans`, the query-level spans.
+        """
+        general_instructions = parameters.get("general_instructions", "")
+        variant_spans = [[] for _ in angles]
+        self.combined_counts["variants"] += len(angles)
+
+        try:
+            response_text = await self._cached_call(
+                "combined_drafting", "anthropic", self.claude_client.messages.with_raw_response.create, _claude_tool_json,
+                spans=spans, **self.build_combined_drafting_request(query_text, client_info, general_instructions, angles)
+            )
+            drafts = parse_variant_answers(response_text, len(angles))
+        except Exception as e:
+            logger.error(f"Combined drafting for query {query_id} failed; drafting each variant separately: {e}")
+            drafts = [None] * len(angles)
+        for i, draft in enumerate(drafts):
+            listener = _stage_listener(on_event, query_id, i + 1, "draft")
+            if draft is not None and listener:
+                listener(draft)
+
+        drafted = [i for i, draft in enumerate(drafts) if draft is not None]
+        sibling_phrases = {i: avoid_phrases([drafts[j] for j in drafted if j != i]) for i in drafted}
+        reviews = {}
+        for i in drafted:
+            with record_span("validation", spans=variant_spans[i]):
+                reviews[i] = self.review_draft(drafts[i], sibling_phrases[i])
+        to_polish = [i for i in drafted if reviews[i] is None or reviews[i]["action"] == "polish"]
+
+        polished = {}
+        if to_polish:
+            try:
+                response_text = await self._cached_call(
+                    "combined_polish", "openai", self.openai_client.chat.completions.with_raw_response.create, _openai_text,
+                    spans=spans, **self.build_combined_polish_request(
+                        query_text, client_info, general_instructions, [(i + 1, drafts[i]) for i in to_polish],
+                        {i + 1: reviews[i]["instructions"] for i in to_polish if reviews[i]}
+                    )
+                )
+                answers = parse_variant_answers(response_text, len(angles))
+                polished = {i: answers[i] for i in to_polish if answers[i] is not None}
+            except Exception as e:
+                logger.error(f"Combined polish for query {query_id} failed; polishing each draft separately: {e}")
+
+        async def finish(i, angle):
+            if drafts[i] is None:
+                self.combined_counts["drafting_fallbacks"] += 1
+                return await self.process_single_variant(
+                    query_id, query_text, client_info, parameters, angle,
+                    _siblings(angles, i), i + 1, len(angles), on_event=on_event
+                )
+            review = reviews[i]
+            on_polish = _stage_listener(on_event, query_id, i + 1, "polish")
+            try:
+                if i not in to_polish:
+                    final_answer = review["text"]
+                elif i in polished:
+                    final_answer = polished[i]
+                else:
+                    self.combined_counts["polish_fallbacks"] += 1
+                    final_answer = await self.openai_polish(
+                        query_text, client_info, general_instructions, drafts[i], i + 1, sibling_phrases[i],
+                        on_text=on_polish, spans=variant_spans[i], fix_instructions=review["instructions"] if review else None
+                    )
+                if on_polish:
+                    on_polish(final_answer)
+                result = self.make_variant_result(query_id, angle, drafts[i], final_answer, sibling_phrases[i], spans=variant_spans[i], review=review)
+            except Exception as e:
+                result = self.make_failed_variant(query_id, angle, e, variant_spans[i])
+            _emit_variant(on_event, i + 1, result)
+            return result
+
+        return list(await asyncio.gather(*[finish(i, angle) for i, angle in enumerate(angles)]))
+
+    async def _regenerate_similar_variants(self, query_id, query_text, client_info, parameters, angles, variants, on_event=None):
+        """
+        Measures pairwise overlap of the successful variants locally and regenerates only the
+        ones above UNIQUENESS_SIMILARITY_THRESHOLD, each told to avoid its siblings' phrases.
+        Every successful variant is annotated with its highest similarity to a sibling, and
+        keeps the spans of its discarded attempts so the run's cost stays complete.
+        """
+        for _ in range(UNIQUENESS_MAX_REGENERATIONS):
+            successful = [i for i, v in enumerate(variants) if v["status"] == "Success"]
+            offenders = [successful[k] for k in too_similar_indices([variants[i]["final_answer"] for i in successful])]
+            if not offenders:
+                break
+            logger.info(f"Regenerating variants {[i + 1 for i in offenders]} of query {query_id}: too similar to a sibling.")
+
+            async def regenerate(i):
+                siblings = [variants[j]["final_answer"] for j in successful if j != i]
+                return await self.process_single_variant(
+                    query_id, query_text, client_info, parameters, angles[i],
+                    avoid_phrases(siblings), i + 1, len(angles), on_event=on_event
+                )
+
+            for i, result in zip(offenders, await asyncio.gather(*[regenerate(i) for i in offenders])):
+                if result["status"] == "Success":
+                    result["spans"] = variants[i]["spans"] + result["spans"]
+                    variants[i] = result
+                else:
+                    variants[i]["spans"] = variants[i]["spans"] + result["spans"]
+
+        successful = [i for i, v in enumerate(variants) if v["status"] == "Success"]
+        similarities = max_sibling_similarity([variants[i]["final_answer"] for i in successful])
+        for i, similarity in zip(successful, similarities):
+            variants[i]["max_similarity"] = similarity
+        return variants
+
+    async def process_query_with_variants(self, query_id, query_text, client_info, parameters, on_event=None):
+        """
+        Generates all variants for one query. `on_event`, if given, is called with dicts of
+        type "angles", "draft"/"polish" (streamed text so far) and "variant" (finished result).
+        The spans of the angles call (and of the "combined" mode calls) are kept on the query
+        result; every variant carries its own.
+        """
+        query_spans = []
+        angles = complete_angles(query_id, await self.generate_angles(query_text, client_info, query_spans))
+        if on_event:
+            on_event({"type": "angles", "query_id": query_id, "angles": list(angles)})
+
+        mode = parameters.get("variant_execution_mode", VARIANT_EXECUTION_MODE)
+        if mode == "sequential":
+            all_variants_for_query = await self._run_variants_sequential(query_id, query_text, client_info, parameters, angles, on_event)
+        elif mode == "parallel":
+            all_variants_for_query = await self._run_variants_parallel(query_id, query_text, client_info, parameters, angles, on_event)
+        elif mode == "combined":
+            all_variants_for_query = await self._run_variants_combined(query_id, query_text, client_info, parameters, angles, on_event, query_spans)
+        else:
+            all_variants_for_query = await self._run_variants_wave(query_id, query_text, client_info, parameters, angles, on_event)
+        all_variants_for_query = await self._regenerate_similar_variants(
+            query_id, query_text, client_info, parameters, angles, all_variants_for_query, on_event
+        )
+        logger.info(f"All {len(all_variants_for_query)} variants for query {query_id} processed ({mode}).")
 
         return {
             "query_id": query_id,
             "query_text": query_text,
             "client_info": client_info,
-            "variants": all_variants_for_query
+            "variants": all_variants_for_query,
+            "spans": query_spans
         }
 
-    async def close(self):
-        pass # No explicit async clients to close after removing Perplexity and using AsyncAnthropic/AsyncOpenAI
-
-# --- POST-PROCESSING FUNCTIONS (from Apps Script - unchanged) ---
-def format_two_paragraphs(text):
-    if not text: return ''
-    cleaned_text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
-    paragraphs = [p.strip() for p in cleaned_text.split('\n') if p.strip()]
-    if len(paragraphs) == 1:
-        original_text = paragraphs[0]
-        words = original_text.split(' ')
-        split_point_idx = -1
-        midpoint = len(words) // 2
-        for i in range(max(0, midpoint - 20), min(len(words), midpoint + 20)):
-            if words[i].endswith('.') or words[i].endswith('?') or words[i].endswith('!'):
-                split_point_idx = i + 1
-                break
-        if split_point_idx == -1:
-            split_point_idx = midpoint
-        first_para_words = words[:split_point_idx]
-        second_para_words = words[split_point_idx:]
-        paragraphs = [
-            ' '.join(first_para_words).strip(),
-            ' '.join(second_para_words).strip()
+    async def retry_variants(self, query_result, variant_indices, parameters, on_event=None):
+        """
+        Re-runs only the variants at `variant_indices` of a finished query result (failed or
+        rejected ones) and returns the result with them replaced. The retried variants avoid
+        the distinctive phrases of the successful variants that are kept, so the uniqueness
+        context is rebuilt without regenerating them.
+        """
+        variants = list(query_result["variants"])
+        indices = sorted(i for i in set(variant_indices) if 0 <= i < len(variants))
+        kept_answers = [
+            variant["final_answer"] for i, variant in enumerate(variants)
+            if i not in indices and variant["status"] == "Success"
         ]
-        paragraphs = [p for p in paragraphs if p]
-    if len(paragraphs) > 2:
-        paragraphs = [paragraphs[0], ' '.join(paragraphs[1:])]
-    elif len(paragraphs) < 2:
-        if len(paragraphs) == 1 and len(paragraphs[0].split(' ')) > 80:
-            words = paragraphs[0].split(' ')
-            midpoint = len(words) // 2
-            paragraphs = [' '.join(words[:midpoint]), ' '.join(words[midpoint:])]
-        else:
-            return text
-    p1_words = paragraphs[0].split(' ')
-    p2_words = paragraphs[1].split(' ')
-    while len(p1_words) > 60 and len(p2_words) < 60 and len(p1_words) > 50:
-        p2_words.insert(0, p1_words.pop())
-    while len(p2_words) > 60 and len(p1_words) < 60 and len(p2_words) > 50:
-        p1_words.append(p2_words.pop(0))
-    p1_words = p1_words[:65]
-    p2_words = p2_words[:65]
-    if len(p1_words) < 30 and len(p2_words) > 70:
-        words_to_move = min(30 - len(p1_words), len(p2_words) - 50)
-        p1_words.extend(p2_words[:words_to_move])
-        p2_words = p2_words[words_to_move:]
-    if len(p2_words) < 30 and len(p1_words) > 70:
-        words_to_move = min(30 - len(p2_words), len(p1_words) - 50)
-        p2_words.insert(0, *p1_words[len(p1_words) - words_to_move:])
-        p1_words = p1_words[:len(p1_words) - words_to_move]
-    return ' '.join(p1_words) + '\n\n' + ' '.join(p2_words)
-
-
-def remove_variant_label_prefix(text):
-    if not text: return ''
-    return re.sub(r'^\s*Variant\s*\d+:\s*', '', text, flags=re.IGNORECASE).strip()
-
-def remove_dates(text):
-    if not text: return ''
-    cleaned_text = text
-    cleaned_text = re.sub(r'\b(19|20)\d{2}\b', '', cleaned_text)
-    cleaned_text = re.sub(r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s*(19|20)\d{2}\b', '', cleaned_text, flags=re.IGNORECASE)
-    cleaned_text = re.sub(r'\b\d{1,2}\/\d{1,2}\/(19|20)\d{2}\b', '', cleaned_text)
-    cleaned_text = re.sub(r'\b\d{1,2}-\d{1,2}-(19|20)\d{2}\b', '', cleaned_text)
-    cleaned_text = re.sub(r'\b(Q[1-4])\s*(\d{4})\b', '', cleaned_text, flags=re.IGNORECASE)
-    cleaned_text = re.sub(r'\b(this|next|last|current)\s+year\b', '', cleaned_text, flags=re.IGNORECASE)
-    cleaned_text = re.sub(r'\b(\d{4})\s*(\d{2}:\d{2}:\d{2})\b', '', cleaned_text)
-    cleaned_text = re.sub(r',\s*(19|20)\d{2}\b', '', cleaned_text)
-    cleaned_text = re.sub(r'\b(today|tomorrow|yesterday)\b', '', cleaned_text, flags=re.IGNORECASE)
-    cleaned_text = re.sub(r'\b(recent|upcoming|past)\s+(month|year|quarter|week)s?\b', '', cleaned_text, flags=re.IGNORECASE)
-    cleaned_text = re.sub(r'\s{2,}', ' ', cleaned_text).strip()
-    return cleaned_text
\ No newline at end of file
+        constraints = avoid_phrases(kept_answers)
+        retried = await asyncio.gather(*[
+            self.process_single_variant(
+                query_result["query_id"], query_result["query_text"], query_result["client_info"], parameters,
+                variants[i]["angle"], constraints, i + 1, len(variants), on_event=on_event
+            )
+            for i in indices
+        ])
+        for i, variant in zip(indices, retried):
+            variants[i] = variant
+        logger.info(
+            f"Retried {len(indices)} variants of query {query_result['query_id']}: "
+            f"{sum(1 for v in retried if v['status'] == 'Success')} succeeded."
+        )
+        return {**query_result, "variants": variants}
+
+    async def close(self):
+        await self.claude_client.close()
+        await self.openai_client.close()
+        for limiter in self.rate_limiters.values():
+            limiter.close()
+        if self._owns_response_cache:
+            self.response_cache.close()
+        if self._owns_angle_index:
+            self.angle_index.close()
+
+def parse_angles(response_content):
+    angles = [line.strip().replace('- ', '') for line in response_content.split('\n') if line.strip().startswith('- ')]
+    if not angles:
+         angles = [line.strip() for line in response_content.split('\n') if line.strip()][:NUM_VARIANTS_PER_QUERY]
+    return angles
+
+def variants_to_retry(query_result):
+    """Indices of a query result's variants that failed or were rejected by the user."""
+    return [
+        i for i, variant in enumerate(query_result.get("variants", []))
+        if variant.get("status") != "Success" or variant.get("rejected")
+    ]
+
+def complete_angles(query_id, angles):
+    """Pads a short angle list with generic perspectives and trims it to NUM_VARIANTS_PER_QUERY."""
+    angles = list(angles)
+    if len(angles) < NUM_VARIANTS_PER_QUERY:
+        logger.warning(f"Only {len(angles)} angles generated for query {query_id}. Expected {NUM_VARIANTS_PER_QUERY}.")
+        for i in range(NUM_VARIANTS_PER_QUERY - len(angles)):
+            angles.append(f"Additional unique perspective {len(angles) + i + 1}")
+    return angles[:NUM_VARIANTS_PER_QUERY]
+
+@functools.lru_cache(maxsize=8)
+def _is_cacheable_prefix(system_prompt):
+    return count_tokens(system_prompt) >= PROMPT_CACHE_MIN_TOKENS
+
+def _claude_system(system_prompt):
+    """
+    The Claude system block. It only carries a cache breakpoint once it is long enough for
+    Anthropic to cache (PROMPT_CACHE_MIN_TOKENS); a shorter one would never be cached.
+    """
+    block = {"type": "text", "text": system_prompt}
+    if _is_cacheable_prefix(system_prompt):
+        block["cache_control"] = {"type": "ephemeral"}
+    return [block]
+
+def _openai_text(response):
+    return response.choices[0].message.content
+
+def _claude_text(response):
+    return response.content[0].text
+
+def _claude_tool_json(response):
+    """The input of the forced tool call as JSON text (the text block, if Claude answered with one instead)."""
+    for block in response.content:
+        if block.type == "tool_use":
+            return json.dumps(block.input, ensure_ascii=False)
+    return _claude_text(response)
+
+async def _read_openai_stream(stream, on_text, on_usage=None):
+    text = ""
+    async for chunk in stream:
+        # With stream_options.include_usage, the last chunk carries usage and no choices.
+        if chunk.usage and on_usage:
+            on_usage(chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            text += chunk.choices[0].delta.content
+            on_text(text)
+    return text
+
+async def _read_claude_stream(stream, on_text, on_usage=None):
+    text = ""
+    usage = None
+    async for event in stream:
+        # message_start carries the input usage; the final output token count comes with message_delta.
+        if event.type == "message_start":
+            usage = event.message.usage
+        elif event.type == "message_delta" and usage is not None and event.usage:
+            usage.output_tokens = event.usage.output_tokens
+        if event.type == "content_block_delta" and event.delta.type == "text_delta":
+            text += event.delta.text
+            on_text(text)
+    if usage is not None and on_usage:
+        on_usage(usage)
+    return text
+
+_STREAM_READERS = {"openai": _read_openai_stream, "anthropic": _read_claude_stream}
+
+def _stage_listener(on_event, query_id, variant_num, stage):
+    """Turns an AIService event callback into an on_text callback for one variant stage."""
+    if on_event is None:
+        return None
+    return lambda text: on_event({"type": stage, "query_id": query_id, "variant_num": variant_num, "text": text})
+
+def _emit_variant(on_event, variant_num, result):
+    if on_event:
+        on_event({"type": "variant", "query_id": result["query_id"], "variant_num": variant_num, "result": result})
+
+def _siblings(items, index):
+    return [item for j, item in enumerate(items) if j != index]
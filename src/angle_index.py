@@ -0,0 +1,143 @@
+# src/angle_index.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.config import (
+    ANGLE_INDEX_PATH, ANGLE_INDEX_MAX_ENTRIES, ANGLE_INDEX_HASH_FEATURES, ANGLE_INDEX_NGRAM_RANGE,
+    ANGLE_INDEX_MAX_MATCHES, ANGLE_INDEX_REUSE_THRESHOLD, ANGLE_INDEX_SEED_THRESHOLD, ANGLE_INDEX_MAX_SEEDS
+)
+from src.uniqueness import hashed_tf_matrix, l2_normalize
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def _normalize_angle(angle):
+    return " ".join(angle.lower().split())
+
+
+class AngleIndex:
+    """
+    Past journalist queries with the angles delivered for them, kept in SQLite and held in
+    memory as a matrix of hashed term frequencies. New queries are matched by TF-IDF cosine
+    similarity (IDF over the indexed queries). Rows added by other processes sharing the file
+    are picked up on the next lookup.
+    """
+
+    def __init__(self, path=ANGLE_INDEX_PATH, max_entries=ANGLE_INDEX_MAX_ENTRIES, n_features=ANGLE_INDEX_HASH_FEATURES):
+        self.path = path
+        self.max_entries = max_entries
+        self.n_features = n_features
+        self.stats = {"reused": 0, "seeded": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._clients = []
+        self._angles = []
+        self._term_frequencies = np.zeros((0, n_features), dtype=np.float32)
+        # Normalized angles already delivered per client name; never reused for that client.
+        self._delivered = {}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS angle_index ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, query_text TEXT NOT NULL, client_name TEXT NOT NULL,"
+            " angles TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def _refresh(self):
+        """Loads rows added since the last lookup, keeping the newest `max_entries` in memory."""
+        rows = self._conn.execute(
+            "SELECT id, query_text, client_name, angles FROM angle_index WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        self._last_id = rows[-1][0]
+        for _, _, client_name, angles_json in rows:
+            angles = json.loads(angles_json)
+            self._clients.append(client_name)
+            self._angles.append(angles)
+            self._delivered.setdefault(client_name, set()).update(_normalize_angle(angle) for angle in angles)
+        new_rows = hashed_tf_matrix([row[1] for row in rows], self.n_features, ANGLE_INDEX_NGRAM_RANGE)
+        self._term_frequencies = np.vstack([self._term_frequencies, new_rows])[-self.max_entries:]
+        self._clients = self._clients[-self.max_entries:]
+        self._angles = self._angles[-self.max_entries:]
+
+    def nearest(self, query_text, limit=ANGLE_INDEX_MAX_MATCHES):
+        """Up to `limit` (similarity, client name, angles) of the most similar past queries, best first."""
+        with self._lock:
+            self._refresh()
+            if not self._angles:
+                return []
+            document_frequency = np.count_nonzero(self._term_frequencies, axis=0)
+            idf = (np.log((1.0 + len(self._angles)) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+            vectors = l2_normalize(self._term_frequencies * idf)
+            query_vector = l2_normalize(hashed_tf_matrix([query_text], self.n_features, ANGLE_INDEX_NGRAM_RANGE) * idf)[0]
+            similarities = vectors @ query_vector
+            best = np.argsort(-similarities)[:limit]
+            return [(float(similarities[i]), self._clients[i], list(self._angles[i])) for i in best]
+
+    def suggest(self, query_text, client_name, count):
+        """
+        Angles from similar past queries for a new query of `client_name`, skipping any already
+        delivered to that client. Returns (angles, seeds): `angles` holds `count` angles when
+        the closest matches are above ANGLE_INDEX_REUSE_THRESHOLD and have enough unused ones
+        (no API call needed), otherwise None; `seeds` holds unused angles of matches above
+        ANGLE_INDEX_SEED_THRESHOLD to pass to the angle prompt.
+        """
+        matches = self.nearest(query_text)
+        with self._lock:
+            delivered = set(self._delivered.get(client_name, ()))
+
+        def unused(threshold, limit):
+            picked = []
+            for similarity, _, angles in matches:
+                if similarity < threshold:
+                    break
+                for angle in angles:
+                    key = _normalize_angle(angle)
+                    if key not in delivered and all(_normalize_angle(p) != key for p in picked):
+                        picked.append(angle)
+            return picked[:limit]
+
+        reusable = unused(ANGLE_INDEX_REUSE_THRESHOLD, count)
+        if len(reusable) >= count:
+            self.stats["reused"] += 1
+            logger.info(f"Reusing {count} angles from past queries (similarity {matches[0][0]:.2f}) for '{query_text[:50]}...'.")
+            return reusable, []
+        seeds = unused(ANGLE_INDEX_SEED_THRESHOLD, ANGLE_INDEX_MAX_SEEDS)
+        self.stats["seeded" if seeds else "misses"] += 1
+        return None, seeds
+
+    def add(self, query_text, client_name, angles):
+        """Records angles delivered for a query, dropping the oldest rows beyond `max_entries`."""
+        if not angles:
+            return
+        angles_json = json.dumps(list(angles), ensure_ascii=False)
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM angle_index WHERE query_text = ? AND client_name = ? AND angles = ?",
+                (query_text, client_name, angles_json)
+            ).fetchone()
+            if exists:
+                return
+            self._conn.execute(
+                "INSERT INTO angle_index (query_text, client_name, angles, created_at) VALUES (?, ?, ?, ?)",
+                (query_text, client_name, angles_json, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM angle_index WHERE id <= (SELECT id FROM angle_index ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,126 @@
+# src/answer_validator.py
+"""
+Local checks of a Claude draft against the mechanical rules of the prompts (two paragraphs of
+50-60 words, no dates, no em dashes, no labels or lists, none of the fixed or sibling negative
+phrases) plus a Flesch reading-ease floor. The review decides whether the OpenAI polish can
+be skipped, whether a local repair is enough, or which fixes the polish must be told about.
+"""
+
+import re
+
+from src.config import (
+    FIXED_NEGATIVE_EXAMPLES_PROMPT_PART, VALIDATION_PARAGRAPH_WORDS,
+    VALIDATION_MIN_READING_EASE, VALIDATION_FIX_INSTRUCTIONS
+)
+from src.post_processing import format_two_paragraphs, remove_dates, remove_variant_label_prefix
+
+RULES = ("two_paragraphs", "paragraph_length", "no_dates", "no_em_dashes", "no_labels", "no_negative_phrases", "readability")
+# Rules that label stripping, dash replacement and format_two_paragraphs can fix without a
+# model call. Dates are not: removing them leaves sentences that need rewording.
+REPAIRABLE_RULES = frozenset(("two_paragraphs", "paragraph_length", "no_em_dashes", "no_labels"))
+
+_LABEL = re.compile(r'^\s*(?:Variant\s*\d+:|Here(?:\s+is|\'s)\s+(?:the|your|a)\b[^.\n]*:)', re.IGNORECASE)
+_LIST_ITEM = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s', re.MULTILINE)
+_EM_DASH = re.compile(r'\s*(?:—|--)\s*')
+_MULTI_SPACE = re.compile(r'\s{2,}')
+_SENTENCE_END = ('.', '?', '!')
+_SENTENCE = re.compile(r'[^.!?]+[.!?]*')
+_WORD = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+_VOWEL_GROUPS = re.compile(r'[aeiouy]+')
+
+
+def _phrase_pattern(phrase):
+    # "X" in the fixed examples stands for any number ("jumped X% conversions").
+    return re.compile(re.sub(r'\bX\b', r'\\d+', re.escape(phrase)), re.IGNORECASE)
+
+FIXED_NEGATIVE_PATTERNS = [
+    _phrase_pattern(phrase.strip(' ,.'))
+    for phrase in re.findall(r'"([^"]+)"', FIXED_NEGATIVE_EXAMPLES_PROMPT_PART)
+]
+
+
+def _syllables(word):
+    word = word.lower()
+    count = len(_VOWEL_GROUPS.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and count > 1:
+        count -= 1
+    return max(1, count)
+
+
+def reading_ease(text):
+    """Flesch reading ease (higher is easier; 60-70 is plain English)."""
+    words = _WORD.findall(text or "")
+    if not words:
+        return 0.0
+    sentences = max(1, sum(1 for s in _SENTENCE.findall(text) if _WORD.search(s)))
+    syllables = sum(_syllables(word) for word in words)
+    return round(206.835 - 1.015 * len(words) / sentences - 84.6 * syllables / len(words), 1)
+
+
+def _paragraphs(text):
+    return [p.strip() for p in re.split(r'\n\s*\n', (text or "").strip()) if p.strip()]
+
+
+def check(text, negative_phrases=()):
+    """Names of the rules `text` fails, in RULES order, and its reading ease."""
+    paragraphs = _paragraphs(text)
+    low, high = VALIDATION_PARAGRAPH_WORDS
+    lowered = (text or "").lower()
+    failed = []
+    # A paragraph must also end a sentence (rebalancing can split one mid-sentence).
+    if len(paragraphs) != 2 or any(not p.rstrip('"\'”’)').endswith(_SENTENCE_END) for p in paragraphs):
+        failed.append("two_paragraphs")
+    if not paragraphs or any(not low <= len(p.split()) <= high for p in paragraphs):
+        failed.append("paragraph_length")
+    if remove_dates(text) != _MULTI_SPACE.sub(' ', text or '').strip():
+        failed.append("no_dates")
+    if _EM_DASH.search(text or ""):
+        failed.append("no_em_dashes")
+    if _LABEL.search(text or "") or _LIST_ITEM.search(text or ""):
+        failed.append("no_labels")
+    if any(p.search(text or "") for p in FIXED_NEGATIVE_PATTERNS) or any(
+            phrase and phrase.lower() in lowered for phrase in negative_phrases):
+        failed.append("no_negative_phrases")
+    ease = reading_ease(text)
+    if ease < VALIDATION_MIN_READING_EASE:
+        failed.append("readability")
+    return failed, ease
+
+
+def repair(text):
+    """Local fixes for the repairable rules: labels, em dashes and the two-paragraph layout."""
+    text = _LABEL.sub('', remove_variant_label_prefix(text)).strip()
+    text = _EM_DASH.sub(', ', text)
+    return format_two_paragraphs(text)
+
+
+class AnswerValidator:
+    """Reviews drafts before the polish stage and counts rule results and decisions."""
+
+    def __init__(self):
+        self.stats = {
+            "rules": {rule: {"passed": 0, "failed": 0} for rule in RULES},
+            "actions": {"skip": 0, "repair": 0, "polish": 0},
+        }
+
+    def review(self, draft, negative_phrases=()):
+        """
+        Returns a dict with "action": "skip" (the draft passes every rule and is used as is),
+        "repair" ("text" is the locally repaired draft, which passes every rule) or "polish"
+        ("instructions" lists the fixes the polish prompt should ask for), plus the draft's
+        "failed_rules" and "reading_ease".
+        """
+        failed, ease = check(draft, negative_phrases)
+        for rule in RULES:
+            self.stats["rules"][rule]["failed" if rule in failed else "passed"] += 1
+
+        review = {"action": "skip", "text": draft, "failed_rules": failed, "reading_ease": ease, "instructions": []}
+        if failed:
+            repaired = repair(draft) if set(failed) <= REPAIRABLE_RULES else None
+            if repaired is not None and not check(repaired, negative_phrases)[0]:
+                review.update(action="repair", text=repaired)
+            else:
+                review.update(action="polish", text=None,
+                              instructions=[VALIDATION_FIX_INSTRUCTIONS[rule] for rule in failed])
+        self.stats["actions"][review["action"]] += 1
+        return review
@@ -0,0 +1,376 @@
+# src/batch_cli.py
+"""
+Headless batch runner for large query backlogs.
+
+    python -m src.batch_cli queries.jsonl --output results.jsonl --concurrency 4
+
+Input is JSONL or CSV (by file extension, or "-" for JSONL on stdin). Each record needs a query
+and may carry an id and client info, either as one UI-style "name\\nguidelines" string or as a
+{"name": ..., "guidelines": ...} object, plus an optional "deadline" (Unix timestamp or ISO
+8601) and client "tier" (see CLIENT_TIER_WEIGHTS); queries with deadlines are started first.
+Every finished query is appended to the output JSONL as soon as it completes; the output file
+doubles as the checkpoint, so rerunning the same command after a crash or Ctrl-C skips every
+query already written.
+
+With --bulk, queries are processed in chunks through the provider batch APIs instead
+(cheaper, no interactive latency); each chunk is written out once its last stage finishes.
+
+    python -m src.batch_cli --retry-failed --output results.jsonl
+
+re-runs only the failed variants (and any marked "rejected": true) of the results already in
+the output file and merges them back in place, leaving every other variant untouched.
+"""
+
+import argparse
+import asyncio
+import csv
+import functools
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+from src.ai_integrations import AIService, variants_to_retry
+from src.bulk_batch import BulkBatchRunner
+from src.exports import write_csv_export
+from src.scheduler import priority_for
+from src.config import BATCH_DEFAULT_CONCURRENCY, BULK_BATCH_CHUNK_SIZE, VARIANT_EXECUTION_MODE, VARIANT_EXECUTION_MODES
+from src.utils import get_logger, parse_client_info
+
+logger = get_logger(__name__)
+
+
+def _stable_query_id(query_text, client_raw):
+    digest = hashlib.sha1(f"{query_text}\n{client_raw}".encode("utf-8")).hexdigest()
+    return f"B-{digest[:12]}"
+
+
+def _parse_deadline(value, line_number):
+    """A record's deadline as a Unix timestamp: given as one, or as an ISO 8601 date-time (local time if naive)."""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value).strip()).timestamp()
+    except ValueError:
+        logger.warning(f"Ignoring the unreadable deadline {value!r} of input record {line_number}.")
+        return None
+
+
+def _normalize_record(record, line_number, args):
+    query_text = str(record.get(args.query_field) or "").strip()
+    if not query_text:
+        logger.warning(f"Skipping input record {line_number}: no '{args.query_field}' field.")
+        return None
+
+    client_raw = record.get(args.client_field)
+    if isinstance(client_raw, dict):
+        client_info = {
+            "name": client_raw.get("name") or "Client Default",
+            "guidelines": client_raw.get("guidelines", "")
+        }
+    else:
+        client_info = parse_client_info(
+            str(client_raw or record.get("client_name", "") or ""), "Client Default"
+        )
+        if not client_raw and record.get("client_guidelines"):
+            client_info["guidelines"] = str(record["client_guidelines"]).strip()
+
+    query_id = record.get(args.id_field) or _stable_query_id(query_text, json.dumps(client_info, sort_keys=True))
+    tier = (client_raw.get("tier") if isinstance(client_raw, dict) else None) or record.get("tier")
+    if tier:
+        client_info["tier"] = str(tier).strip()
+    normalized = {"id": str(query_id), "text": query_text, "client_info": client_info}
+    deadline = _parse_deadline(record.get("deadline"), line_number)
+    if deadline is not None:
+        normalized["deadline"] = deadline
+    return normalized
+
+
+def iter_input_records(path, args):
+    """Yields normalized query records one at a time, so input size does not affect memory."""
+    is_csv = path.lower().endswith(".csv")
+    stream = sys.stdin if path == "-" else open(path, newline="" if is_csv else None, encoding="utf-8")
+    try:
+        if is_csv:
+            for line_number, row in enumerate(csv.DictReader(stream), start=2):
+                record = _normalize_record(row, line_number, args)
+                if record:
+                    yield record
+            return
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                raw_record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed JSON on input line {line_number}: {e}")
+                continue
+            record = _normalize_record(raw_record, line_number, args)
+            if record:
+                yield record
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def iter_records_by_deadline(path, args):
+    """
+    Input records with a deadline first (earliest first), then the rest in input order. A file
+    is read twice so only the records with deadlines are held in memory; stdin is read once,
+    in input order.
+    """
+    if path == "-":
+        yield from iter_input_records(path, args)
+        return
+    yield from sorted(
+        (record for record in iter_input_records(path, args) if "deadline" in record),
+        key=lambda record: record["deadline"]
+    )
+    for record in iter_input_records(path, args):
+        if "deadline" not in record:
+            yield record
+
+
+def load_completed_query_ids(output_path):
+    """Reads the output JSONL checkpoint; a torn last line from a crash is ignored and redone."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["query_id"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return completed
+
+
+def iter_output_results(output_path):
+    """Yields the results recorded in the output JSONL one at a time, skipping a torn last line."""
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _write_result(output, result, counts):
+    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+    output.flush()
+    counts["completed"] += 1
+    counts["failed_variants"] += sum(1 for v in result["variants"] if v["status"] != "Success")
+
+
+async def run_batch(records, output_path, parameters, concurrency, ai_service=None):
+    """
+    Runs process_query_with_variants over `records` with at most `concurrency` queries in flight,
+    appending each result to `output_path` as it finishes. The service's scheduler orders the
+    queries' API calls by each record's deadline and client tier.
+    """
+    completed_ids = load_completed_query_ids(output_path)
+    owns_service = ai_service is None
+    ai_service = ai_service or AIService()
+    # --concurrency above SCHEDULER_MAX_ACTIVE_QUERIES would otherwise be capped silently.
+    ai_service.scheduler.allow_active_queries(concurrency)
+    # A small bounded queue keeps memory flat no matter how long the input stream is.
+    pending = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"completed": 0, "skipped": 0, "failed_variants": 0}
+
+    with open(output_path, "a", encoding="utf-8") as output:
+        async def worker():
+            while True:
+                record = await pending.get()
+                try:
+                    if record is None:
+                        return
+                    result = await ai_service.scheduler.run_query(
+                        priority_for(record["client_info"], record.get("deadline")),
+                        functools.partial(
+                            ai_service.process_query_with_variants, record["id"], record["text"], record["client_info"], parameters
+                        )
+                    )
+                    _write_result(output, result, counts)
+                    logger.info(f"Batch: query {record['id']} done ({counts['completed']} completed, {counts['skipped']} skipped).")
+                except Exception as e:
+                    logger.error(f"Batch: query {record['id']} failed and will be retried on the next run: {e}")
+                finally:
+                    pending.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            seen_ids = set()
+            for record in records:
+                if record["id"] in completed_ids or record["id"] in seen_ids:
+                    counts["skipped"] += 1
+                    continue
+                seen_ids.add(record["id"])
+                await pending.put(record)
+            for _ in workers:
+                await pending.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if owns_service:
+                await ai_service.close()
+    return counts
+
+
+async def run_bulk(records, output_path, parameters, chunk_size, ai_service=None, transports=None):
+    """
+    Offline variant of run_batch: sends `chunk_size` queries at a time through BulkBatchRunner,
+    one provider batch job per stage, and appends the chunk's results when it completes.
+    """
+    completed_ids = load_completed_query_ids(output_path)
+    owns_service = ai_service is None
+    ai_service = ai_service or AIService()
+    runner = BulkBatchRunner(ai_service, transports)
+    counts = {"completed": 0, "skipped": 0, "failed_variants": 0}
+
+    with open(output_path, "a", encoding="utf-8") as output:
+        async def run_chunk(chunk):
+            for result in await runner.process_queries(chunk, parameters):
+                _write_result(output, result, counts)
+            logger.info(f"Bulk: chunk of {len(chunk)} queries done ({counts['completed']} completed, {counts['skipped']} skipped).")
+
+        try:
+            chunk, seen_ids = [], set()
+            for record in records:
+                if record["id"] in completed_ids or record["id"] in seen_ids:
+                    counts["skipped"] += 1
+                    continue
+                seen_ids.add(record["id"])
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    await run_chunk(chunk)
+                    chunk = []
+            if chunk:
+                await run_chunk(chunk)
+        finally:
+            if owns_service:
+                await ai_service.close()
+    return counts
+
+
+async def retry_failed_variants(output_path, parameters, concurrency, ai_service=None):
+    """
+    Re-runs the failed or rejected variants of every result in `output_path`, at most
+    `concurrency` queries at a time, and rewrites the file with the merged results as they
+    complete. They go to a temporary file that replaces the output atomically at the end, so
+    an interrupted retry leaves the previous results intact.
+    """
+    owns_service = ai_service is None
+    ai_service = ai_service or AIService()
+    # Like run_batch, a small bounded queue keeps memory flat however long the output file is.
+    pending = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"retried_variants": 0, "failed_variants": 0}
+    temporary_path = f"{output_path}.tmp"
+
+    def write(output, result):
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        counts["failed_variants"] += sum(1 for v in result["variants"] if v["status"] != "Success")
+
+    try:
+        with open(temporary_path, "w", encoding="utf-8") as output:
+            async def worker():
+                while True:
+                    item = await pending.get()
+                    try:
+                        if item is None:
+                            return
+                        result, indices = item
+                        try:
+                            merged = await ai_service.retry_variants(result, indices, parameters)
+                            counts["retried_variants"] += len(indices)
+                        except Exception as e:
+                            logger.error(f"Retry: query {result['query_id']} failed and is left as it was: {e}")
+                            merged = result
+                        write(output, merged)
+                    finally:
+                        pending.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+            try:
+                for result in iter_output_results(output_path):
+                    indices = variants_to_retry(result)
+                    if indices:
+                        await pending.put((result, indices))
+                    else:
+                        write(output, result)
+                for _ in workers:
+                    await pending.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+    finally:
+        if owns_service:
+            await ai_service.close()
+    os.replace(temporary_path, output_path)
+    return counts
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Generate HARO answer variants for a JSONL/CSV stream of queries.")
+    parser.add_argument("input", nargs="?", help="Input .jsonl or .csv file, or '-' for JSONL on stdin.")
+    parser.add_argument("-o", "--output", default="haro_results.jsonl", help="Output JSONL; also the resume checkpoint.")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_DEFAULT_CONCURRENCY, help="Queries processed at the same time.")
+    parser.add_argument("--general-instructions", default="Ensure answers are concise, impactful, and demonstrate deep industry knowledge.")
+    parser.add_argument("--mode", default=VARIANT_EXECUTION_MODE, choices=VARIANT_EXECUTION_MODES, help="Variant execution mode.")
+    parser.add_argument("--bulk", action="store_true", help="Use the provider batch APIs (offline, cheaper, slower).")
+    parser.add_argument("--bulk-chunk-size", type=int, default=BULK_BATCH_CHUNK_SIZE, help="Queries per bulk chunk.")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-run only the failed or rejected variants in --output.")
+    parser.add_argument("--csv", help="Also write every result in the output JSONL to this CSV file.")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--query-field", default="query")
+    parser.add_argument("--client-field", default="client")
+    return parser
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    parameters = {
+        "general_instructions": args.general_instructions,
+        "variant_execution_mode": args.mode
+    }
+    if args.retry_failed:
+        if not os.path.exists(args.output):
+            parser.error(f"--retry-failed needs an existing output file; {args.output} does not exist.")
+        counts = asyncio.run(retry_failed_variants(args.output, parameters, max(1, args.concurrency)))
+        logger.info(
+            f"Retry finished: {counts['retried_variants']} variants re-run, "
+            f"{counts['failed_variants']} still failed. Results in {args.output}."
+        )
+        return 0
+    if args.input is None:
+        parser.error("an input file is required unless --retry-failed is given.")
+    records = iter_records_by_deadline(args.input, args)
+    try:
+        if args.bulk:
+            counts = asyncio.run(run_bulk(records, args.output, parameters, max(1, args.bulk_chunk_size)))
+        else:
+            counts = asyncio.run(run_batch(records, args.output, parameters, max(1, args.concurrency)))
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted. Finished queries are saved in {args.output}; rerun the same command to resume.")
+        return 130
+    logger.info(
+        f"Batch finished: {counts['completed']} queries completed, {counts['skipped']} skipped as already done, "
+        f"{counts['failed_variants']} failed variants. Results in {args.output}."
+    )
+    if args.csv:
+        # Streamed row by row from the JSONL, so the whole result set is never held in memory.
+        with open(args.csv, "w", newline="", encoding="utf-8") as csv_file:
+            write_csv_export(iter_output_results(args.output), csv_file)
+        logger.info(f"CSV export written to {args.csv}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
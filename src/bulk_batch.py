@@ -0,0 +1,251 @@
+# src/bulk_batch.py
+
+import abc
+import asyncio
+import json
+
+from src.ai_integrations import parse_angles, complete_angles
+from src.post_processing import process_batch
+from src.uniqueness import avoid_phrases
+from src.config import BULK_BATCH_POLL_SECONDS, OPENAI_BATCH_COMPLETION_WINDOW
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchJobError(Exception):
+    """A provider batch job ended without results (failed, expired or cancelled)."""
+
+
+class BatchTransport(abc.ABC):
+    """
+    Submits one stage's requests as a single provider batch job and collects its results.
+    Subclasses wrap a provider's batch API; benchmarks/fake_llm_server.py serves both batch
+    APIs, so the SDK clients can be pointed at it via base_url.
+    """
+
+    @abc.abstractmethod
+    async def submit(self, requests):
+        """`requests` is a list of (custom_id, request kwargs). Returns the batch id."""
+
+    @abc.abstractmethod
+    async def is_finished(self, batch_id):
+        """Whether the job has ended; raises BatchJobError when it ended without results."""
+
+    @abc.abstractmethod
+    async def fetch_results(self, batch_id):
+        """Returns {custom_id: response text or Exception}."""
+
+
+class OpenAIBatchTransport(BatchTransport):
+    def __init__(self, client, completion_window=OPENAI_BATCH_COMPLETION_WINDOW):
+        self.client = client
+        self.completion_window = completion_window
+
+    async def submit(self, requests):
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}, ensure_ascii=False)
+            for custom_id, body in requests
+        ]
+        batch_file = await self.client.files.create(
+            file=("haro_batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id, endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    async def is_finished(self, batch_id):
+        batch = await self.client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled") and not batch.output_file_id:
+            raise BatchJobError(f"OpenAI batch {batch_id} ended with status '{batch.status}'.")
+        return batch.status in ("completed", "failed", "expired", "cancelled")
+
+    async def fetch_results(self, batch_id):
+        batch = await self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+                else:
+                    error = entry.get("error") or response.get("body", {}).get("error")
+                    results[entry["custom_id"]] = BatchJobError(f"OpenAI batch request failed: {error}")
+        return results
+
+
+class AnthropicBatchTransport(BatchTransport):
+    def __init__(self, client):
+        self.client = client
+
+    async def submit(self, requests):
+        batch = await self.client.messages.batches.create(
+            requests=[{"custom_id": custom_id, "params": params} for custom_id, params in requests]
+        )
+        return batch.id
+
+    async def is_finished(self, batch_id):
+        batch = await self.client.messages.batches.retrieve(batch_id)
+        return batch.processing_status == "ended"
+
+    async def fetch_results(self, batch_id):
+        results = {}
+        async for entry in await self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = entry.result.message.content[0].text
+            else:
+                results[entry.custom_id] = BatchJobError(f"Anthropic batch request {entry.result.type}: {getattr(entry.result, 'error', '')}")
+        return results
+
+
+class BulkBatchRunner:
+    """
+    Runs the angles -> drafts -> polishes pipeline for many queries at once, submitting each
+    stage as one provider batch job (cheaper and outside the interactive rate limits) and
+    fanning the results back into the same per-variant records process_single_variant returns.
+    Uniqueness follows the "wave" mode: drafts avoid sibling angles, polishes avoid the
+    distinctive phrases of sibling drafts.
+    """
+
+    def __init__(self, ai_service, transports=None, poll_seconds=BULK_BATCH_POLL_SECONDS):
+        self.ai_service = ai_service
+        self.transports = transports or {
+            "openai": OpenAIBatchTransport(ai_service.openai_client),
+            "anthropic": AnthropicBatchTransport(ai_service.claude_client),
+        }
+        self.poll_seconds = poll_seconds
+
+    async def run_stage(self, stage, provider, requests):
+        """
+        Answers cached requests locally, sends the rest as one batch job and returns
+        {custom_id: text or Exception}. Fresh results are written back to the response cache.
+        """
+        cache = self.ai_service.response_cache
+        results, to_submit, cache_keys = {}, [], {}
+        for custom_id, request in requests:
+            if cache.is_enabled(stage):
+                cache_keys[custom_id] = cache.make_key(provider, request)
+                cached_text = cache.get(stage, cache_keys[custom_id])
+                if cached_text is not None:
+                    results[custom_id] = cached_text
+                    continue
+            to_submit.append((custom_id, request))
+        if not to_submit:
+            return results
+
+        transport = self.transports[provider]
+        try:
+            batch_id = await transport.submit(to_submit)
+            logger.info(f"Bulk {stage}: submitted {len(to_submit)} requests as {provider} batch {batch_id}.")
+            while not await transport.is_finished(batch_id):
+                await asyncio.sleep(self.poll_seconds)
+            batch_results = await transport.fetch_results(batch_id)
+        except Exception as e:
+            logger.error(f"Bulk {stage}: {provider} batch failed: {e}")
+            batch_results = {}
+            for custom_id, _ in to_submit:
+                batch_results[custom_id] = e
+
+        for custom_id, _ in to_submit:
+            text = batch_results.get(custom_id, BatchJobError(f"No result returned for {custom_id}."))
+            results[custom_id] = text
+            if isinstance(text, str) and text and custom_id in cache_keys:
+                cache.put(stage, cache_keys[custom_id], text)
+        logger.info(f"Bulk {stage}: {sum(1 for r in results.values() if isinstance(r, str))}/{len(requests)} succeeded.")
+        return results
+
+    async def process_queries(self, queries, parameters):
+        """
+        `queries` are dicts with "id", "text" and "client_info". Returns one result per query,
+        shaped like AIService.process_query_with_variants.
+        """
+        service = self.ai_service
+        general_instructions = parameters.get("general_instructions", "")
+
+        # Stage 1: angles. Custom ids only use [A-Za-z0-9_-], as both providers require.
+        angle_results = await self.run_stage("angles", "openai", [
+            (f"q{qi}-angles", service.build_angles_request(query["text"], query["client_info"]))
+            for qi, query in enumerate(queries)
+        ])
+        all_angles = []
+        for qi, query in enumerate(queries):
+            response_content = angle_results[f"q{qi}-angles"]
+            if isinstance(response_content, Exception):
+                logger.error(f"Error generating angles for query '{query['text'][:50]}...': {response_content}")
+                all_angles.append(complete_angles(query["id"], []))
+            else:
+                all_angles.append(complete_angles(query["id"], parse_angles(response_content)))
+
+        # Stage 2: drafts, each avoiding its sibling angles.
+        draft_results = await self.run_stage("drafting", "anthropic", [
+            (f"q{qi}-v{vi + 1}-draft", service.build_drafting_request(
+                query["text"], query["client_info"], general_instructions, angle,
+                vi + 1, len(angles), [a for j, a in enumerate(angles) if j != vi]
+            ))
+            for qi, (query, angles) in enumerate(zip(queries, all_angles))
+            for vi, angle in enumerate(angles)
+        ])
+
+        # Stage 3: polishes, each avoiding its sibling drafts' distinctive phrases. Drafts the
+        # local validator accepts (as is or repaired) are not sent.
+        polish_requests = []
+        reviews = {}
+        for qi, (query, angles) in enumerate(zip(queries, all_angles)):
+            drafts = [draft_results[f"q{qi}-v{vi + 1}-draft"] for vi in range(len(angles))]
+            for vi, draft in enumerate(drafts):
+                if isinstance(draft, Exception):
+                    continue
+                sibling_phrases = _sibling_draft_phrases(drafts, vi)
+                review = reviews[(qi, vi)] = service.review_draft(draft, sibling_phrases)
+                if review is not None and review["action"] != "polish":
+                    continue
+                polish_requests.append((f"q{qi}-v{vi + 1}-polish", service.build_polish_request(
+                    query["text"], query["client_info"], general_instructions, draft, vi + 1,
+                    sibling_phrases, review["instructions"] if review else None
+                )))
+        polish_results = await self.run_stage("polish", "openai", polish_requests)
+        for (qi, vi), review in reviews.items():
+            if review is not None and review["action"] != "polish":
+                polish_results[f"q{qi}-v{vi + 1}-polish"] = review["text"]
+
+        # Post-process every successful answer of the chunk in one pass.
+        final_answers = {}
+        for qi, angles in enumerate(all_angles):
+            for vi in range(len(angles)):
+                final_answer = polish_results.get(f"q{qi}-v{vi + 1}-polish", draft_results[f"q{qi}-v{vi + 1}-draft"])
+                if not isinstance(final_answer, Exception):
+                    final_answers[(qi, vi)] = final_answer
+        processed_answers = dict(zip(final_answers, process_batch(list(final_answers.values()))))
+
+        all_query_results = []
+        for qi, (query, angles) in enumerate(zip(queries, all_angles)):
+            drafts = [draft_results[f"q{qi}-v{vi + 1}-draft"] for vi in range(len(angles))]
+            variants = []
+            for vi, (angle, draft) in enumerate(zip(angles, drafts)):
+                if (qi, vi) not in processed_answers:
+                    error = polish_results.get(f"q{qi}-v{vi + 1}-polish", draft)
+                    variants.append(service.make_failed_variant(query["id"], angle, error))
+                    continue
+                variants.append(service.make_variant_result(
+                    query["id"], angle, draft, processed_answers[(qi, vi)],
+                    _sibling_draft_phrases(drafts, vi), post_processed=True, review=reviews.get((qi, vi))
+                ))
+            all_query_results.append({
+                "query_id": query["id"],
+                "query_text": query["text"],
+                "client_info": query["client_info"],
+                "variants": variants
+            })
+        return all_query_results
+
+
+def _sibling_draft_phrases(drafts, index):
+    return avoid_phrases([d for j, d in enumerate(drafts) if j != index and not isinstance(d, Exception)])
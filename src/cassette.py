@@ -0,0 +1,259 @@
+# src/cassette.py
+"""
+Transport-level record/replay of the provider HTTP calls, for deterministic offline runs.
+
+A Cassette wraps the httpx transport of both SDK clients (see build_http_client). Recording
+passes every request through to the network and appends the exchange to a gzipped JSONL
+file: the request, the response status, the headers the service reads (content type,
+rate-limit and retry headers), the body, the time to the response headers and the arrival
+time of every body chunk, so streamed responses replay chunk by chunk. Replaying answers each
+request from the recorded exchanges with the same key, in recording order (the last one is
+repeated once they run out), without opening a connection.
+
+The key is the method, the path and the canonical JSON of the request body (sorted keys,
+no whitespace). Headers are left out, so API keys and the SDKs' retry counters never change
+it, while any change to a prompt built by PromptManager does.
+"""
+
+import asyncio
+import atexit
+import base64
+import collections
+import functools
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from src.config import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_LATENCY_SCALE
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+CASSETTE_MODES = ("record", "replay")
+_RECORDED_HEADERS = ("content-type", "content-encoding", "retry-after", "retry-after-ms", "request-id", "x-request-id")
+
+
+def request_key(request):
+    """The replay key of an httpx request: SHA-256 of method, path and canonical JSON body."""
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    except ValueError:
+        pass  # Not JSON (e.g. a batch file upload): the raw bytes are the key.
+    digest = hashlib.sha256(f"{request.method} {request.url.raw_path.decode('ascii')}\n".encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _recorded_headers(headers):
+    return {
+        name: value for name, value in headers.items()
+        if name.lower() in _RECORDED_HEADERS or "ratelimit" in name.lower()
+    }
+
+
+def _encode_body(body):
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode_body(entry):
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return entry["body"].encode("utf-8")
+
+
+def _read_entries(path):
+    """The exchanges in one cassette file; a file cut short by a crash yields what was flushed."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping a truncated entry in cassette {path}.")
+    except (EOFError, gzip.BadGzipFile, OSError) as e:
+        logger.warning(f"Cassette {path} ends early ({e}); replaying the entries before that point.")
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes a response body through unchanged, noting each chunk's arrival; records it once fully read."""
+
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._parts = []
+        self._chunks = []
+        self._size = 0
+        self._started = time.perf_counter()
+        self._complete = False
+
+    async def __aiter__(self):
+        async for part in self._stream:
+            self._parts.append(part)
+            self._size += len(part)
+            self._chunks.append((round(time.perf_counter() - self._started, 4), self._size))
+            yield part
+        self._complete = True
+
+    async def aclose(self):
+        await self._stream.aclose()
+        # A body abandoned half way (a cancelled hedge, a dropped connection) is not recorded.
+        if self._complete:
+            self._complete = False
+            self._on_complete(b"".join(self._parts), self._chunks)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """A recorded body, cut at the recorded chunk boundaries and spaced by the scaled recorded gaps."""
+
+    def __init__(self, body, chunks, latency_scale):
+        self._body = body
+        self._chunks = chunks
+        self._latency_scale = latency_scale
+
+    async def __aiter__(self):
+        start, previous = 0, 0.0
+        for offset, end in self._chunks:
+            if self._latency_scale and offset > previous:
+                await asyncio.sleep((offset - previous) * self._latency_scale)
+            previous = offset
+            yield self._body[start:end]
+            start = end
+        if start < len(self._body):
+            yield self._body[start:]
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """The httpx transport of a cassette: records around `inner`, or replays without it."""
+
+    def __init__(self, cassette, inner):
+        self.cassette = cassette
+        self.inner = inner
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        if self.cassette.mode == "replay":
+            return await self.cassette.replay(request)
+        # Uncompressed bodies compress far better across the whole cassette.
+        request.headers["accept-encoding"] = "identity"
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        time_to_headers = time.perf_counter() - started
+        response.stream = _RecordingStream(
+            response.stream,
+            lambda body, chunks: self.cassette.record(request, response, time_to_headers, body, chunks)
+        )
+        return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class Cassette:
+    """
+    One record or replay session shared by the service's HTTP clients. `path` may contain
+    "{pid}": the process id when recording, a wildcard when replaying (see CASSETTE_PATH).
+    """
+
+    def __init__(self, mode, path=CASSETTE_PATH, latency_scale=CASSETTE_LATENCY_SCALE):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {', '.join(CASSETTE_MODES)}.")
+        self.mode = mode
+        self.latency_scale = max(0.0, latency_scale)
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._file = None
+        self._exchanges = {}
+        if mode == "record":
+            self.path = path.replace("{pid}", str(os.getpid()))
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+            logger.info(f"Recording provider calls to {self.path}.")
+        else:
+            self.path = path.replace("{pid}", "*")
+            paths = sorted(glob.glob(self.path))
+            if not paths:
+                raise FileNotFoundError(f"No cassette matches {self.path}.")
+            for cassette_path in paths:
+                for entry in _read_entries(cassette_path):
+                    self._exchanges.setdefault(entry["key"], collections.deque()).append(entry)
+            logger.info(f"Replaying {sum(map(len, self._exchanges.values()))} recorded calls from {len(paths)} cassette(s).")
+
+    def transport(self, inner):
+        return CassetteTransport(self, inner)
+
+    def record(self, request, response, time_to_headers, body, chunks):
+        try:
+            request_body = json.loads(request.content)
+        except ValueError:
+            request_body = None
+        entry = {
+            "key": request_key(request),
+            "method": request.method,
+            "path": request.url.raw_path.decode("ascii"),
+            "request": request_body,
+            "status": response.status_code,
+            "headers": _recorded_headers(response.headers),
+            **_encode_body(body),
+            "time_to_headers": round(time_to_headers, 4),
+            "chunks": chunks,
+        }
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            # A sync flush per exchange keeps everything recorded so far readable after a crash.
+            self._file.flush()
+            self.stats["recorded"] += 1
+
+    async def replay(self, request):
+        key = request_key(request)
+        with self._lock:
+            queue = self._exchanges.get(key)
+            if not queue:
+                self.stats["misses"] += 1
+                entry = None
+            else:
+                entry = queue.popleft() if len(queue) > 1 else queue[0]
+                self.stats["replayed"] += 1
+        if entry is None:
+            message = f"No recorded response for {request.method} {request.url.path} ({key[:12]}) in {self.path}."
+            logger.warning(message)
+            # A 404 is not retried, so a prompt change shows up as failed calls instead of retries.
+            return httpx.Response(
+                404, json={"type": "error", "error": {"type": "not_found_error", "message": message}}, request=request
+            )
+        if self.latency_scale:
+            await asyncio.sleep(entry["time_to_headers"] * self.latency_scale)
+        return httpx.Response(
+            entry["status"], headers=entry["headers"], request=request,
+            stream=_ReplayStream(_decode_body(entry), entry["chunks"], self.latency_scale)
+        )
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+@functools.lru_cache(maxsize=None)
+def cassette_from_settings():
+    """
+    The process-wide Cassette configured by HARO_CASSETTE / HARO_CASSETTE_PATH, or None when
+    it is off. Every service in the process shares it, so a recording has one writer per file.
+    """
+    if not CASSETTE_MODE:
+        return None
+    cassette = Cassette(CASSETTE_MODE)
+    atexit.register(cassette.close)
+    return cassette
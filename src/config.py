@@ -1,14 +1,18 @@
 # src/config.py
 
 import os
-import streamlit as st
-from dotenv import load_dotenv
 
-load_dotenv()
+# Settings come from Streamlit secrets (in the app), .streamlit/secrets.toml, the environment or
+# .env, in that order (src/settings.py); importing this module never imports Streamlit.
+from src.settings import PROJECT_ROOT, get_setting
+
+CACHE_DIR = get_setting("HARO_CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache"))
 
 # AI API Keys
-ANTHROPIC_API_KEY = st.secrets.get("ANTHROPIC_API_KEY", os.getenv("ANTHROPIC_API_KEY", "YOUR_ANTHROPIC_API_KEY_PLACEHOLDER"))
-OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY_PLACEHOLDER"))
+ANTHROPIC_API_KEY = get_setting("ANTHROPIC_API_KEY", "YOUR_ANTHROPIC_API_KEY_PLACEHOLDER")
+OPENAI_API_KEY = get_setting("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY_PLACEHOLDER")
+# App logins as a JSON object of {"username": "password"}.
+APP_CREDENTIALS = get_setting("APP_CREDENTIALS", "{}")
 
 # AI Models
 CLAUDE_MODEL = "claude-3-5-sonnet-20240620"
@@ -18,6 +22,234 @@ OPENAI_MODEL = "gpt-4o-2024-08-06"
 CONCURRENT_AI_CALLS = 2
 NUM_VARIANTS_PER_QUERY = 5
 
+# Max in-flight API calls per provider, shared by every query and variant of a run.
+CONCURRENT_AI_CALLS_PER_PROVIDER = {
+    "anthropic": CONCURRENT_AI_CALLS,
+    "openai": CONCURRENT_AI_CALLS,
+}
+
+# How the variants of one query are scheduled:
+# "sequential" - one variant after another; each sees the earlier final answers (original behaviour).
+# "parallel"   - all variants draft and polish at once; each avoids its sibling angles.
+# "wave"       - all variants draft at once avoiding sibling angles, then polish at once
+#                with the sibling drafts as negative constraints.
+# "combined"   - one Claude call drafts every variant and one OpenAI call polishes them all,
+#                both returning JSON; each call sees all siblings. Variants missing from or
+#                invalid in the JSON fall back to the per-variant calls.
+VARIANT_EXECUTION_MODE = "wave"
+VARIANT_EXECUTION_MODES = ("sequential", "parallel", "wave", "combined")
+
+# Output allowance of the "combined" mode calls (all variants in one response).
+COMBINED_DRAFTING_MAX_TOKENS = 4000
+COMBINED_POLISH_MAX_TOKENS = 4500
+
+# Stream drafts and polishes into the UI while they are being written.
+STREAM_RESPONSES = True
+
+# --- HTTP CONNECTION POOLS ---
+# One keep-alive pool per provider, shared by every run of the long-lived AIService.
+HTTP2_ENABLED = True
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 120
+HTTP_CONNECT_TIMEOUT_SECONDS = 10
+HTTP_TIMEOUT_SECONDS = 120
+
+# Queries in flight at once for the headless batch runner (src/batch_cli.py).
+BATCH_DEFAULT_CONCURRENCY = 4
+
+# --- BACKGROUND JOBS ---
+# UI runs are queued in a local SQLite store and run on the shared AI runtime's event loop, so
+# they survive reruns, refreshes and disconnects. Jobs a stopped process left running are
+# resumed (finished queries are kept) on the next start; finished jobs are purged after the
+# retention period.
+JOB_STORE_PATH = os.path.join(CACHE_DIR, "jobs.sqlite3")
+JOB_MAX_CONCURRENT_JOBS = 4
+JOB_POLL_SECONDS = 2
+JOB_RETENTION_SECONDS = 7 * 24 * 60 * 60
+JOB_RECENT_LIMIT = 10
+# Finished results stay in the job store; the app loads and renders one page of queries at a time.
+RESULTS_PAGE_SIZE = 10
+# "in_process": the app runs jobs on its own event loop. "workers": the app only queues them and
+# `python -m src.worker --workers N` processes run them (never run both against one store).
+JOB_EXECUTION_MODE = get_setting("HARO_JOB_EXECUTION", "in_process")
+
+# --- WORKER PROCESSES (src/worker.py) ---
+# Each worker leases queries for WORKER_LEASE_SECONDS and renews the leases every third of
+# that while it works; a crashed worker's queries are retried elsewhere once they expire, up
+# to WORKER_MAX_QUERY_ATTEMPTS times. All workers share one per-provider rate budget through
+# WORKER_RATE_LIMIT_PATH; CONCURRENT_AI_CALLS_PER_PROVIDER still applies per worker.
+WORKER_DEFAULT_PROCESSES = 2
+WORKER_QUERIES_PER_PROCESS = 4
+WORKER_LEASE_SECONDS = 90
+WORKER_POLL_SECONDS = 1
+WORKER_MAX_QUERY_ATTEMPTS = 3
+WORKER_RATE_LIMIT_PATH = os.path.join(CACHE_DIR, "rate_limits.sqlite3")
+
+# Offline bulk mode (provider batch APIs): seconds between status polls, queries per
+# submitted chunk, and the OpenAI batch completion window.
+BULK_BATCH_POLL_SECONDS = 30
+BULK_BATCH_CHUNK_SIZE = 500
+OPENAI_BATCH_COMPLETION_WINDOW = "24h"
+
+# --- RATE CONTROL ---
+# Starting per-provider budgets; the limiter re-sizes itself from the rate-limit headers
+# each provider returns, so these only matter until the first response arrives.
+PROVIDER_RATE_LIMITS = {
+    "anthropic": {"requests_per_minute": 50, "tokens_per_minute": 40000},
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+}
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 1
+RETRY_MAX_DELAY_SECONDS = 30
+# Consecutive server-side failures that open a provider's circuit, and how long it stays open.
+# A half-open trial call with no outcome after CIRCUIT_BREAKER_HALF_OPEN_TIMEOUT_SECONDS (it
+# waited on the rate limiter, a slot and the HTTP timeout) is written off and another one is let through.
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_SECONDS = 30
+CIRCUIT_BREAKER_HALF_OPEN_TIMEOUT_SECONDS = 180
+
+# --- HEDGED REQUESTS ---
+# Once a stage has HEDGE_MIN_SAMPLES recent successful calls, a call still running after the
+# HEDGE_PERCENTILE of their durations (but at least HEDGE_MIN_DELAY_SECONDS) gets a second,
+# non-streamed request: to the provider/model below (the same one = a plain duplicate, another
+# one = fallback). The first answer wins and the other request is cancelled. Hedges per stage
+# are capped at HEDGE_MAX_EXTRA_FRACTION of its calls. Stages missing here are never hedged.
+HEDGING_ENABLED = True
+HEDGE_STAGES = {
+    "drafting": {"provider": "openai", "model": OPENAI_MODEL},
+    "polish": {"provider": "openai", "model": OPENAI_MODEL},
+}
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_LATENCY_WINDOW = 200
+HEDGE_MIN_DELAY_SECONDS = 2
+HEDGE_MAX_EXTRA_FRACTION = 0.1
+
+# --- QUERY SCHEDULING (src/scheduler.py) ---
+# Queries and their API calls are served in priority order: queries due within
+# SCHEDULER_URGENT_SECONDS first (earliest deadline first), then the other clients' work shared
+# by weighted fair queuing on their tier weight. An urgent call finding every provider slot
+# taken gets the next free one; calls already running are never preempted. Client tiers come from the client's "tier" field, else CLIENT_TIERS by
+# client name, else DEFAULT_CLIENT_TIER. The batch CLI and workers raise the admission limit
+# to their --concurrency when it is higher.
+SCHEDULER_MAX_ACTIVE_QUERIES = 8
+SCHEDULER_URGENT_SECONDS = 2 * 60 * 60
+SCHEDULER_LATENCY_WINDOW = 500
+CLIENT_TIER_WEIGHTS = {"premium": 3.0, "standard": 1.0, "low": 0.5}
+DEFAULT_CLIENT_TIER = "standard"
+CLIENT_TIERS = {}
+
+# --- INSTRUMENTATION ---
+# Every angles/drafting/polish/post-processing call is recorded as a span (duration, attempts,
+# tokens, cost). Prices are USD per million tokens; Anthropic cache writes are counted as
+# uncached input. Models missing here are costed at zero.
+MODEL_PRICES_PER_MILLION_TOKENS = {
+    CLAUDE_MODEL: {"input": 3.00, "cached_input": 0.30, "output": 15.00},
+    OPENAI_MODEL: {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+}
+# Optional span metrics exporter: None, "prometheus" (needs prometheus_client; serves /metrics
+# on METRICS_PORT) or "opentelemetry" (needs opentelemetry-api; uses the global meter provider).
+METRICS_EXPORTER = get_setting("HARO_METRICS_EXPORTER") or None
+METRICS_PORT = int(get_setting("HARO_METRICS_PORT", "9464"))
+
+# --- UNIQUENESS ENGINE ---
+# Variants are compared locally with hashed word n-gram TF-IDF vectors. Later prompts get a
+# short list of distinctive phrases to avoid instead of whole previous answers, and variants
+# whose cosine similarity to a sibling exceeds the threshold are regenerated.
+UNIQUENESS_HASH_FEATURES = 2 ** 14
+UNIQUENESS_NGRAM_RANGE = (1, 3)
+UNIQUENESS_SIMILARITY_THRESHOLD = 0.35
+UNIQUENESS_MAX_AVOID_PHRASES = 12
+UNIQUENESS_MAX_REGENERATIONS = 1
+
+# --- EXPORTS ---
+# Built TXT/CSV/DOCX downloads kept per session (keyed by the results' content hash), and the
+# worker threads DOCX files are built on.
+EXPORT_CACHE_MAX_ENTRIES = 6
+EXPORT_WORKERS = 2
+
+# --- PROMPT TOKEN BUDGETS ---
+# Input-token budget per stage (system + user prompt). A prompt over budget loses its dynamic
+# constraints, least important first, until it fits; the fixed rules are never shortened. If it
+# cannot fit even without any constraint, it is sent unchanged and counted as over budget. The values are the measured
+# sizes with the longest UI inputs (1500-character query and client guidelines) and the
+# default constraint lists (12 avoid phrases, 4 sibling angles, 6 angle seeds), rounded up, so
+# only longer inputs from the CLI or the API get trimmed. None disables the budget for a stage.
+# Tokens are counted with tiktoken when it is installed and its encoding is available,
+# otherwise with a local word-piece estimate, so trimming can differ between the two.
+PROMPT_TOKEN_BUDGETS = {
+    "angles": 1150,
+    "drafting": 2050,
+    "polish": 2000,
+    "combined_drafting": 2100,
+    "combined_polish": 2700,
+}
+TOKENIZER_ENCODING = "o200k_base"
+
+# --- LLM RESPONSE CACHE ---
+# Identical requests (provider, model, full prompt, temperature, max_tokens) are answered from a
+# local SQLite store. Entries expire after the TTL; the least recently used ones are evicted
+# once either the entry or the byte limit is exceeded.
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.sqlite3")
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+RESPONSE_CACHE_STAGES = {
+    "angles": True,
+    "drafting": True,
+    "polish": True,
+    "combined_drafting": True,
+    "combined_polish": True,
+}
+
+# --- RECORD/REPLAY CASSETTES (src/cassette.py) ---
+# "record": every provider HTTP exchange is appended to a gzipped JSONL cassette; "replay":
+# requests are answered from the cassettes without touching the network, and a request that
+# was never recorded gets a 404. None: off. "{pid}" in the path is the process id when
+# recording (one file per worker process) and "*" when replaying (all of them). Replayed
+# responses wait CASSETTE_LATENCY_SCALE times their recorded latency: 0 for full speed, 1 for
+# the recorded timing. While a cassette is on, the response cache and the angle index live in
+# memory only, so every API call of the run reaches the cassette.
+CASSETTE_MODE = get_setting("HARO_CASSETTE") or None
+CASSETTE_PATH = get_setting("HARO_CASSETTE_PATH", os.path.join(CACHE_DIR, "cassettes", "{pid}.jsonl.gz"))
+CASSETTE_LATENCY_SCALE = float(get_setting("HARO_CASSETTE_LATENCY_SCALE", "0"))
+
+# --- ANGLE INDEX ---
+# Past queries and the angles delivered for them, matched to new queries by hashed TF-IDF
+# similarity. When the closest past queries are above the reuse threshold and have enough angles
+# not yet delivered to the same client, those are used without an API call; matches above the
+# seed threshold are passed to the angle prompt as examples instead.
+ANGLE_INDEX_ENABLED = True
+ANGLE_INDEX_PATH = os.path.join(CACHE_DIR, "angle_index.sqlite3")
+ANGLE_INDEX_MAX_ENTRIES = 1000
+ANGLE_INDEX_HASH_FEATURES = 2 ** 12
+# Single words: rewordings of a query keep most of its words but few of its word pairs.
+ANGLE_INDEX_NGRAM_RANGE = (1, 1)
+ANGLE_INDEX_MAX_MATCHES = 3
+ANGLE_INDEX_REUSE_THRESHOLD = 0.7
+ANGLE_INDEX_SEED_THRESHOLD = 0.3
+ANGLE_INDEX_MAX_SEEDS = 6
+
+# --- DRAFT VALIDATION ---
+# "validate": each draft is checked locally (src/answer_validator.py) before the polish call.
+# A draft passing every rule is used as is; one failing only locally fixable rules (layout,
+# dates, em dashes, labels) is repaired without a call; any other draft is polished with the
+# failed rules spelled out. "always": every draft is polished.
+POLISH_POLICY = get_setting("HARO_POLISH_POLICY", "validate")
+VALIDATION_PARAGRAPH_WORDS = (50, 60)
+# Flesch reading ease; drafts below it are polished to simplify the language.
+VALIDATION_MIN_READING_EASE = 50
+VALIDATION_FIX_INSTRUCTIONS = {
+    "two_paragraphs": "The draft is not exactly two paragraphs separated by one blank line.",
+    "paragraph_length": "At least one paragraph is outside 50-60 words; rebalance the content so each has 50-60 words.",
+    "no_dates": "The draft mentions a date, year or timeframe; remove it.",
+    "no_em_dashes": "The draft uses em dashes; rewrite those sentences without them.",
+    "no_labels": "The draft contains a label, intro phrase or list; return plain prose only.",
+    "no_negative_phrases": "The draft uses a phrase it must avoid; replace it with original wording.",
+    "readability": "The draft reads as too complex; use shorter sentences and simpler words.",
+}
+
 # --- FIXED NEGATIVE EXAMPLES AND OPENING SENTENCE CONSTRAINTS ---
 FIXED_NEGATIVE_EXAMPLES_PROMPT_PART = """
 Specifically AVOID common phrases like "smooth shopping space," "turning casual Browse into buying," "jumped X% conversions," "without leaving their favorite apps." Also, do NOT use generic examples like "eco-friendly water bottles," "fashion lookbook", or "swimwear."
@@ -33,8 +265,16 @@ The first sentence of *each variant* must be *radically different* in structure
 PERPLEXITY_PROMPT_TEMPLATE = """Your task is to generate exactly one distinct, expert answer. The answer must be written {RESEARCH_ANGLE}. The answer must be completely unique in viewpoint, content, and details—do not repeat insights, stories, or angles. Start the answer directly with the expert information, using clear, authoritative language. Do not include conversational filler or introductory phrases. Do not include "Variant X:", "Variant [number]:", numbered lists, or any other explicit variant labeling in your output. Only provide facts or insights without mentioning any dates, years, or timeframes. Never reference "2025" or any year in the output."""
 
 
+# The drafting and polish prompts are split into a static prefix (identical on every call) and
+# a suffix template holding everything that varies per call. Only the suffix goes through
+# str.format(). Both providers only cache prompt prefixes of at least PROMPT_CACHE_MIN_TOKENS;
+# the prefixes below are about 960 tokens, so today no call is served from the provider cache
+# and no Anthropic cache breakpoint is sent. Keep per-call details out of the prefix when
+# editing the rules, so a prefix that grows past the minimum starts being cached.
+PROMPT_CACHE_MIN_TOKENS = 1024
+
 # FIX IS HERE: Aggressive Claude prompt for humanization, storytelling, WITHOUT attribution
-CLAUDE_PROMPT_TEMPLATE = f"""You are an exceptional expert writer for HARO responses. Your primary goal is to draft a uniquely compelling and deeply humanized 2-paragraph answer, drawing directly from the HARO query and the specified unique angle. Prioritize sounding genuinely human, relatable, and insightful over rigid formality.
+CLAUDE_PROMPT_PREFIX = f"""You are an exceptional expert writer for HARO responses. Your primary goal is to draft a uniquely compelling and deeply humanized 2-paragraph answer, drawing directly from the HARO query and the specified unique angle. Prioritize sounding genuinely human, relatable, and insightful over rigid formality.
 
 --- STRICT RULES (Prioritize Humanization & Storytelling) ---
 1. **Human Tone & Conversational Flow (CRITICAL):** The tone MUST be human, casual, and emotionally intelligent—like a seasoned expert sharing a genuine, relatable insight with a smart friend. Focus on natural conversational rhythm. Use active voice and first-person plural (we, our, us) where possible. Incorporate contractions naturally.
@@ -44,23 +284,28 @@ CLAUDE_PROMPT_TEMPLATE = f"""You are an exceptional expert writer for HARO respo
 5. **Format:** Provide EXACTLY two paragraphs per answer. Ensure a clear, single blank line separates the two paragraphs. Each paragraph MUST be 50-60 words (aim for four sentences per paragraph). Each sentence MUST be 10-15 words maximum.
 6. **No Fluff/Robotic Language:** Avoid fluff, clichés, robotic language, bullet points, numbered lists, and em dashes.
 7. **No Labels/Intros:** NEVER include any variant labels (e.g., "Variant 1:"), numbered lists, or introductory phrases (e.g., "Here is the answer:").
-8. **EXTREME DISTINCTNESS (CRITICAL):** Each of the {{NUM_VARIANTS}} answers for this query MUST be 100% distinct in content, viewpoint, and starting sentence. Ensure absolutely no overlap in core ideas or examples across answers for the same HARO query. This specific answer is for Variant {{VARIANT_NUM}}, and it MUST be unique from Variants 1-{{PREVIOUS_VARIANT_MAX_NUM}}.
+8. **EXTREME DISTINCTNESS (CRITICAL):** Each of the {NUM_VARIANTS_PER_QUERY} answers for this query MUST be 100% distinct in content, viewpoint, and starting sentence. Ensure absolutely no overlap in core ideas or examples across answers for the same HARO query. The variant number and the variants it must differ from are given below.
 9. **OPENING SENTENCE MANDATE:** {OPENING_SENTENCE_CONSTRAINT_PROMPT_PART.strip()}
-10. **NEGATIVE CONSTRAINT:** {FIXED_NEGATIVE_EXAMPLES_PROMPT_PART.strip()} {{DYNAMIC_NEGATIVE_CONSTRAINTS}} Focus ONLY on the unique angle provided.
+10. **NEGATIVE CONSTRAINT:** {FIXED_NEGATIVE_EXAMPLES_PROMPT_PART.strip()} Also avoid any additional phrases listed below. Focus ONLY on the unique angle provided.
 11. **No Dates/Timeframes:** Do not mention dates or timeframes.
+"""
+
+CLAUDE_PROMPT_SUFFIX_TEMPLATE = """--- VARIANT ---
+This specific answer is for Variant {VARIANT_NUM}, and it MUST be unique from Variants 1-{PREVIOUS_VARIANT_MAX_NUM}.
+{DYNAMIC_NEGATIVE_CONSTRAINTS}
 
 --- CONTEXT ---
-HARO Query: {{QUERY}}
-Client Info: {{CLIENT_INFO}}
-General Guidelines: {{GENERAL_INSTRUCTIONS}}
-Unique Angle for This Variant: {{ANGLE}}
+HARO Query: {QUERY}
+Client Info: {CLIENT_INFO}
+General Guidelines: {GENERAL_INSTRUCTIONS}
+Unique Angle for This Variant: {ANGLE}
 --- END ---
 
 Your response must be EXACTLY what goes into a Google Sheet cell. No extra lines, no variant number. Just the answer, nothing else. Crucially, ensure your response consists of two distinct paragraphs, separated by a blank line, and nothing more or less.
 """
 
 # FIX IS HERE: Greatly strengthened OpenAI prompt for humanization and jargon reduction, preserving new elements, WITHOUT attribution
-OPENAI_PROMPT_TEMPLATE = f"""You are the final humanization, simplification, and authenticity expert. Your singular mission is to refine the provided draft to be **indistinguishable from genuine human writing, utterly free of jargon, highly relatable, and perfectly preserving the core anecdote**.
+OPENAI_PROMPT_PREFIX = f"""You are the final humanization, simplification, and authenticity expert. Your singular mission is to refine the provided draft to be **indistinguishable from genuine human writing, utterly free of jargon, highly relatable, and perfectly preserving the core anecdote**.
 
 --- YOUR PRIMARY & MOST CRITICAL TASK (Highest Priority) ---
 * **100% Humanization & Authenticity:** Ensure the text reads as if a highly knowledgeable, empathetic, and engaging human expert wrote it. It must flow naturally, conversationally, and with genuine warmth. Inject natural contractions and common, clear phrasing. Re-emphasize first-person plural (we, our, us) where appropriate to maintain a company-level voice.
@@ -74,19 +319,54 @@ OPENAI_PROMPT_TEMPLATE = f"""You are the final humanization, simplification, and
 2.  **Core Content Preservation:** Absolutely preserve the original meaning, all facts, and the overall structure. You are refining language, *not* rewriting content or removing important details.
 3.  **No Labels/Intros:** NEVER include any variant labels (e.g., "Variant 1:"), numbered lists, or introductory phrases (e.g., "Here is the refined answer:"). Return ONLY the two refined paragraphs.
 4.  **CRITICAL DISTINCTNESS:** This refined answer must adhere perfectly to its unique angle. ABSOLUTELY AVOID ANY REPETITION IN CORE CONCEPTS, OPENING LINES, OR KEY TAKEAWAYS that might appear in other potential variants for the same HARO query. Ensure it feels 100% distinct.
-5.  **NEGATIVE EXAMPLES TO AVOID (for this *specific* query):** {FIXED_NEGATIVE_EXAMPLES_PROMPT_PART.strip()} {{DYNAMIC_NEGATIVE_CONSTRAINTS}} Your focus is on polishing the *unique content* from the draft.
+5.  **NEGATIVE EXAMPLES TO AVOID (for this *specific* query):** {FIXED_NEGATIVE_EXAMPLES_PROMPT_PART.strip()} Also avoid any additional phrases listed below. Your focus is on polishing the *unique content* from the draft.
 6.  **No Dates/Timeframes:** Do not mention dates or timeframes.
-7.  **OPENING SENTENCE CONSTRAINT:** {OPENING_SENTENCE_CONSTRAINT_PROMPT_PART.strip()} General Guidelines: {{GENERAL_INSTRUCTIONS}}
+7.  **OPENING SENTENCE CONSTRAINT:** {OPENING_SENTENCE_CONSTRAINT_PROMPT_PART.strip()}
+"""
+
+OPENAI_PROMPT_SUFFIX_TEMPLATE = """{DYNAMIC_NEGATIVE_CONSTRAINTS}
 
 --- CONTEXT ---
-HARO Query: {{QUERY}}
-Client Info: {{CLIENT_INFO}}
-Draft to Refine: {{ANSWER}}
+HARO Query: {QUERY}
+Client Info: {CLIENT_INFO}
+General Guidelines: {GENERAL_INSTRUCTIONS}
+Draft to Refine: {ANSWER}
 --- END ---
 
 Return the refined two paragraphs only.
 """
 
+# "combined" mode: the same static prefixes, with one suffix covering every variant. Each
+# answer is tagged "[Variant N]" in the prompt and returned as {"variant": N, "answer": ...}.
+COMBINED_CLAUDE_PROMPT_SUFFIX_TEMPLATE = """--- ALL VARIANTS ---
+Write all {NUM_VARIANTS} answers for this query at once, one for each angle below. Every rule above applies to each answer on its own. You can see all of them, so make sure no two answers share an opening sentence, anecdote, example or key takeaway.
+{DYNAMIC_NEGATIVE_CONSTRAINTS}
+
+--- CONTEXT ---
+HARO Query: {QUERY}
+Client Info: {CLIENT_INFO}
+General Guidelines: {GENERAL_INSTRUCTIONS}
+Angles:
+{ANGLES}
+--- END ---
+
+Submit every answer with its variant number. Each answer is exactly what goes into a Google Sheet cell: two paragraphs separated by a blank line, no variant number, no label, nothing else.
+"""
+
+COMBINED_OPENAI_PROMPT_SUFFIX_TEMPLATE = """Refine each of the drafts below on its own, following every rule above. You can see all of them, so also remove any opening, anecdote or phrase that two of them share.
+{DYNAMIC_NEGATIVE_CONSTRAINTS}
+
+--- CONTEXT ---
+HARO Query: {QUERY}
+Client Info: {CLIENT_INFO}
+General Guidelines: {GENERAL_INSTRUCTIONS}
+Drafts to Refine:
+{ANSWERS}
+--- END ---
+
+Return a JSON object {{"variants": [{{"variant": N, "answer": "..."}}]}} with one entry per draft above, keeping its variant number. Each answer is the refined two paragraphs only.
+"""
+
 ANGLE_GENERATION_PROMPT = """You are a creative strategist specializing in HARO responses.
 For the given journalist query, generate {NUM_VARIANTS} entirely unique and distinct angles or perspectives from which an expert could answer.
 Each angle must be:
@@ -102,4 +382,9 @@ Journalist Query:
 
 Client Info:
 {CLIENT_INFO}
+"""
+
+ANGLE_SEEDS_PROMPT_PART = """
+Angles written for similar past queries (for other clients). Adapt the strongest ones to this query and client where they fit, but every angle must still answer this exact query:
+{SEEDS}
 """
\ No newline at end of file
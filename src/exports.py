@@ -0,0 +1,219 @@
+# src/exports.py
+"""
+TXT / CSV / DOCX exports of processing results.
+
+The builders are plain functions of the results, so the UI and the batch CLI share them.
+ExportCache memoizes the built files by a key identifying the result set (a content hash from
+results_fingerprint, or the app's loaded job and its finish time), so Streamlit reruns
+reuse them instead of rebuilding, and builds DOCX files on a worker thread. python-docx is
+only imported when the first DOCX file is built.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import EXPORT_CACHE_MAX_ENTRIES, EXPORT_WORKERS
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+CSV_COLUMNS = [
+    "Query ID", "Query Text", "Client Name", "Client Guidelines",
+    "Variant Number", "Angle", "Final Answer", "Status",
+]
+CSV_DEBUG_COLUMNS = [
+    "Research Output (Debug)", "Draft Output (Debug)",
+    "Negative Constraints Applied (Previous Final Answers)",
+]
+
+
+def results_fingerprint(results, client_info_map=None):
+    """Content hash of a result set; equal results give equal keys across reruns and sessions."""
+    payload = json.dumps([results, client_info_map or {}], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def build_text_export(results, include_debug=False):
+    parts = []
+    for query_result in results:
+        client_info = query_result['client_info']
+        parts.append(f"=== Query ID: {query_result['query_id']} ===\n")
+        parts.append(f"Query: {query_result['query_text']}\n")
+        parts.append(f"Client Name: {client_info.get('name', 'N/A')}\n")
+        if include_debug or len(client_info.get('guidelines', '')) < 200:
+            parts.append(f"Client Guidelines:\n{client_info.get('guidelines', 'N/A')}\n\n")
+        else:
+            parts.append("Client Guidelines: (See DOCX/CSV for full details)\n\n")
+
+        for i, variant in enumerate(query_result['variants']):
+            parts.append(f"--- Variant {i+1} (Angle: {variant['angle']}) ---\n")
+            parts.append(f"Status: {variant['status']}\n")
+            parts.append(f"\nFinal Answer:\n{variant['final_answer']}\n\n")
+            if include_debug:
+                parts.append(f"Research Output:\n{variant['research_output']}\n\n")
+                parts.append(f"Draft Output:\n{variant['draft']}\n\n")
+                parts.append(f"Negative Constraints Applied (Previous Final Answers):\n{', '.join(variant['negative_constraints_applied'])}\n\n")
+            parts.append("---\n\n")
+        parts.append("\n\n")
+    return "".join(parts).encode('utf-8')
+
+
+def iter_csv_rows(results, include_debug=False):
+    """One list per variant, in CSV_COLUMNS (+ CSV_DEBUG_COLUMNS) order."""
+    for query_result in results:
+        client_info = query_result['client_info']
+        for i, variant in enumerate(query_result['variants']):
+            row = [
+                query_result['query_id'], query_result['query_text'],
+                client_info.get('name', 'N/A'), client_info.get('guidelines', 'N/A'),
+                i + 1, variant['angle'], variant['final_answer'], variant['status'],
+            ]
+            if include_debug:
+                row += [variant['research_output'], variant['draft'], ' '.join(variant['negative_constraints_applied'])]
+            yield row
+
+
+def write_csv_export(results, stream, include_debug=False):
+    """
+    Streams the CSV to a text stream row by row, so `results` can be a generator over a
+    file larger than memory. The format matches the former pandas to_csv(index=False) output.
+    """
+    writer = csv.writer(stream, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS + (CSV_DEBUG_COLUMNS if include_debug else []))
+    writer.writerows(iter_csv_rows(results, include_debug))
+
+
+def build_csv_export(results, include_debug=False):
+    buffer = io.StringIO()
+    write_csv_export(results, buffer, include_debug)
+    return buffer.getvalue().encode('utf-8')
+
+
+def build_docx_export(results, include_debug=False, client_info_map=None):
+    # python-docx is imported on first use, so the CLI and workers never load it.
+    from docx import Document
+    from docx.shared import Pt
+    from docx.enum.section import WD_SECTION_START
+
+    document = Document()
+    document.add_heading('HARO Automation Results', 0)
+
+    if client_info_map:
+        document.add_heading('Client Information Summary', level=1)
+        for q_id, info in client_info_map.items():
+            document.add_paragraph(f"**Query {q_id} Client:** {info.get('name', 'N/A')}")
+            guidelines_para = document.add_paragraph(f"Guidelines: {info.get('guidelines', 'N/A')}")
+            guidelines_para.runs[0].font.size = Pt(10)
+            document.add_paragraph("")
+        document.add_page_break()
+
+    for query_result in results:
+        document.add_section(WD_SECTION_START.NEW_PAGE)
+
+        document.add_heading(f"Query {query_result['query_id']}: {query_result['query_text'][:100]}...", level=1)
+        document.add_paragraph(f"**Client Name:** {query_result['client_info'].get('name', 'N/A')}")
+
+        document.add_heading('Original Query & Guidelines (for context)', level=3)
+        document.add_paragraph(f"**Original HARO Query:**\n{query_result['query_text']}")
+        document.add_paragraph(f"**Client-Specific Guidelines:**\n{query_result['client_info'].get('guidelines', 'N/A')}")
+        document.add_paragraph("")
+
+        for i, variant in enumerate(query_result['variants']):
+            document.add_heading(f"Variant {i+1} (Angle: {variant['angle']})", level=2)
+            document.add_paragraph(f"**Status:** {variant['status']}")
+
+            document.add_heading('Final Answer', level=3)
+            for paragraph_text in variant['final_answer'].split('\n\n'):
+                if paragraph_text.strip():
+                    p = document.add_paragraph(paragraph_text.strip())
+                    p.paragraph_format.first_line_indent = Pt(0)
+
+            if include_debug:
+                document.add_heading('Research Output (Debug)', level=3)
+                document.add_paragraph(variant['research_output'])
+                document.add_heading('Draft Output (Debug)', level=3)
+                for paragraph_text in variant['draft'].split('\n\n'):
+                    if paragraph_text.strip():
+                        document.add_paragraph(paragraph_text.strip())
+                document.add_paragraph(f"**Negative Constraints Applied (Previous Final Answers):** {', '.join(variant['negative_constraints_applied'])}")
+
+            document.add_paragraph("---")
+
+    bio = io.BytesIO()
+    document.save(bio)
+    return bio.getvalue()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="haro-export")
+        return _executor
+
+
+class ExportCache:
+    """
+    Built export files keyed by (result set, format, debug flag). Each file is built at most
+    once per key; the least recently used ones are dropped past `max_entries`.
+    """
+
+    def __init__(self, max_entries=EXPORT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._artifacts = OrderedDict()
+        self._pending = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._artifacts.get(key)
+            if data is not None:
+                self._artifacts.move_to_end(key)
+            return data
+
+    def _store(self, key, data):
+        with self._lock:
+            self._artifacts[key] = data
+            self._artifacts.move_to_end(key)
+            while len(self._artifacts) > self.max_entries:
+                self._artifacts.popitem(last=False)
+
+    def build_in_background(self, key, builder, *args):
+        """Starts building `key` on the export thread pool unless it is cached or already running."""
+        with self._lock:
+            if key in self._artifacts or key in self._pending:
+                return
+            future = _get_executor().submit(builder, *args)
+            self._pending[key] = future
+            self._errors.pop(key, None)
+        # Outside the lock: the callback runs immediately if the build already finished.
+        future.add_done_callback(lambda done: self._finish(key, done))
+
+    def _finish(self, key, future):
+        error = future.exception()
+        if error is None:
+            self._store(key, future.result())
+        else:
+            logger.error(f"Export build {key} failed: {error}")
+        with self._lock:
+            self._pending.pop(key, None)
+            if error is not None:
+                self._errors[key] = error
+
+    def is_building(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def error(self, key):
+        """The exception of the last failed background build for `key`, if any."""
+        with self._lock:
+            return self._errors.get(key)
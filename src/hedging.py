@@ -0,0 +1,54 @@
+# src/hedging.py
+
+import collections
+import math
+
+from src.config import HEDGE_LATENCY_WINDOW, HEDGE_MIN_SAMPLES
+
+
+class LatencyTracker:
+    """Durations of the most recent successful calls of one stage."""
+
+    def __init__(self, window=HEDGE_LATENCY_WINDOW, min_samples=HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._durations = collections.deque(maxlen=window)
+
+    def record(self, seconds):
+        self._durations.append(seconds)
+
+    def percentile(self, fraction):
+        """Nearest-rank percentile of the recent durations, or None until `min_samples` are known."""
+        if len(self._durations) < self.min_samples:
+            return None
+        values = sorted(self._durations)
+        return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def _text_of(content):
+    """Plain text of a message content or system prompt given as a string or as content blocks."""
+    if isinstance(content, list):
+        return "".join(str(block.get("text", "")) for block in content)
+    return content or ""
+
+
+def convert_request(request, from_provider, to_provider, model):
+    """
+    Rewrites a request built for `from_provider` as a request to `model` on `to_provider`,
+    keeping the prompts, temperature and max_tokens. Used for fallback hedges, e.g. an
+    OpenAI draft when Claude stalls.
+    """
+    if from_provider == "anthropic":
+        system = _text_of(request.get("system"))
+        messages = [{"role": m["role"], "content": _text_of(m["content"])} for m in request["messages"]]
+    else:
+        system = "\n\n".join(_text_of(m["content"]) for m in request["messages"] if m["role"] == "system")
+        messages = [{"role": m["role"], "content": _text_of(m["content"])} for m in request["messages"] if m["role"] != "system"]
+
+    converted = {"model": model, "max_tokens": request.get("max_tokens"), "temperature": request.get("temperature")}
+    if to_provider == "anthropic":
+        if system:
+            converted["system"] = system
+        converted["messages"] = messages
+    else:
+        converted["messages"] = ([{"role": "system", "content": system}] if system else []) + messages
+    return converted
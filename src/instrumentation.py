@@ -0,0 +1,262 @@
+# src/instrumentation.py
+
+import asyncio
+import contextlib
+import math
+import threading
+import time
+
+from src.config import MODEL_PRICES_PER_MILLION_TOKENS, METRICS_EXPORTER, METRICS_PORT
+from src.utils import get_logger
+
+try:
+    import prometheus_client
+except ImportError:  # Optional: only needed for METRICS_EXPORTER = "prometheus".
+    prometheus_client = None
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:  # Optional: only needed for METRICS_EXPORTER = "opentelemetry".
+    otel_metrics = None
+
+logger = get_logger(__name__)
+
+
+class Span:
+    """Duration, attempts, token usage and cost of one pipeline stage call."""
+
+    def __init__(self, stage, provider=None, model=None):
+        self.stage = stage
+        self.provider = provider
+        self.model = model
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_seconds = None
+        self.attempts = 0
+        self.cache_hit = False
+        # True for the duplicate or fallback request a hedged call starts next to the original.
+        self.hedge = False
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+        self.status = "ok"
+        self.error = None
+
+    def record_attempt(self):
+        self.attempts += 1
+
+    def record_usage(self, cached_input_tokens, uncached_input_tokens, output_tokens):
+        self.cached_input_tokens = cached_input_tokens
+        self.input_tokens = cached_input_tokens + uncached_input_tokens
+        self.output_tokens = output_tokens
+
+    def finish(self, error=None):
+        self.duration_seconds = time.perf_counter() - self._started
+        if isinstance(error, asyncio.CancelledError):
+            self.status = "cancelled"
+        elif error is not None:
+            self.status = "error"
+            self.error = str(error)
+
+    @property
+    def cost_usd(self):
+        prices = MODEL_PRICES_PER_MILLION_TOKENS.get(self.model)
+        if not prices:
+            return 0.0
+        uncached = self.input_tokens - self.cached_input_tokens
+        return (
+            uncached * prices["input"]
+            + self.cached_input_tokens * prices["cached_input"]
+            + self.output_tokens * prices["output"]
+        ) / 1_000_000
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "provider": self.provider,
+            "model": self.model,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration_seconds or 0.0, 4),
+            "attempts": self.attempts,
+            "retries": max(0, self.attempts - 1),
+            "cache_hit": self.cache_hit,
+            "hedge": self.hedge,
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+@contextlib.contextmanager
+def record_span(stage, provider=None, model=None, spans=None):
+    """
+    Times the block as one Span. On exit the span is appended to `spans` (as a dict), logged
+    and handed to the configured metrics exporter; errors are recorded and re-raised.
+    """
+    span = Span(stage, provider, model)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(e)
+        _publish(span, spans)
+        raise
+    span.finish()
+    _publish(span, spans)
+
+
+def _publish(span, spans):
+    span_dict = span.to_dict()
+    if spans is not None:
+        spans.append(span_dict)
+    if span.provider is not None:
+        logger.info(
+            f"{span.stage} ({span.provider}) {span.status} in {span_dict['duration_seconds']:.2f}s: "
+            f"{span.attempts} attempt(s), {span.input_tokens} in / {span.output_tokens} out tokens, "
+            f"${span_dict['cost_usd']:.4f}{' (cache hit)' if span.cache_hit else ''}"
+        )
+    exporter = get_metrics_exporter()
+    if exporter is not None:
+        try:
+            exporter.export(span_dict)
+        except Exception as e:
+            logger.warning(f"Exporting a {span.stage} span failed: {e}")
+
+
+# --- Per-run summaries ---
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+def iter_result_spans(query_result):
+    """The query-level spans (angles) followed by the spans of every variant."""
+    yield from query_result.get("spans", [])
+    for variant in query_result.get("variants", []):
+        yield from variant.get("spans", [])
+
+def summarize_results(query_results):
+    """
+    Aggregates the spans of a run's query results: per stage (calls, errors, retries, cache
+    hits, hedges and the ones that won, cancelled losers, p50/p95 and total seconds, tokens,
+    cost) and the cost per client.
+    """
+    durations = {}
+    stages = {}
+    clients = {}
+    for query_result in query_results:
+        client_name = query_result.get("client_info", {}).get("name", "N/A")
+        for span in iter_result_spans(query_result):
+            stats = stages.setdefault(span["stage"], {
+                "calls": 0, "errors": 0, "retries": 0, "cache_hits": 0, "hedges": 0, "hedge_wins": 0,
+                "cancelled": 0, "total_seconds": 0.0,
+                "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(span["status"] == "error")
+            stats["retries"] += span["retries"]
+            stats["cache_hits"] += int(span["cache_hit"])
+            stats["hedges"] += int(span.get("hedge", False))
+            stats["hedge_wins"] += int(span.get("hedge", False) and span["status"] == "ok")
+            stats["cancelled"] += int(span["status"] == "cancelled")
+            stats["total_seconds"] += span["duration_seconds"]
+            stats["input_tokens"] += span["input_tokens"]
+            stats["cached_input_tokens"] += span["cached_input_tokens"]
+            stats["output_tokens"] += span["output_tokens"]
+            stats["cost_usd"] += span["cost_usd"]
+            durations.setdefault(span["stage"], []).append(span["duration_seconds"])
+            clients[client_name] = clients.get(client_name, 0.0) + span["cost_usd"]
+
+    for stage, stats in stages.items():
+        values = sorted(durations[stage])
+        stats["p50_seconds"] = _percentile(values, 0.50)
+        stats["p95_seconds"] = _percentile(values, 0.95)
+    return {
+        "stages": stages,
+        "clients": dict(sorted(clients.items(), key=lambda item: item[1], reverse=True)),
+        "cost_usd": sum(stats["cost_usd"] for stats in stages.values()),
+    }
+
+
+# --- Optional metrics exporters ---
+
+def _span_labels(span):
+    return {
+        "stage": span["stage"],
+        "provider": span["provider"] or "",
+        "model": span["model"] or "",
+        "status": span["status"],
+    }
+
+
+class PrometheusExporter:
+    """Span metrics in the prometheus_client default registry, served on /metrics at `port`."""
+
+    def __init__(self, port):
+        label_names = ["stage", "provider", "model", "status"]
+        self.duration = prometheus_client.Histogram(
+            "haro_stage_duration_seconds", "Duration of pipeline stage calls.", label_names,
+            buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+        )
+        self.retries = prometheus_client.Counter("haro_stage_retries", "Retried API attempts.", label_names)
+        self.tokens = prometheus_client.Counter("haro_stage_tokens", "Tokens used by stage calls.", label_names + ["kind"])
+        self.cost = prometheus_client.Counter("haro_stage_cost_usd", "Estimated cost of stage calls in USD.", label_names)
+        prometheus_client.start_http_server(port)
+        logger.info(f"Prometheus metrics served on port {port}.")
+
+    def export(self, span):
+        labels = _span_labels(span)
+        self.duration.labels(**labels).observe(span["duration_seconds"])
+        self.retries.labels(**labels).inc(span["retries"])
+        self.tokens.labels(**labels, kind="cached_input").inc(span["cached_input_tokens"])
+        self.tokens.labels(**labels, kind="uncached_input").inc(span["input_tokens"] - span["cached_input_tokens"])
+        self.tokens.labels(**labels, kind="output").inc(span["output_tokens"])
+        self.cost.labels(**labels).inc(span["cost_usd"])
+
+
+class OpenTelemetryExporter:
+    """Span metrics recorded on the globally configured OpenTelemetry meter provider."""
+
+    def __init__(self):
+        meter = otel_metrics.get_meter("haro")
+        self.duration = meter.create_histogram("haro.stage.duration", unit="s", description="Duration of pipeline stage calls.")
+        self.retries = meter.create_counter("haro.stage.retries", description="Retried API attempts.")
+        self.tokens = meter.create_counter("haro.stage.tokens", description="Tokens used by stage calls.")
+        self.cost = meter.create_counter("haro.stage.cost", unit="USD", description="Estimated cost of stage calls.")
+
+    def export(self, span):
+        labels = _span_labels(span)
+        self.duration.record(span["duration_seconds"], labels)
+        self.retries.add(span["retries"], labels)
+        self.tokens.add(span["cached_input_tokens"], {**labels, "kind": "cached_input"})
+        self.tokens.add(span["input_tokens"] - span["cached_input_tokens"], {**labels, "kind": "uncached_input"})
+        self.tokens.add(span["output_tokens"], {**labels, "kind": "output"})
+        self.cost.add(span["cost_usd"], labels)
+
+
+_exporter = None
+_exporter_initialized = False
+_exporter_lock = threading.Lock()
+
+def get_metrics_exporter():
+    """The process-wide exporter selected by METRICS_EXPORTER, created on first use, or None."""
+    global _exporter, _exporter_initialized
+    if _exporter_initialized:
+        return _exporter
+    with _exporter_lock:
+        if not _exporter_initialized:
+            _exporter_initialized = True
+            try:
+                if METRICS_EXPORTER == "prometheus" and prometheus_client is not None:
+                    _exporter = PrometheusExporter(METRICS_PORT)
+                elif METRICS_EXPORTER == "opentelemetry" and otel_metrics is not None:
+                    _exporter = OpenTelemetryExporter()
+                elif METRICS_EXPORTER:
+                    logger.warning(f"Metrics exporter '{METRICS_EXPORTER}' is unknown or its package is not installed; spans are not exported.")
+            except Exception as e:
+                logger.warning(f"Could not start the '{METRICS_EXPORTER}' metrics exporter: {e}")
+    return _exporter
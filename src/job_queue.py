@@ -0,0 +1,653 @@
+# src/job_queue.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import (
+    JOB_STORE_PATH, JOB_MAX_CONCURRENT_JOBS, JOB_RETENTION_SECONDS, JOB_EXECUTION_MODE, STREAM_RESPONSES
+)
+from src.ai_integrations import variants_to_retry
+from src.scheduler import priority_for
+from src.service_runtime import get_shared_runtime
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+FINISHED_JOB_STATUSES = ("done", "failed", "cancelled")
+
+# A query still to run: never finished, or finished with variants marked for a retry.
+_PENDING_QUERY = "(result IS NULL OR retry_variants IS NOT NULL)"
+
+# Job columns plus the number of finished queries, in the order _job_dict unpacks them.
+_SELECT_JOBS = (
+    "SELECT j.id, j.status, j.total_queries, j.error, j.created_at, j.started_at, j.finished_at,"
+    f" (SELECT COUNT(*) FROM job_queries q WHERE q.job_id = j.id AND NOT {_PENDING_QUERY})"
+    " FROM jobs j"
+)
+
+
+async def run_query(ai_service, query, client_info, parameters, on_event=None):
+    """
+    Runs one job query: all of its variants, or only the ones marked for a retry (merged into
+    its previous result) when the query carries "retry_variants". The service's scheduler
+    orders it by its "deadline" and the client's tier.
+    """
+    async def make_query():
+        if query.get("retry_variants"):
+            return await ai_service.retry_variants(query["previous_result"], query["retry_variants"], parameters, on_event=on_event)
+        return await ai_service.process_query_with_variants(query["id"], query["text"], client_info, parameters, on_event=on_event)
+
+    return await ai_service.scheduler.run_query(priority_for(client_info, query.get("deadline")), make_query)
+
+
+async def process_queries(ai_service, queries, client_info_map, parameters, on_event):
+    """Runs every query on `ai_service`; progress and finished queries are reported through `on_event`."""
+    tasks = []
+    variant_events = on_event if STREAM_RESPONSES else None
+
+    for i, query_data in enumerate(queries):
+        current_client_info = client_info_map.get(query_data["id"], {})
+        tasks.append(asyncio.ensure_future(
+            run_query(ai_service, query_data, current_client_info, parameters, on_event=variant_events)
+        ))
+
+    try:
+        for future in asyncio.as_completed(tasks):
+            on_event({"type": "query", "result": await future})
+    finally:
+        # A cancelled run must not leave its remaining queries running on the shared loop.
+        for task in tasks:
+            task.cancel()
+
+
+class JobStore:
+    """
+    SQLite store of submitted runs: one row per job and one per query, with each query's
+    result written as soon as it finishes. Jobs outlive the session and the process that
+    submitted them; a job left "running" by a stopped process can be requeued and resumes
+    with only its unfinished queries. A finished job can be queued again to re-run only its
+    failed or rejected variants (request_retry).
+
+    Results are read back a page at a time (load_results with offset/limit and filters) or
+    streamed (iter_results), so a large job is never held in memory whole. Each stored result
+    keeps its variants' negative constraints once per query, as references (see _pack_result).
+
+    Whole jobs are claimed by an in-process JobRunner (claim_next_job); worker processes
+    (src/worker.py) instead lease single queries (claim_queries) and renew the leases while
+    they work, so a crashed worker's queries are picked up again once its leases expire.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, retention_seconds=JOB_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Worker processes write to the same file; wait for their short transactions instead of failing.
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, parameters TEXT NOT NULL,"
+            " total_queries INTEGER NOT NULL, error TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_queries ("
+            " job_id TEXT NOT NULL, position INTEGER NOT NULL, query_id TEXT NOT NULL,"
+            " query_text TEXT NOT NULL, client_info TEXT NOT NULL, result TEXT, finished_at REAL,"
+            " lease_owner TEXT, lease_expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " retry_variants TEXT, deadline REAL, failed_variants INTEGER, PRIMARY KEY (job_id, query_id))"
+        )
+        # Stores created before query leases, variant retries, deadlines and failure counts existed.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(job_queries)")}
+        for column, definition in (
+            ("lease_owner", "TEXT"), ("lease_expires_at", "REAL"), ("attempts", "INTEGER NOT NULL DEFAULT 0"), ("retry_variants", "TEXT"),
+            ("deadline", "REAL"), ("failed_variants", "INTEGER")
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE job_queries ADD COLUMN {column} {definition}")
+        if "failed_variants" not in columns:
+            self._conn.executemany(
+                "UPDATE job_queries SET failed_variants = ? WHERE job_id = ? AND query_id = ?",
+                [
+                    (_failed_variants(json.loads(result)), job_id, query_id)
+                    for job_id, query_id, result in self._conn.execute(
+                        "SELECT job_id, query_id, result FROM job_queries WHERE result IS NOT NULL"
+                    ).fetchall()
+                ]
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+        self.purge_old_jobs()
+
+    def create_job(self, queries, client_info_map, parameters):
+        """Queues a job for `queries` ({"id", "text"} dicts, optionally with a "deadline" timestamp) and returns its id."""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, parameters, total_queries, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(parameters), len(queries), now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_queries (job_id, position, query_id, query_text, client_info, deadline) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, position, str(query["id"]), query["text"], json.dumps(client_info_map.get(query["id"], {})),
+                     query.get("deadline"))
+                    for position, query in enumerate(queries)
+                ]
+            )
+            self._conn.execute("COMMIT")
+        return job_id
+
+    def claim_next_job(self):
+        """
+        Marks the queued job with the earliest query deadline (else the oldest one) as running
+        and returns it, or None when the queue is empty.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT j.id, j.parameters, (SELECT MIN(q.deadline) FROM job_queries q WHERE q.job_id = j.id) AS deadline"
+                " FROM jobs j WHERE j.status = 'queued' ORDER BY deadline IS NULL, deadline, j.created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row[0]))
+        return {"id": row[0], "parameters": json.loads(row[1])}
+
+    def requeue_interrupted_jobs(self):
+        """Puts jobs a stopped process left running back in the queue; returns how many."""
+        with self._lock:
+            return self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+
+    def pending_queries(self, job_id):
+        """
+        The job's unfinished queries, earliest deadline first, and their client info by query id.
+        Queries marked for a retry also carry "retry_variants" and their "previous_result".
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT q.query_id, q.query_text, q.client_info, q.result, q.retry_variants, q.deadline FROM job_queries q"
+                f" WHERE q.job_id = ? AND {_PENDING_QUERY} ORDER BY q.deadline IS NULL, q.deadline, q.position",
+                (job_id,)
+            ).fetchall()
+        queries = [_query_dict(query_id, query_text, result, retry_variants, deadline)
+                   for query_id, query_text, _, result, retry_variants, deadline in rows]
+        client_info_map = {row[0]: json.loads(row[2]) for row in rows}
+        return queries, client_info_map
+
+    def request_retry(self, job_id, rejected=None):
+        """
+        Queues a finished job again to re-run only its failed variants, those stored as
+        rejected and the ones in `rejected` ({query_id: [variant indices]}).
+        Queries a failed or cancelled job never finished are run as well. Each query's result
+        is replaced by the merged one when its retry finishes. Returns how many variants were
+        marked (0 leaves the job untouched unless it has unfinished queries).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None or row[0] not in FINISHED_JOB_STATUSES:
+                    self._conn.execute("ROLLBACK")
+                    return 0
+                marks = []
+                for query_id, result in self._conn.execute(
+                    "SELECT query_id, result FROM job_queries WHERE job_id = ? AND result IS NOT NULL", (job_id,)
+                ).fetchall():
+                    indices = set(variants_to_retry(json.loads(result))) | set((rejected or {}).get(query_id, ()))
+                    if indices:
+                        marks.append((json.dumps(sorted(indices)), job_id, query_id))
+                self._conn.executemany(
+                    "UPDATE job_queries SET retry_variants = ?, attempts = 0, lease_owner = NULL, lease_expires_at = NULL"
+                    " WHERE job_id = ? AND query_id = ?",
+                    marks
+                )
+                unfinished = self._conn.execute(
+                    "SELECT COUNT(*) FROM job_queries WHERE job_id = ? AND result IS NULL", (job_id,)
+                ).fetchone()[0]
+                if marks or unfinished:
+                    self._conn.execute("UPDATE job_queries SET attempts = 0 WHERE job_id = ? AND result IS NULL", (job_id,))
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'queued', error = NULL, finished_at = NULL WHERE id = ?", (job_id,)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return sum(len(json.loads(mark[0])) for mark in marks)
+
+    def claim_queries(self, worker_id, limit, lease_seconds, max_attempts):
+        """
+        Leases up to `limit` unfinished queries of queued or running jobs (earliest query
+        deadline first, then oldest job first)
+        to `worker_id` for `lease_seconds`, and returns them with their job's parameters.
+        A query whose lease expired `max_attempts` times fails its whole job.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job_id, query_id in self._conn.execute(
+                    "SELECT q.job_id, q.query_id FROM job_queries q JOIN jobs j ON j.id = q.job_id"
+                    " WHERE j.status IN ('queued', 'running') AND (q.result IS NULL OR q.retry_variants IS NOT NULL) AND q.attempts >= ?"
+                    " AND (q.lease_expires_at IS NULL OR q.lease_expires_at < ?)",
+                    (max_attempts, now)
+                ).fetchall():
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (f"Query {query_id} was not finished after {max_attempts} attempts.", now, job_id)
+                    )
+                rows = self._conn.execute(
+                    "SELECT q.job_id, q.query_id, q.query_text, q.client_info, j.parameters, q.result, q.retry_variants, q.deadline"
+                    " FROM job_queries q JOIN jobs j ON j.id = q.job_id"
+                    " WHERE j.status IN ('queued', 'running') AND (q.result IS NULL OR q.retry_variants IS NOT NULL)"
+                    " AND (q.lease_expires_at IS NULL OR q.lease_expires_at < ?)"
+                    " ORDER BY q.deadline IS NULL, q.deadline, j.created_at, q.position LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE job_queries SET lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1"
+                    " WHERE job_id = ? AND query_id = ?",
+                    [(worker_id, now + lease_seconds, job_id, query_id) for job_id, query_id, *_ in rows]
+                )
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                    [(now, job_id) for job_id in {row[0] for row in rows}]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            {
+                "job_id": job_id,
+                "query_id": query_id,
+                "query_text": query_text,
+                "query": _query_dict(query_id, query_text, result, retry_variants, deadline),
+                "client_info": json.loads(client_info),
+                "parameters": json.loads(parameters),
+            }
+            for job_id, query_id, query_text, client_info, parameters, result, retry_variants, deadline in rows
+        ]
+
+    def renew_leases(self, worker_id, keys, lease_seconds):
+        """Heartbeat: extends `worker_id`'s leases on the (job_id, query_id) `keys`."""
+        expires_at = time.time() + lease_seconds
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_queries SET lease_expires_at = ? WHERE job_id = ? AND query_id = ? AND lease_owner = ?",
+                [(expires_at, job_id, query_id, worker_id) for job_id, query_id in keys]
+            )
+
+    def release_leases(self, worker_id, keys):
+        """Hands unfinished queries back at once, e.g. when a worker stops or a query raised."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_queries SET lease_owner = NULL, lease_expires_at = NULL"
+                f" WHERE job_id = ? AND query_id = ? AND lease_owner = ? AND {_PENDING_QUERY}",
+                [(job_id, query_id, worker_id) for job_id, query_id in keys]
+            )
+
+    def save_result(self, job_id, result):
+        """
+        Stores a query's result (replacing the previous one after a variant retry); the first
+        result wins if an expired lease let two workers run it.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_queries SET result = ?, failed_variants = ?, finished_at = ?, lease_owner = NULL,"
+                " lease_expires_at = NULL, retry_variants = NULL"
+                f" WHERE job_id = ? AND query_id = ? AND {_PENDING_QUERY}",
+                (json.dumps(_pack_result(result)), _failed_variants(result), time.time(), job_id, str(result["query_id"]))
+            )
+
+    def complete_job_if_finished(self, job_id):
+        """Marks a running job done once all of its queries have results; returns whether it did."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ? AND status = 'running'"
+                f" AND NOT EXISTS (SELECT 1 FROM job_queries WHERE job_id = ? AND {_PENDING_QUERY})",
+                (time.time(), job_id, job_id)
+            ).rowcount > 0
+
+    def finish_job(self, job_id, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def get_job(self, job_id):
+        """Status and progress of one job, or None if it does not exist (or was purged)."""
+        with self._lock:
+            row = self._conn.execute(
+                _SELECT_JOBS + " WHERE j.id = ?",
+                (job_id,)
+            ).fetchone()
+        return _job_dict(row) if row else None
+
+    def recent_jobs(self, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                _SELECT_JOBS + " ORDER BY j.created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [_job_dict(row) for row in rows]
+
+    def load_results(self, job_id, offset=0, limit=None, search=None, client=None, failed_only=False):
+        """
+        The finished query results of a job, in submission order: all of them, or the `limit`
+        after `offset` of those whose query id or text contains `search`, whose client is named
+        `client`, and (with `failed_only`) that have a failed variant.
+        """
+        where, params = _result_filter(job_id, search, client, failed_only)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT result FROM job_queries WHERE {where} ORDER BY position LIMIT ? OFFSET ?",
+                (*params, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [_unpack_result(row[0]) for row in rows]
+
+    def count_results(self, job_id, search=None, client=None, failed_only=False):
+        """The number of finished query results load_results would return without a limit."""
+        where, params = _result_filter(job_id, search, client, failed_only)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM job_queries WHERE {where}", params).fetchone()[0]
+
+    def result_clients(self, job_id):
+        """The client names of a job's finished queries, sorted."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT json_extract(client_info, '$.name') FROM job_queries"
+                " WHERE job_id = ? AND result IS NOT NULL ORDER BY 1",
+                (job_id,)
+            ).fetchall()
+        return [row[0] for row in rows if row[0] is not None]
+
+    def result_client_info(self, job_id):
+        """The client info of a job's finished queries by query id, in submission order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query_id, client_info FROM job_queries WHERE job_id = ? AND result IS NOT NULL ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        return {query_id: json.loads(client_info) for query_id, client_info in rows}
+
+    def iter_results(self, job_id, batch_size=50):
+        """All finished query results of a job in submission order, read `batch_size` rows at a time."""
+        position = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT position, result FROM job_queries WHERE job_id = ? AND result IS NOT NULL AND position > ?"
+                    " ORDER BY position LIMIT ?",
+                    (job_id, position, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for position, result in rows:
+                yield _unpack_result(result)
+
+    def purge_old_jobs(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "DELETE FROM job_queries WHERE job_id IN"
+                " (SELECT id FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?)",
+                (cutoff,)
+            )
+            purged = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?", (cutoff,)
+            ).rowcount
+            self._conn.execute("COMMIT")
+        if purged:
+            logger.info(f"Job store purged {purged} jobs older than the retention period.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _failed_variants(result):
+    return sum(1 for variant in result.get("variants", []) if variant.get("status") != "Success")
+
+
+def _pack_result(result):
+    """
+    The stored form of a query result. Sibling variants mostly avoid the same phrases or
+    angles, so each distinct constraint is kept once in the query's "constraint_texts" and a
+    variant's negative_constraints_applied holds indices into it.
+    """
+    texts, index = [], {}
+    variants = []
+    for variant in result.get("variants", []):
+        references = []
+        for text in variant.get("negative_constraints_applied", []):
+            if text not in index:
+                index[text] = len(texts)
+                texts.append(text)
+            references.append(index[text])
+        variants.append({**variant, "negative_constraints_applied": references})
+    return {**result, "variants": variants, "constraint_texts": texts}
+
+
+def _unpack_result(stored):
+    """A query result as the service returned it, from its stored JSON (packed, or from an older store)."""
+    result = json.loads(stored)
+    texts = result.pop("constraint_texts", None)
+    if texts is not None:
+        for variant in result["variants"]:
+            variant["negative_constraints_applied"] = [texts[i] for i in variant["negative_constraints_applied"]]
+    return result
+
+
+def _result_filter(job_id, search, client, failed_only):
+    """WHERE clause and parameters selecting the finished queries of a job for load_results and count_results."""
+    clauses, params = ["job_id = ?", "result IS NOT NULL"], [job_id]
+    if search:
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses.append("(query_id LIKE ? ESCAPE '\\' OR query_text LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    if client:
+        clauses.append("json_extract(client_info, '$.name') = ?")
+        params.append(client)
+    if failed_only:
+        clauses.append("failed_variants > 0")
+    return " AND ".join(clauses), params
+
+
+def _query_dict(query_id, query_text, result, retry_variants, deadline=None):
+    query = {"id": query_id, "text": query_text}
+    if deadline is not None:
+        query["deadline"] = deadline
+    if retry_variants is not None:
+        query["retry_variants"] = json.loads(retry_variants)
+        query["previous_result"] = _unpack_result(result)
+    return query
+
+
+def _job_dict(row):
+    job_id, status, total_queries, error, created_at, started_at, finished_at, completed_queries = row
+    return {
+        "id": job_id,
+        "status": status,
+        "total_queries": total_queries,
+        "completed_queries": completed_queries,
+        "error": error,
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+    }
+
+
+class JobRunner:
+    """
+    Runs queued jobs on a ServiceRuntime's background event loop, up to `max_concurrent_jobs`
+    at a time in submission order, all sharing the runtime's AIService (and so its
+    per-provider semaphores and rate limiters). Submitting returns at once; callers poll the
+    store for progress and read streamed variant text through live_previews().
+    With `dispatch=False` jobs are only queued, for worker processes (src/worker.py) to run,
+    and `runtime` may be None, so the app never starts an AIService it would not use.
+    Store calls made on the loop run on one store thread, in order, so SQLite waits (a lock
+    held by a worker process, a slow disk) never stall the API calls in flight.
+    """
+
+    def __init__(self, runtime, store=None, max_concurrent_jobs=JOB_MAX_CONCURRENT_JOBS, dispatch=True):
+        self.runtime = runtime
+        self.store = store if store is not None else JobStore()
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._live_previews = {}
+        self._live_lock = threading.Lock()
+        # Only touched on the runtime loop.
+        self._tasks = {}
+        self._cancel_requested = set()
+        self._wakeup = None
+        self._dispatcher = None
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+
+        if dispatch:
+            self._wakeup = self.runtime.run(self._create_wakeup_event())
+            requeued = self.store.requeue_interrupted_jobs()
+            if requeued:
+                logger.info(f"Resuming {requeued} interrupted jobs.")
+            self._dispatcher = self.runtime.submit(self._dispatch())
+
+    def submit(self, queries, client_info_map, parameters):
+        """Queues a run and returns its job id without waiting for it."""
+        job_id = self.store.create_job(queries, client_info_map, parameters)
+        self._notify()
+        logger.info(f"Job {job_id} queued with {len(queries)} queries.")
+        return job_id
+
+    def cancel(self, job_id):
+        if self._dispatcher is None:
+            self._cancel_in_store(job_id)  # No job runs here, so only the store changes.
+        else:
+            self.runtime.loop.call_soon_threadsafe(self._cancel, job_id)
+
+    def retry(self, job_id, rejected=None):
+        """Queues a finished job's failed variants and the `rejected` ones again (see JobStore.request_retry); returns how many."""
+        marked = self.store.request_retry(job_id, rejected)
+        self._notify()
+        if marked:
+            logger.info(f"Job {job_id} queued again to retry {marked} variants.")
+        return marked
+
+    def close(self):
+        """Stops claiming jobs. Jobs still running are requeued by the next JobRunner on this store."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+
+    def live_previews(self, job_id):
+        """The latest "draft"/"polish"/"variant" event per (query_id, variant_num) of a running job."""
+        with self._live_lock:
+            return dict(self._live_previews.get(job_id, {}))
+
+    def _notify(self):
+        """Wakes the dispatcher to claim new work; worker processes poll the store instead."""
+        if self._dispatcher is not None:
+            self.runtime.loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _create_wakeup_event(self):
+        return asyncio.Event()
+
+    async def _store_call(self, method, *args):
+        """Runs a JobStore method on the store thread and returns its result."""
+        return await asyncio.get_running_loop().run_in_executor(self._store_executor, method, *args)
+
+    def _store_submit(self, method, *args):
+        """Queues a JobStore method on the store thread without waiting for it; returns its future."""
+        return self._store_executor.submit(method, *args)
+
+    def _cancel(self, job_id):
+        task = self._tasks.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+            return
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.error(f"Job {job_id} could not be cancelled: {future.exception()}")
+        self._store_submit(self._cancel_in_store, job_id).add_done_callback(log_failure)
+
+    def _cancel_in_store(self, job_id):
+        job = self.store.get_job(job_id)
+        if job is not None and job["status"] not in FINISHED_JOB_STATUSES:
+            # Queued here, or running on worker processes: they stop claiming its queries.
+            self.store.finish_job(job_id, "cancelled")
+
+    async def _dispatch(self):
+        while True:
+            # Cleared before claiming: a submit() arriving meanwhile sets it again, so no job is missed.
+            self._wakeup.clear()
+            while len(self._tasks) < self.max_concurrent_jobs:
+                job = await self._store_call(self.store.claim_next_job)
+                if job is None:
+                    break
+                task = asyncio.create_task(self._run_job(job))
+                self._tasks[job["id"]] = task
+                task.add_done_callback(lambda _, job_id=job["id"]: self._job_done(job_id))
+            await self._wakeup.wait()
+
+    def _job_done(self, job_id):
+        self._tasks.pop(job_id, None)
+        self._cancel_requested.discard(job_id)
+        self._wakeup.set()
+
+    async def _run_job(self, job):
+        job_id = job["id"]
+        queries, client_info_map = await self._store_call(self.store.pending_queries, job_id)
+        logger.info(f"Job {job_id} started: {len(queries)} queries to run.")
+        # Results are saved in the background as queries finish; the job only ends once they are.
+        saves = []
+
+        def on_event(event):
+            if event["type"] == "query":
+                saves.append(asyncio.wrap_future(self._store_submit(self.store.save_result, job_id, event["result"])))
+            elif event["type"] in ("draft", "polish", "variant"):
+                with self._live_lock:
+                    self._live_previews.setdefault(job_id, {})[(event["query_id"], event["variant_num"])] = event
+
+        try:
+            await process_queries(self.runtime.ai_service, queries, client_info_map, job["parameters"], on_event)
+            await asyncio.gather(*saves)
+            await self._store_call(self.store.finish_job, job_id, "done")
+            logger.info(f"Job {job_id} finished.")
+        except asyncio.CancelledError:
+            if job_id in self._cancel_requested:
+                # Queued after the results already submitted, so they are kept.
+                await self._store_call(self.store.finish_job, job_id, "cancelled")
+                logger.info(f"Job {job_id} cancelled.")
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed.")
+            await self._store_call(self.store.finish_job, job_id, "failed", str(e))
+        finally:
+            with self._live_lock:
+                self._live_previews.pop(job_id, None)
+
+
+_shared_job_runner = None
+_shared_job_runner_lock = threading.Lock()
+
+def get_shared_job_runner():
+    """Returns the process-wide JobRunner (on the shared AI runtime in "in_process" mode), starting it on first use."""
+    global _shared_job_runner
+    with _shared_job_runner_lock:
+        if _shared_job_runner is None:
+            if JOB_EXECUTION_MODE == "in_process":
+                _shared_job_runner = JobRunner(get_shared_runtime())
+            else:
+                # Worker processes run the jobs; the app only queues them and reads the store.
+                _shared_job_runner = JobRunner(None, dispatch=False)
+        return _shared_job_runner
@@ -10,155 +10,328 @@ if src_dir not in sys.path:
     sys.path.insert(0, src_dir)
 
 import streamlit as st
-import asyncio
-from ai_integrations import AIService, format_two_paragraphs, remove_variant_label_prefix, remove_dates
-from utils import get_logger
-from config import NUM_VARIANTS_PER_QUERY, CONCURRENT_AI_CALLS
-
-import pandas as pd
-from io import BytesIO
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.section import WD_SECTION_START
+from job_queue import get_shared_job_runner, FINISHED_JOB_STATUSES
+from utils import get_logger, parse_client_info
+from config import NUM_VARIANTS_PER_QUERY, JOB_POLL_SECONDS, JOB_RECENT_LIMIT, RESULTS_PAGE_SIZE, APP_CREDENTIALS
+
+from exports import ExportCache, build_text_export, build_csv_export, build_docx_export
+from instrumentation import summarize_results
 
 import json
+import math
+import time
 
 logger = get_logger(__name__)
 
-# --- Helper Functions for Output Generation and Download (unchanged) ---
+# --- Downloads (built by src/exports.py from the job store, cached per loaded job) ---
+
+def _export_key(kind):
+    # A job's results only change when a retry of it finishes, which also moves its finish time.
+    return (st.session_state.loaded_job_id, st.session_state.loaded_job_finished_at, kind, st.session_state.show_debug_outputs)
+
+def _loaded_results():
+    """The loaded job's results, streamed from the job store when an export is built."""
+    return get_shared_job_runner().store.iter_results(st.session_state.loaded_job_id)
+
+# Label, file name, MIME type and help text of each download.
+_EXPORT_FORMATS = {
+    "txt": ("TXT", "haro_responses.txt", "text/plain", "Download all generated responses as a plain text file."),
+    "csv": ("CSV", "haro_responses.csv", "text/csv", "Download all generated responses as a CSV file for spreadsheet viewing."),
+    "docx": (
+        "DOCX", "haro_responses.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "Download all generated responses in a Word Document format."
+    ),
+}
+
+def _start_export_build(kind, key):
+    results, debug = _loaded_results(), st.session_state.show_debug_outputs
+    if kind == "docx":
+        # The client summary comes from the loaded job, not from the last submitted form.
+        client_info_map = get_shared_job_runner().store.result_client_info(st.session_state.loaded_job_id)
+        st.session_state.export_cache.build_in_background(key, build_docx_export, results, debug, client_info_map)
+    else:
+        builder = build_text_export if kind == "txt" else build_csv_export
+        st.session_state.export_cache.build_in_background(key, builder, results, debug)
+
+@st.fragment(run_every=1)
+def _wait_for_export_build(key, label):
+    """Polls the background build; only this fragment reruns until the file is ready."""
+    if not st.session_state.export_cache.is_building(key):
+        st.rerun()
+    st.caption(f"Building {label}...")
+
+def render_export_download(kind):
+    """
+    Exports read every result of the job, so a file is only built on request, on a worker
+    thread, instead of on every rerun that shows the results.
+    """
+    label, file_name, mime, help_text = _EXPORT_FORMATS[kind]
+    export_cache = st.session_state.export_cache
+    key = _export_key(kind)
+    data = export_cache.get(key)
+    if data is not None:
+        st.download_button(label=f"Download as {label}", data=data, file_name=file_name, mime=mime, help=help_text)
+    elif export_cache.is_building(key):
+        _wait_for_export_build(key, label)
+    else:
+        if export_cache.error(key):
+            st.error(f"Building the {label} failed: {export_cache.error(key)}")
+        st.button(
+            f"Prepare {label}", key=f"prepare_{kind}", on_click=_start_export_build, args=(kind, key),
+            help=f"Build a {label} file with all generated responses."
+        )
 
-def generate_text_output(all_results_with_variants):
-    output_str = ""
-    for query_result in all_results_with_variants:
-        output_str += f"=== Query ID: {query_result['query_id']} ===\n"
-        output_str += f"Query: {query_result['query_text']}\n"
-        output_str += f"Client Name: {query_result['client_info'].get('name', 'N/A')}\n"
-        if st.session_state.show_debug_outputs or len(query_result['client_info'].get('guidelines', '')) < 200:
-             output_str += f"Client Guidelines:\n{query_result['client_info'].get('guidelines', 'N/A')}\n\n"
-        else:
-             output_str += f"Client Guidelines: (See DOCX/CSV for full details)\n\n"
+# --- Background Jobs (run by src/job_queue.py on the shared AI runtime) ---
+
+def render_live_variant(live_container, live_placeholders, event):
+    """Shows the latest streamed draft/polish text of one variant in its own placeholder."""
+    key = (event["query_id"], event["variant_num"])
+    if key not in live_placeholders:
+        live_placeholders[key] = live_container.empty()
+    stage_labels = {"draft": "Drafting (Claude)", "polish": "Polishing (OpenAI)", "variant": "Done"}
+    text = event["result"]["final_answer"] if event["type"] == "variant" else event["text"]
+    live_placeholders[key].markdown(
+        f"**Query {event['query_id']} - Variant {event['variant_num']}** ({stage_labels[event['type']]})\n\n{text}"
+    )
 
-        for i, variant in enumerate(query_result['variants']):
-            output_str += f"--- Variant {i+1} (Angle: {variant['angle']}) ---\n"
-            output_str += f"Status: {variant['status']}\n"
-            output_str += f"\nFinal Answer:\n{variant['final_answer']}\n\n"
-            if st.session_state.show_debug_outputs:
-                output_str += f"Research Output:\n{variant['research_output']}\n\n"
-                output_str += f"Draft Output:\n{variant['draft']}\n\n"
-                output_str += f"Negative Constraints Applied (Previous Final Answers):\n{', '.join(variant['negative_constraints_applied'])}\n\n"
-            output_str += "---\n\n"
-        output_str += "\n\n"
-    return output_str.encode('utf-8')
-
-def generate_csv_output(all_results_with_variants):
-    df_data = []
-    for query_result in all_results_with_variants:
-        for i, variant in enumerate(query_result['variants']):
-            row = {
-                "Query ID": query_result['query_id'],
-                "Query Text": query_result['query_text'],
-                "Client Name": query_result['client_info'].get('name', 'N/A'),
-                "Client Guidelines": query_result['client_info'].get('guidelines', 'N/A'),
-                "Variant Number": i + 1,
-                "Angle": variant['angle'],
-                "Final Answer": variant['final_answer'],
-                "Status": variant['status'],
+# --- Instrumentation (spans recorded by src/instrumentation.py) ---
+
+def render_spans(spans):
+    """One row per recorded stage call: duration, attempts, tokens and cost."""
+    st.dataframe([
+        {
+            "Stage": span["stage"],
+            "Seconds": span["duration_seconds"],
+            "Attempts": span["attempts"],
+            "Cache hit": span["cache_hit"],
+            "Input tokens": span["input_tokens"],
+            "Cached input": span["cached_input_tokens"],
+            "Output tokens": span["output_tokens"],
+            "Cost (USD)": span["cost_usd"],
+            "Status": span["status"],
+        }
+        for span in spans
+    ], hide_index=True)
+
+def render_run_stats(run_stats):
+    """Per-stage latency, retries, tokens and cost of the last run, and its cost per client, in the sidebar."""
+    with st.sidebar:
+        st.header("Last Run Stats")
+        st.metric("Estimated cost (USD)", f"${run_stats['cost_usd']:.4f}")
+        st.dataframe([
+            {
+                "Stage": stage,
+                "Calls": stats["calls"],
+                "p50 s": round(stats["p50_seconds"], 2),
+                "p95 s": round(stats["p95_seconds"], 2),
+                "Retries": stats["retries"],
+                "Errors": stats["errors"],
+                "Cache hits": stats["cache_hits"],
+                "Hedges (won)": f"{stats['hedges']} ({stats['hedge_wins']})",
+                "Tokens in/out": f"{stats['input_tokens']}/{stats['output_tokens']}",
+                "Cost (USD)": round(stats["cost_usd"], 4),
             }
-            if st.session_state.show_debug_outputs:
-                row["Research Output (Debug)"] = variant['research_output']
-                row["Draft Output (Debug)"] = variant['draft']
-                row["Negative Constraints Applied (Previous Final Answers)"] = ' '.join(variant['negative_constraints_applied'])
-            df_data.append(row)
-    df = pd.DataFrame(df_data)
-    return df.to_csv(index=False).encode('utf-8')
-
-def generate_docx_output(all_results_with_variants):
-    document = Document()
-    document.add_heading('HARO Automation Results', 0)
-
-    if st.session_state.client_info_parsed:
-        document.add_heading('Client Information Summary', level=1)
-        for q_id, info in st.session_state.client_info_parsed.items():
-            document.add_paragraph(f"**Query {q_id} Client:** {info.get('name', 'N/A')}")
-            guidelines_para = document.add_paragraph(f"Guidelines: {info.get('guidelines', 'N/A')}")
-            guidelines_para.runs[0].font.size = Pt(10)
-            document.add_paragraph("")
-        document.add_page_break()
-
-    for query_result in all_results_with_variants:
-        section = document.add_section(WD_SECTION_START.NEW_PAGE)
-        
-        document.add_heading(f"Query {query_result['query_id']}: {query_result['query_text'][:100]}...", level=1)
-        document.add_paragraph(f"**Client Name:** {query_result['client_info'].get('name', 'N/A')}")
-        
-        document.add_heading('Original Query & Guidelines (for context)', level=3)
-        document.add_paragraph(f"**Original HARO Query:**\n{query_result['query_text']}")
-        document.add_paragraph(f"**Client-Specific Guidelines:**\n{query_result['client_info'].get('guidelines', 'N/A')}")
-        document.add_paragraph("")
+            for stage, stats in run_stats["stages"].items()
+        ], hide_index=True)
+        for client_name, cost in run_stats["clients"].items():
+            st.caption(f"{client_name}: ${cost:.4f}")
+
+def render_service_totals(ai_service):
+    """Response cache, prompt trimming, provider prompt-cache and draft validation totals of the shared service since it started."""
+    with st.sidebar.expander("Service Totals (all jobs)"):
+        for stage, counts in ai_service.cache_stats().items():
+            st.caption(f"Response cache - {stage}: {counts['hits']} hits / {counts['misses']} misses")
+        for stage, counts in ai_service.prompt_token_stats().items():
+            st.caption(f"Prompt input tokens - {stage}: {counts['input_tokens']} ({counts['tokens_saved']} saved by trimming)")
+        for stage, counts in ai_service.input_token_stats().items():
+            st.caption(f"Provider input tokens - {stage}: {counts['cached_input_tokens']} cached / {counts['uncached_input_tokens']} uncached")
+        actions = ai_service.answer_validator.stats["actions"]
+        st.caption(f"Drafts: {actions['skip']} used as is, {actions['repair']} repaired locally, {actions['polish']} polished")
+        for rule, counts in ai_service.answer_validator.stats["rules"].items():
+            st.caption(f"Draft rule {rule}: {counts['passed']} passed / {counts['failed']} failed")
+        for queue, latency in ai_service.scheduler.latency_report().items():
+            st.caption(
+                f"Queue {queue}: {latency['queries']} queries, wait p50/p95 {latency['p50_wait_seconds']}/{latency['p95_wait_seconds']}s,"
+                f" total p50/p95 {latency['p50_seconds']}/{latency['p95_seconds']}s, {latency['missed_deadlines']} missed deadlines"
+            )
+        combined = ai_service.combined_counts
+        if combined["variants"]:
+            st.caption(
+                f"Combined mode: {combined['variants']} variants, {combined['drafting_fallbacks']} drafted"
+                f" and {combined['polish_fallbacks']} polished separately after invalid JSON"
+            )
 
-        for i, variant in enumerate(query_result['variants']):
-            document.add_heading(f"Variant {i+1} (Angle: {variant['angle']})", level=2)
-            document.add_paragraph(f"**Status:** {variant['status']}")
+def open_job(job_id):
+    """Makes `job_id` this session's current job and puts it in the URL, so a refresh or another tab can reopen it."""
+    st.session_state.job_id = job_id
+    st.session_state.loaded_job_id = None
+    st.session_state.run_stats = None
+    st.query_params["job"] = job_id
+
+def load_finished_job(job_runner, job):
+    """Summarizes a finished job's results; the results themselves stay in the job store."""
+    if st.session_state.loaded_job_id == job["id"]:
+        return
+    st.session_state.run_stats = summarize_results(job_runner.store.iter_results(job["id"]))
+    st.session_state.loaded_job_id = job["id"]
+    st.session_state.loaded_job_finished_at = job["finished_at"]
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress(job_id):
+    """
+    Polls a queued or running job and shows its progress and streamed variants. Only this
+    fragment reruns while polling; once the job finishes the whole app reruns to show results.
+    """
+    job_runner = get_shared_job_runner()
+    job = job_runner.store.get_job(job_id)
+    if job is None or job["status"] in FINISHED_JOB_STATUSES:
+        st.rerun()
+
+    total = max(1, job["total_queries"])
+    if job["status"] == "queued":
+        st.info(f"Job {job_id} is queued behind other runs. You can leave this page and come back later.")
+    st.progress(int(job["completed_queries"] / total * 100))
+    st.text(
+        f"Job {job_id}: processed {job['completed_queries']} of {job['total_queries']} queries. "
+        f"Generating {NUM_VARIANTS_PER_QUERY} variants each."
+    )
+    if st.button("Cancel Job", key=f"cancel_job_{job_id}"):
+        job_runner.cancel(job_id)
+
+    live_container = st.container()
+    live_placeholders = {}
+    for event in job_runner.live_previews(job_id).values():
+        render_live_variant(live_container, live_placeholders, event)
+
+def render_job_status(job_runner):
+    job_id = st.session_state.job_id
+    job = job_runner.store.get_job(job_id)
+    if job is None:
+        st.warning(f"Job {job_id} no longer exists.")
+        return
+    if job["status"] not in FINISHED_JOB_STATUSES:
+        render_job_progress(job_id)
+        return
+
+    load_finished_job(job_runner, job)
+    if job["status"] == "done":
+        st.success(f"HARO automation finished! Job {job_id}: {job['completed_queries']} queries, each with {NUM_VARIANTS_PER_QUERY} variants.")
+    elif job["status"] == "cancelled":
+        st.warning(f"Job {job_id} was cancelled after {job['completed_queries']} of {job['total_queries']} queries.")
+    else:
+        st.error(f"Job {job_id} failed after {job['completed_queries']} of {job['total_queries']} queries: {job['error']}")
+
+def render_retry_button(job_runner):
+    """Queues the loaded job again for its failed variants and the ones ticked as rejected."""
+    job_id = st.session_state.loaded_job_id
+    rejected = {
+        query_id: sorted(indices)
+        for query_id, indices in st.session_state.rejected_variants.get(job_id, {}).items() if indices
+    }
+    if st.button("Retry Failed & Rejected Variants", key=f"retry_job_{job_id}"):
+        if job_runner.retry(job_id, rejected):
+            st.session_state.rejected_variants.pop(job_id, None)
+            open_job(job_id)
+            st.rerun()
+        st.info("No failed or rejected variants to retry.")
+
+def render_recent_jobs(job_runner):
+    with st.sidebar:
+        st.header("Recent Jobs")
+        jobs = job_runner.store.recent_jobs(JOB_RECENT_LIMIT)
+        if not jobs:
+            st.caption("No jobs yet.")
+            return
+        labels = {
+            job["id"]: f"{job['id']} - {job['status']} ({job['completed_queries']}/{job['total_queries']} queries)"
+            for job in jobs
+        }
+        selected = st.selectbox("Job", list(labels), format_func=labels.get, key="recent_job_select")
+        if st.button("Open Job", key="open_recent_job") and selected != st.session_state.job_id:
+            open_job(selected)
+            st.rerun()
 
-            document.add_heading('Final Answer', level=3)
-            for paragraph_text in variant['final_answer'].split('\n\n'):
-                if paragraph_text.strip():
-                    p = document.add_paragraph(paragraph_text.strip())
-                    p.paragraph_format.first_line_indent = Pt(0)
+# --- Results (read from the job store one page at a time) ---
+
+def _remember_rejection(job_id, query_id, variant_index, key):
+    """Keeps reject ticks in the session, since a checkbox's own state is dropped once its page is left."""
+    rejected = st.session_state.rejected_variants.setdefault(job_id, {}).setdefault(str(query_id), set())
+    if st.session_state[key]:
+        rejected.add(variant_index)
+    else:
+        rejected.discard(variant_index)
+
+def render_query_result(query_result, job_id):
+    client_name_display = query_result['client_info'].get('name', 'N/A')
+    query_snippet = query_result['query_text'].split('\n')[0][:70] + "..." if query_result['query_text'] else "..."
+    rejected = st.session_state.rejected_variants.get(job_id, {}).get(str(query_result['query_id']), set())
+
+    with st.expander(f"Query {query_result['query_id']} (Client: {client_name_display}) - {query_snippet}"):
+        with st.expander("Show Full Query & Client Guidelines"):
+            st.markdown(f"**Original HARO Query:**\n```\n{query_result['query_text']}\n```")
+            st.markdown(f"**Client Guidelines:**\n```\n{query_result['client_info'].get('guidelines', 'N/A')}\n```")
+            st.markdown("---")
+        if st.session_state.show_debug_outputs and query_result.get('spans'):
+            st.markdown("**Angle Generation:**")
+            render_spans(query_result['spans'])
 
+        for i, variant in enumerate(query_result['variants']):
+            st.markdown(f"#### Variant {i+1} (Angle: {variant['angle']})")
+            st.write(f"**Status:** {variant['status']}")
+            st.markdown(f"**Final Answer:**\n{variant['final_answer']}")
+            if variant['status'] == "Success":
+                key = f"reject_{job_id}_{query_result['query_id']}_{i}"
+                st.checkbox(
+                    "Reject this variant", value=i in rejected, key=key,
+                    on_change=_remember_rejection, args=(job_id, query_result['query_id'], i, key)
+                )
             if st.session_state.show_debug_outputs:
-                document.add_heading('Research Output (Debug)', level=3)
-                document.add_paragraph(variant['research_output']) 
-                document.add_heading('Draft Output (Debug)', level=3)
-                for paragraph_text in variant['draft'].split('\n\n'):
-                    if paragraph_text.strip():
-                        document.add_paragraph(paragraph_text.strip())
-                document.add_paragraph(f"**Negative Constraints Applied (Previous Final Answers):** {', '.join(variant['negative_constraints_applied'])}")
-
-            document.add_paragraph("---")
-
-    bio = BytesIO()
-    document.save(bio)
-    return bio.getvalue()
-
-# --- Asynchronous Processing Function (unchanged) ---
-
-async def run_processing(queries, client_info_map, parameters, status_placeholder):
-    ai_service = AIService()
-    all_query_results = []
-    progress_bar = status_placeholder.progress(0)
-    status_text = st.empty()
-    tasks = []
-
-    for i, query_data in enumerate(queries):
-        query_id = query_data["id"]
-        query_text = query_data["text"]
-        current_client_info = client_info_map.get(query_id, {})
-
-        tasks.append(
-            ai_service.process_query_with_variants(
-                query_id,
-                query_text,
-                current_client_info,
-                parameters
-            )
-        )
+                with st.expander(f"Debug Info for Variant {i+1}"):
+                    st.markdown(f"**Research Output:**\n```\n{variant['research_output']}\n```")
+                    st.markdown(f"**Draft Output:**\n```\n{variant['draft']}\n```")
+                    st.markdown(f"**Negative Constraints Applied (Previous Final Answers):** {', '.join(variant['negative_constraints_applied'])}")
+                    if variant.get('validation'):
+                        validation = variant['validation']
+                        st.markdown(
+                            f"**Draft Validation:** {validation['action']} (reading ease {validation['reading_ease']}; "
+                            f"failed: {', '.join(validation['failed_rules']) or 'none'})"
+                        )
+                    if variant.get('spans'):
+                        st.markdown("**Stage Timings & Cost:**")
+                        render_spans(variant['spans'])
+            st.markdown("---")
+
+@st.fragment
+def render_results_page(job_runner, job_id):
+    """
+    The queries of the loaded job matching the filters, RESULTS_PAGE_SIZE at a time. Only the
+    page shown is read from the job store, and filtering or paging reruns only this fragment.
+    """
+    store = job_runner.store
+    search_col, client_col, failed_col = st.columns([0.45, 0.35, 0.2])
+    search = search_col.text_input("Search queries", key=f"results_search_{job_id}", placeholder="Query ID or text")
+    client = client_col.selectbox("Client", ["All clients"] + store.result_clients(job_id), key=f"results_client_{job_id}")
+    failed_only = failed_col.checkbox("Failed variants only", key=f"results_failed_{job_id}")
+    filters = {
+        "search": search.strip() or None,
+        "client": None if client == "All clients" else client,
+        "failed_only": failed_only,
+    }
 
-    processed_count = 0
-    for future in asyncio.as_completed(tasks):
-        result = await future
-        all_query_results.append(result)
-        processed_count += 1
-        progress = min(100, (processed_count / len(queries)) * 100)
-        progress_bar.progress(int(progress))
-        status_text.text(f"Processed {processed_count} of {len(queries)} queries. Generating {NUM_VARIANTS_PER_QUERY} variants each.")
-
-    progress_bar.progress(100)
-    status_text.text(f"Processing complete for {len(all_query_results)} queries, each with {NUM_VARIANTS_PER_QUERY} variants.")
-    st.success("HARO automation finished!")
-    await ai_service.close()
-    return all_query_results
+    total = store.count_results(job_id, **filters)
+    if not total:
+        st.info("No queries match these filters.")
+        return
+    pages = math.ceil(total / RESULTS_PAGE_SIZE)
+    page_key = f"results_page_{job_id}"
+    # Narrower filters can leave the remembered page past the last one.
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    offset = (page - 1) * RESULTS_PAGE_SIZE
+    st.caption(f"Queries {offset + 1}-{min(offset + RESULTS_PAGE_SIZE, total)} of {total}")
+    for query_result in store.load_results(job_id, offset, RESULTS_PAGE_SIZE, **filters):
+        render_query_result(query_result, job_id)
 
 # --- Main Streamlit Application (Logout Button in Sidebar) ---
 
@@ -168,12 +341,23 @@ def main():
     # --- Initialize ALL session state variables at the very top ---
     if 'authenticated' not in st.session_state:
         st.session_state.authenticated = False
-    if 'results' not in st.session_state:
-        st.session_state.results = []
+    if 'rejected_variants' not in st.session_state:
+        # {job_id: {query_id: {variant indices}}} ticked "Reject this variant".
+        st.session_state.rejected_variants = {}
     if 'show_debug_outputs' not in st.session_state:
         st.session_state.show_debug_outputs = False
     if 'client_info_parsed' not in st.session_state:
         st.session_state.client_info_parsed = {}
+    if 'run_stats' not in st.session_state:
+        st.session_state.run_stats = None
+    if 'job_id' not in st.session_state:
+        # Reopens the job in the URL after a refresh, a reconnect or in another tab.
+        st.session_state.job_id = st.query_params.get("job")
+    if 'loaded_job_id' not in st.session_state:
+        st.session_state.loaded_job_id = None
+        st.session_state.loaded_job_finished_at = None
+    if 'export_cache' not in st.session_state:
+        st.session_state.export_cache = ExportCache()
     if 'general_instructions' not in st.session_state:
         st.session_state.general_instructions = "Ensure answers are concise, impactful, and demonstrate deep industry knowledge."
 
@@ -191,12 +375,12 @@ def main():
     if not st.session_state.authenticated:
         st.subheader("Login to Access HARO Tool")
         
-        app_credentials_json_str = st.secrets.get("APP_CREDENTIALS", "{}")
+        app_credentials_json_str = APP_CREDENTIALS
         
         try:
             app_credentials = json.loads(app_credentials_json_str)
         except json.JSONDecodeError:
-            st.error("Error loading application credentials. Please ensure 'APP_CREDENTIALS' in st.secrets is valid JSON.")
+            st.error("Error loading application credentials. Please ensure the 'APP_CREDENTIALS' secret is valid JSON.")
             app_credentials = {}
 
         input_col, _ = st.columns([0.5, 0.5])
@@ -233,11 +417,14 @@ def main():
             st.info("Logged out successfully.")
             st.rerun()
 
+    job_runner = get_shared_job_runner()
+
     # --- REST OF THE MAIN APP CONTENT (Only displayed if authenticated, and rendered below the main header) ---
     st.markdown("Enter up to 4 HARO queries and their respective client information. The tool will generate **5 distinct variants** for each query.")
 
     all_queries_inputs = []
     all_client_info_inputs_raw = []
+    all_deadline_inputs = []
 
     st.subheader("Query & Client Information Input")
 
@@ -255,6 +442,14 @@ def main():
                 max_chars=1500
             )
             all_queries_inputs.append(query_val)
+            deadline_hours = st.number_input(
+                f"Deadline for Query {i} (hours from now, 0 = none):",
+                key=f"deadline_input_{i}",
+                min_value=0.0,
+                step=0.5,
+                help="Queries due soon are answered first, ahead of larger runs already in progress."
+            )
+            all_deadline_inputs.append(deadline_hours)
 
         with cols_q_c[1]:
             client_key = f"client_info_input_{i}"
@@ -296,20 +491,12 @@ def main():
 
                 if query_text:
                     query_id = f"Q{i+1}"
-                    queries_to_process.append({"id": query_id, "text": query_text})
+                    query = {"id": query_id, "text": query_text}
+                    if all_deadline_inputs[i]:
+                        query["deadline"] = time.time() + all_deadline_inputs[i] * 3600
+                    queries_to_process.append(query)
                     
-                    client_name = ""
-                    client_guidelines = ""
-                    if client_info_text_raw:
-                        lines = client_info_text_raw.split('\n', 1)
-                        client_name = lines[0].strip()
-                        if len(lines) > 1:
-                            client_guidelines = lines[1].strip()
-
-                    client_info_map[query_id] = {
-                        "name": client_name if client_name else f"Client {i+1} Default",
-                        "guidelines": client_guidelines
-                    }
+                    client_info_map[query_id] = parse_client_info(client_info_text_raw, f"Client {i+1} Default")
 
             if not queries_to_process:
                 status_placeholder.error("Please enter at least one HARO query in any of the input boxes.")
@@ -317,67 +504,34 @@ def main():
 
             st.session_state.client_info_parsed = client_info_map
 
-            status_placeholder.info(f"Starting HARO automation for {len(queries_to_process)} queries, generating {NUM_VARIANTS_PER_QUERY} variants each. This may take a while based on API response times.")
-
             try:
-                st.session_state.results = asyncio.run(
-                    run_processing(queries_to_process, client_info_map, parameters, status_placeholder)
-                )
+                open_job(job_runner.submit(queries_to_process, client_info_map, parameters))
             except Exception as e:
                 st.error(f"An error occurred during automation: {e}")
                 logger.exception("Error in main automation flow.")
 
-    if st.session_state.results:
+    # The job runs on the background runtime; this script only polls it, so reruns never block on a run.
+    if st.session_state.job_id:
+        render_job_status(job_runner)
+
+    if st.session_state.loaded_job_id and job_runner.store.count_results(st.session_state.loaded_job_id):
         st.subheader("Generated HARO Responses")
-        for query_result in st.session_state.results:
-            client_name_display = query_result['client_info'].get('name', 'N/A')
-            query_snippet = query_result['query_text'].split('\n')[0][:70] + "..." if query_result['query_text'] else "..."
-
-            with st.expander(f"Query {query_result['query_id']} (Client: {client_name_display}) - {query_snippet}"):
-                with st.expander("Show Full Query & Client Guidelines"):
-                    st.markdown(f"**Original HARO Query:**\n```\n{query_result['query_text']}\n```")
-                    st.markdown(f"**Client Guidelines:**\n```\n{query_result['client_info'].get('guidelines', 'N/A')}\n```")
-                    st.markdown("---")
-
-                for i, variant in enumerate(query_result['variants']):
-                    st.markdown(f"#### Variant {i+1} (Angle: {variant['angle']})")
-                    st.write(f"**Status:** {variant['status']}")
-                    st.markdown(f"**Final Answer:**\n{variant['final_answer']}")
-                    if st.session_state.show_debug_outputs:
-                        with st.expander(f"Debug Info for Variant {i+1}"):
-                            st.markdown(f"**Research Output:**\n```\n{variant['research_output']}\n```")
-                            st.markdown(f"**Draft Output:**\n```\n{variant['draft']}\n```")
-                            st.markdown(f"**Negative Constraints Applied (Previous Final Answers):** {', '.join(variant['negative_constraints_applied'])}")
-                    st.markdown("---")
+        render_results_page(job_runner, st.session_state.loaded_job_id)
+        render_retry_button(job_runner)
 
         st.subheader("Download All Results")
         col_dl1, col_dl2, col_dl3 = st.columns(3)
 
-        with col_dl1:
-            st.download_button(
-                label="Download as TXT",
-                data=generate_text_output(st.session_state.results),
-                file_name="haro_responses.txt",
-                mime="text/plain",
-                help="Download all generated responses as a plain text file."
-            )
+        for column, kind in zip((col_dl1, col_dl2, col_dl3), ("txt", "csv", "docx")):
+            with column:
+                render_export_download(kind)
 
-        with col_dl2:
-            st.download_button(
-                label="Download as CSV",
-                data=generate_csv_output(st.session_state.results),
-                file_name="haro_responses.csv",
-                mime="text/csv",
-                help="Download all generated responses as a CSV file for spreadsheet viewing."
-            )
-        with col_dl3:
-            st.download_button(
-                label="Download as DOCX",
-                data=generate_docx_output(st.session_state.results),
-                file_name="haro_responses.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                help="Download all generated responses in a Word Document format."
-            )
+    if st.session_state.run_stats:
+        render_run_stats(st.session_state.run_stats)
+    render_recent_jobs(job_runner)
+    if job_runner.runtime is not None:
+        # With worker processes the totals live in each worker's own service, not in this app.
+        render_service_totals(job_runner.runtime.ai_service)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
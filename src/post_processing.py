@@ -0,0 +1,126 @@
+# src/post_processing.py
+"""
+Post-processing applied to every final answer: strip a leading "Variant N:" label, remove
+dates and timeframes, then reshape into two paragraphs of roughly 50-60 words.
+
+Behaviour is identical to the original Apps Script port (benchmarks/legacy_post_processing.py);
+tests/test_post_processing.py checks that on a fixed generated corpus and times both.
+"""
+
+import re
+
+_VARIANT_LABEL = re.compile(r'^\s*Variant\s*\d+:\s*', re.IGNORECASE)
+
+# Applied in this order. Later patterns can match text only exposed by an earlier removal
+# (e.g. "this 2024 year"), so the order is part of the behaviour and must not change.
+# Each pattern has a cheap guard (substring tests) that is false whenever the pattern cannot
+# match, so the regex scans only run on answers that may contain a date.
+_MONTHS = ("january", "february", "march", "april", "may", "june", "july",
+           "august", "september", "october", "november", "december")
+
+def _has_century(text, folded):
+    return "19" in text or "20" in text
+
+_DATE_PASSES = [
+    # Same as r'\b(19|20)\d{2}\b', but starting on the literal digits lets the regex engine
+    # skip ahead instead of testing a word boundary at every position (~3x faster).
+    (re.compile(r'(?:19|20)(?<!\w..)\d{2}\b'), _has_century),
+    (re.compile(r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s*(19|20)\d{2}\b', re.IGNORECASE),
+     lambda text, folded: _has_century(text, folded) and any(month in folded for month in _MONTHS)),
+    (re.compile(r'\b\d{1,2}\/\d{1,2}\/(19|20)\d{2}\b'), lambda text, folded: "/" in text and _has_century(text, folded)),
+    (re.compile(r'\b\d{1,2}-\d{1,2}-(19|20)\d{2}\b'), lambda text, folded: "-" in text and _has_century(text, folded)),
+    (re.compile(r'\b(Q[1-4])\s*(\d{4})\b', re.IGNORECASE), lambda text, folded: "q" in folded),
+    (re.compile(r'\b(this|next|last|current)\s+year\b', re.IGNORECASE), lambda text, folded: "year" in folded),
+    (re.compile(r'\b(\d{4})\s*(\d{2}:\d{2}:\d{2})\b'), lambda text, folded: ":" in text),
+    (re.compile(r',\s*(19|20)\d{2}\b'), lambda text, folded: "," in text and _has_century(text, folded)),
+    (re.compile(r'\b(today|tomorrow|yesterday)\b', re.IGNORECASE),
+     lambda text, folded: "today" in folded or "tomorrow" in folded or "yesterday" in folded),
+    (re.compile(r'\b(recent|upcoming|past)\s+(month|year|quarter|week)s?\b', re.IGNORECASE),
+     lambda text, folded: "recent" in folded or "upcoming" in folded or "past" in folded),
+]
+# re.IGNORECASE also matches these four non-ASCII letters to ASCII ones; fold them the same way
+# so the substring guards never miss a match the regex would find.
+_IGNORECASE_EXTRAS = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+def _fold(text):
+    return text.translate(_IGNORECASE_EXTRAS).lower()
+
+_MULTI_SPACE = re.compile(r'\s{2,}')
+
+_SENTENCE_END = ('.', '?', '!')
+_TARGET_WORDS = 60
+_MAX_WORDS = 65
+
+
+def remove_variant_label_prefix(text):
+    if not text: return ''
+    return _VARIANT_LABEL.sub('', text).strip()
+
+
+def remove_dates(text):
+    if not text: return ''
+    folded = _fold(text)
+    for pattern, may_match in _DATE_PASSES:
+        if may_match(text, folded):
+            cleaned_text = pattern.sub('', text)
+            if len(cleaned_text) != len(text):
+                text, folded = cleaned_text, _fold(cleaned_text)
+    return _MULTI_SPACE.sub(' ', text).strip()
+
+
+def _split_near_middle(words):
+    """Index just after the first sentence end within 20 words of the middle, else the middle."""
+    midpoint = len(words) // 2
+    for i in range(max(0, midpoint - 20), min(len(words), midpoint + 20)):
+        if words[i].endswith(_SENTENCE_END):
+            return i + 1
+    return midpoint
+
+
+def format_two_paragraphs(text):
+    """
+    Reshapes text into exactly two paragraphs separated by a blank line. Words are split on
+    single spaces once; rebalancing is computed as slice offsets instead of moving words
+    one at a time. Text that cannot be made into two paragraphs is returned unchanged.
+    """
+    if not text: return ''
+    cleaned_text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
+    paragraphs = [p.strip() for p in cleaned_text.split('\n') if p.strip()]
+
+    if len(paragraphs) == 1:
+        words = paragraphs[0].split(' ')
+        split_at = _split_near_middle(words)
+        paragraphs = [p for p in (' '.join(words[:split_at]).strip(), ' '.join(words[split_at:]).strip()) if p]
+    if len(paragraphs) > 2:
+        paragraphs = [paragraphs[0], ' '.join(paragraphs[1:])]
+    elif len(paragraphs) < 2:
+        if len(paragraphs) == 1 and len(paragraphs[0].split(' ')) > 80:
+            words = paragraphs[0].split(' ')
+            midpoint = len(words) // 2
+            paragraphs = [' '.join(words[:midpoint]), ' '.join(words[midpoint:])]
+        else:
+            return text
+
+    p1_words = paragraphs[0].split(' ')
+    p2_words = paragraphs[1].split(' ')
+    # Move words across the boundary until the longer paragraph is down to the target or the
+    # shorter one reaches it, whichever comes first.
+    if len(p1_words) > _TARGET_WORDS and len(p2_words) < _TARGET_WORDS:
+        moved = min(len(p1_words) - _TARGET_WORDS, _TARGET_WORDS - len(p2_words))
+        p1_words, p2_words = p1_words[:-moved], p1_words[-moved:] + p2_words
+    if len(p2_words) > _TARGET_WORDS and len(p1_words) < _TARGET_WORDS:
+        moved = min(len(p2_words) - _TARGET_WORDS, _TARGET_WORDS - len(p1_words))
+        p1_words, p2_words = p1_words + p2_words[:moved], p2_words[moved:]
+    # The legacy code also tried to top up a paragraph under 30 words from one over 70 here,
+    # after this cap; it could never trigger (and would have raised on `insert(0, *slice)`).
+    return ' '.join(p1_words[:_MAX_WORDS]) + '\n\n' + ' '.join(p2_words[:_MAX_WORDS])
+
+
+def process_text(text):
+    """The full post-processing chain for one final answer."""
+    return format_two_paragraphs(remove_dates(remove_variant_label_prefix(text)))
+
+
+def process_batch(texts):
+    """Post-processes many answers at once (bulk and CLI runs); returns them in order."""
+    return [process_text(text) for text in texts]
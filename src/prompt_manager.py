@@ -2,18 +2,114 @@
 
 import re
 from src.config import (
-    CLAUDE_PROMPT_TEMPLATE, OPENAI_PROMPT_TEMPLATE,
-    ANGLE_GENERATION_PROMPT, NUM_VARIANTS_PER_QUERY
+    CLAUDE_PROMPT_PREFIX, CLAUDE_PROMPT_SUFFIX_TEMPLATE,
+    OPENAI_PROMPT_PREFIX, OPENAI_PROMPT_SUFFIX_TEMPLATE,
+    ANGLE_GENERATION_PROMPT, ANGLE_SEEDS_PROMPT_PART,
+    COMBINED_CLAUDE_PROMPT_SUFFIX_TEMPLATE, COMBINED_OPENAI_PROMPT_SUFFIX_TEMPLATE,
+    PROMPT_TOKEN_BUDGETS, TOKENIZER_ENCODING
 )
 from src.utils import get_logger
 
+try:
+    import tiktoken
+except ImportError:  # Optional: without it, token counts use the local estimate below.
+    tiktoken = None
+
 logger = get_logger(__name__)
 
+CLAUDE_SYSTEM_PROMPT = "You are an expert writer for HARO responses. Adhere strictly to all formatting, tone, and distinctness rules provided by the user and client-specific guidelines, including ALL negative constraints."
+OPENAI_SYSTEM_PROMPT = "You are a final editor for HARO responses. Refine the provided draft strictly adhering to all formatting, distinctness, and negative constraint rules, including ALL fixed and dynamic constraints."
+
+_WORD_PIECE = re.compile(r"\w+|[^\w\s]")
+
+_encoder = None
+_encoder_unavailable = False
+
+def _get_encoder():
+    global _encoder, _encoder_unavailable
+    if _encoder is None and not _encoder_unavailable and tiktoken is not None:
+        try:
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            # tiktoken downloads its encodings on first use, which fails on offline hosts.
+            _encoder_unavailable = True
+            logger.warning(f"tiktoken encoding '{TOKENIZER_ENCODING}' unavailable, using the local token estimate: {e}")
+    return _encoder
+
+def count_tokens(text):
+    """
+    Tokens in `text`: exact with tiktoken, otherwise estimated as one token per punctuation
+    mark and per six characters of each word (close to BPE counts for English prose).
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return sum(-(-len(piece) // 6) if piece[0].isalnum() or piece[0] == "_" else 1 for piece in _WORD_PIECE.findall(text))
+
+def count_prompt_tokens(prompts):
+    return count_tokens(prompts["system_prompt"]) + sum(count_tokens(m["content"]) for m in prompts["user_messages"])
+
 class PromptManager:
-    def __init__(self):
-        self.claude_template = CLAUDE_PROMPT_TEMPLATE
-        self.openai_template = OPENAI_PROMPT_TEMPLATE
+    """
+    Drafting and polish prompts are built as an invariant system prompt (role plus the static
+    rule block) followed by a per-call user message, so every call of a stage shares the same
+    prefix. The providers only cache it once it reaches PROMPT_CACHE_MIN_TOKENS (see config).
+    """
+
+    def __init__(self, token_budgets=None):
+        # (static prefix, per-call suffix template, role line) per stage.
+        self.claude_template = (CLAUDE_PROMPT_PREFIX, CLAUDE_PROMPT_SUFFIX_TEMPLATE, CLAUDE_SYSTEM_PROMPT)
+        self.openai_template = (OPENAI_PROMPT_PREFIX, OPENAI_PROMPT_SUFFIX_TEMPLATE, OPENAI_SYSTEM_PROMPT)
+        self.combined_claude_template = (CLAUDE_PROMPT_PREFIX, COMBINED_CLAUDE_PROMPT_SUFFIX_TEMPLATE, CLAUDE_SYSTEM_PROMPT)
+        self.combined_openai_template = (OPENAI_PROMPT_PREFIX, COMBINED_OPENAI_PROMPT_SUFFIX_TEMPLATE, OPENAI_SYSTEM_PROMPT)
         self.angle_generation_template = ANGLE_GENERATION_PROMPT # Corrected typo ANMA_GENERATION_PROMPT to ANGLE_GENERATION_PROMPT
+        self.token_budgets = PROMPT_TOKEN_BUDGETS if token_budgets is None else token_budgets
+        self.token_stats = {}
+
+    def _fit_to_budget(self, stage, render, constraints):
+        """
+        Renders a prompt with `render(constraints)` and fits it to the stage's token budget.
+        `constraints` are ordered most important first. If the prompt is over budget, they are
+        trimmed from the end, one at a time, until it fits; the fixed rules (the static prefix
+        and the suffix template) are never shortened. When even the prompt without any
+        constraint is over budget, nothing is dropped: the prompt is sent whole and counted as
+        over budget. Without tiktoken (or its encoding, offline) tokens are estimated from
+        characters, so the same prompt can be trimmed on one host and not on another.
+        """
+        budget = self.token_budgets.get(stage)
+        constraints = list(constraints or [])
+        prompts = render(constraints)
+        tokens = original_tokens = count_prompt_tokens(prompts)
+        if budget and tokens > budget:
+            floor_tokens = count_prompt_tokens(render([]))
+            if floor_tokens > budget:
+                logger.warning(
+                    f"{stage} prompt is {tokens} tokens and at least {floor_tokens} without its constraints, "
+                    f"over its {budget}-token budget; sending it unchanged."
+                )
+            else:
+                while tokens > budget and constraints:
+                    constraints.pop()
+                    prompts = render(constraints)
+                    tokens = count_prompt_tokens(prompts)
+
+        stats = self.token_stats.setdefault(stage, {"prompts": 0, "input_tokens": 0, "tokens_saved": 0, "trimmed": 0, "over_budget": 0})
+        stats["prompts"] += 1
+        stats["input_tokens"] += tokens
+        stats["tokens_saved"] += original_tokens - tokens
+        stats["trimmed"] += tokens < original_tokens
+        stats["over_budget"] += bool(budget and tokens > budget)
+        prompts["token_count"] = tokens
+        return prompts
+
+    def token_report(self):
+        """Per-stage prompt counts and input tokens (total, mean, saved by trimming)."""
+        return {
+            stage: dict(stats, mean_tokens=round(stats["input_tokens"] / stats["prompts"]) if stats["prompts"] else 0)
+            for stage, stats in self.token_stats.items()
+        }
 
     # Perplexity-specific methods are removed.
 
@@ -27,53 +123,118 @@ class PromptManager:
         
         client_context_for_prompt = f"Client Name: {client_name}\nClient Guidelines:\n{client_guidelines}"
 
-        dynamic_constraints_str = ""
-        if dynamic_uniqueness_constraints:
-            dynamic_constraints_str = f"Additionally, DO NOT use phrases or ideas similar to these (from previous variants for this query): {', '.join(dynamic_uniqueness_constraints)}."
-        
-        formatted_template = self.claude_template.format(
-            QUERY=query,
-            CLIENT_INFO=client_context_for_prompt,
-            GENERAL_INSTRUCTIONS=general_instructions,
-            ANGLE=angle, # Pass the angle directly to Claude template
-            VARIANT_NUM=variant_num,
-            PREVIOUS_VARIANT_MAX_NUM=previous_variant_max_num,
-            NUM_VARIANTS=NUM_VARIANTS_PER_QUERY, # Corrected typo NUM_VARIANTS_PER_QUERY
-            DYNAMIC_NEGATIVE_CONSTRAINTS=dynamic_constraints_str
-        )
-        system_prompt = "You are an expert writer for HARO responses. Adhere strictly to all formatting, tone, and distinctness rules provided by the user and client-specific guidelines, including ALL negative constraints."
-        user_prompt = formatted_template
+        def render(constraints):
+            dynamic_constraints_str = ""
+            if constraints:
+                dynamic_constraints_str = f"Additionally, DO NOT use phrases or ideas similar to these (from previous variants for this query): {', '.join(constraints)}."
+
+            prefix, suffix_template, role = self.claude_template
+            formatted_suffix = suffix_template.format(
+                QUERY=query,
+                CLIENT_INFO=client_context_for_prompt,
+                GENERAL_INSTRUCTIONS=general_instructions,
+                ANGLE=angle, # Pass the angle directly to Claude template
+                VARIANT_NUM=variant_num,
+                PREVIOUS_VARIANT_MAX_NUM=previous_variant_max_num,
+                DYNAMIC_NEGATIVE_CONSTRAINTS=dynamic_constraints_str
+            )
+            return {"system_prompt": f"{role}\n\n{prefix}", "user_messages": [{"role": "user", "content": formatted_suffix}]}
 
-        return {"system_prompt": system_prompt, "user_messages": [{"role": "user", "content": user_prompt}]}
+        return self._fit_to_budget("drafting", render, dynamic_uniqueness_constraints)
 
-    def get_openai_prompts(self, query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints):
+    def get_openai_prompts(self, query, client_info, general_instructions, drafted_answer, variant_num, dynamic_uniqueness_constraints, fix_instructions=None):
+        """`fix_instructions` (problems the local validator found in the draft) are never dropped for budget."""
         client_name = client_info.get('name', 'N/A')
         client_guidelines = client_info.get('guidelines', 'N/A')
 
         client_context_for_prompt = f"Client Name: {client_name}\nClient Guidelines:\n{client_guidelines}"
-        
-        dynamic_constraints_str = ""
-        if dynamic_uniqueness_constraints:
-            dynamic_constraints_str = f"Additionally, ABSOLUTELY AVOID phrases or ideas similar to these (from other variants for this query): {', '.join(dynamic_uniqueness_constraints)}."
-
-        formatted_template = self.openai_template.format(
-            QUERY=query,
-            CLIENT_INFO=client_context_for_prompt,
-            GENERAL_INSTRUCTIONS=general_instructions,
-            ANSWER=drafted_answer,
-            DYNAMIC_NEGATIVE_CONSTRAINTS=dynamic_constraints_str
+
+        def render(constraints):
+            dynamic_constraints_str = ""
+            if constraints:
+                dynamic_constraints_str = f"Additionally, ABSOLUTELY AVOID phrases or ideas similar to these (from other variants for this query): {', '.join(constraints)}."
+            if fix_instructions:
+                fixes = "\n".join(f"- {instruction}" for instruction in fix_instructions)
+                dynamic_constraints_str = f"{dynamic_constraints_str}\nFix these problems found in the draft:\n{fixes}".strip()
+
+            prefix, suffix_template, role = self.openai_template
+            formatted_suffix = suffix_template.format(
+                QUERY=query,
+                CLIENT_INFO=client_context_for_prompt,
+                GENERAL_INSTRUCTIONS=general_instructions,
+                ANSWER=drafted_answer,
+                DYNAMIC_NEGATIVE_CONSTRAINTS=dynamic_constraints_str
+            )
+            return {"system_prompt": f"{role}\n\n{prefix}", "user_messages": [{"role": "user", "content": formatted_suffix}]}
+
+        return self._fit_to_budget("polish", render, dynamic_uniqueness_constraints)
+
+    def get_combined_claude_prompts(self, query, client_info, general_instructions, angles, dynamic_uniqueness_constraints=None):
+        """Drafting prompts for every variant at once ("combined" mode); the angles are tagged "[Variant N]"."""
+        client_context_for_prompt = f"Client Name: {client_info.get('name', 'N/A')}\nClient Guidelines:\n{client_info.get('guidelines', 'N/A')}"
+        tagged_angles = "\n".join(f"[Variant {i + 1}] {angle}" for i, angle in enumerate(angles))
+
+        def render(constraints):
+            dynamic_constraints_str = ""
+            if constraints:
+                dynamic_constraints_str = f"Additionally, DO NOT use phrases or ideas similar to these: {', '.join(constraints)}."
+
+            prefix, suffix_template, role = self.combined_claude_template
+            formatted_suffix = suffix_template.format(
+                NUM_VARIANTS=len(angles),
+                QUERY=query,
+                CLIENT_INFO=client_context_for_prompt,
+                GENERAL_INSTRUCTIONS=general_instructions,
+                ANGLES=tagged_angles,
+                DYNAMIC_NEGATIVE_CONSTRAINTS=dynamic_constraints_str
+            )
+            return {"system_prompt": f"{role}\n\n{prefix}", "user_messages": [{"role": "user", "content": formatted_suffix}]}
+
+        return self._fit_to_budget("combined_drafting", render, dynamic_uniqueness_constraints)
+
+    def get_combined_openai_prompts(self, query, client_info, general_instructions, drafts, fix_instructions=None):
+        """
+        Polish prompts for several drafts at once ("combined" mode). `drafts` is a list of
+        (variant number, draft); `fix_instructions` maps a variant number to the problems the
+        local validator found in its draft, which are never dropped for budget.
+        """
+        client_context_for_prompt = f"Client Name: {client_info.get('name', 'N/A')}\nClient Guidelines:\n{client_info.get('guidelines', 'N/A')}"
+        tagged_drafts = "\n\n".join(f"[Variant {number}]\n{draft}" for number, draft in drafts)
+        fixes = "\n".join(
+            f"- Variant {number}: {instruction}"
+            for number, instructions in sorted((fix_instructions or {}).items()) for instruction in instructions
         )
-        system_prompt = "You are a final editor for HARO responses. Refine the provided draft strictly adhering to all formatting, distinctness, and negative constraint rules, including ALL fixed and dynamic constraints."
-        user_prompt = formatted_template
 
-        return {"system_prompt": system_prompt, "user_messages": [{"role": "user", "content": user_prompt}]}
+        def render(constraints):
+            dynamic_constraints_str = f"Fix these problems found in the drafts:\n{fixes}" if fixes else ""
+            prefix, suffix_template, role = self.combined_openai_template
+            formatted_suffix = suffix_template.format(
+                QUERY=query,
+                CLIENT_INFO=client_context_for_prompt,
+                GENERAL_INSTRUCTIONS=general_instructions,
+                ANSWERS=tagged_drafts,
+                DYNAMIC_NEGATIVE_CONSTRAINTS=dynamic_constraints_str
+            )
+            return {"system_prompt": f"{role}\n\n{prefix}", "user_messages": [{"role": "user", "content": formatted_suffix}]}
+
+        return self._fit_to_budget("combined_polish", render, [])
 
-    def get_angle_generation_prompt(self, query, client_info, num_variants):
+    def get_angle_generation_prompt(self, query, client_info, num_variants, seed_angles=None):
+        """
+        `seed_angles` (angles of similar past queries, least similar first) are appended as
+        examples and, like dynamic constraints, are trimmed over budget, least similar first.
+        """
         client_name = client_info.get('name', 'N/A')
         client_guidelines = client_info.get('guidelines', 'N/A')
         
-        return self.angle_generation_template.format(
-            QUERY=query,
-            CLIENT_INFO=f"Client Name: {client_name}\nClient Guidelines:\n{client_guidelines}",
-            NUM_VARIANTS=num_variants
-        )
\ No newline at end of file
+        def render(constraints):
+            prompt = self.angle_generation_template.format(
+                QUERY=query,
+                CLIENT_INFO=f"Client Name: {client_name}\nClient Guidelines:\n{client_guidelines}",
+                NUM_VARIANTS=num_variants
+            )
+            if constraints:
+                prompt += ANGLE_SEEDS_PROMPT_PART.format(SEEDS="\n".join(f"- {angle}" for angle in reversed(constraints)))
+            return {"system_prompt": "", "user_messages": [{"role": "user", "content": prompt}]}
+
+        return self._fit_to_budget("angles", render, (seed_angles or [])[::-1])["user_messages"][0]["content"]
\ No newline at end of file
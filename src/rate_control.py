@@ -0,0 +1,331 @@
+# src/rate_control.py
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from src.config import (
+    PROVIDER_RATE_LIMITS,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS, CIRCUIT_BREAKER_HALF_OPEN_TIMEOUT_SECONDS
+)
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# Header names for (limit, remaining, reset) of each budget, per provider.
+_RATE_LIMIT_HEADERS = {
+    "openai": {
+        "requests": ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        "tokens": ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+    },
+    "anthropic": {
+        "requests": ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+        "tokens": ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+    },
+}
+
+
+def _parse_reset_seconds(value):
+    """OpenAI sends durations such as '6m0s' or '20ms'; Anthropic sends an RFC 3339 timestamp."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_SECONDS[unit] for number, unit in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - time.time())
+    except ValueError:
+        return None
+
+
+def _parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(request):
+    """Rough token cost of a request (~4 characters per token) plus its output allowance."""
+    chars = 0
+    for part in [request.get("system", "")] + [m.get("content", "") for m in request.get("messages", [])]:
+        if isinstance(part, list):
+            # Content blocks, e.g. a system prompt marked with cache_control.
+            chars += sum(len(str(block.get("text", ""))) for block in part)
+        else:
+            chars += len(str(part))
+    return chars // 4 + request.get("max_tokens", 0)
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        # A single request larger than the whole bucket only has to wait for a full bucket.
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def adapt(self, limit=None, remaining=None, reset_seconds=None, now=None):
+        """Re-sizes the bucket to the provider's per-minute limit and trusts its remaining count."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if limit:
+            self.capacity = limit
+            self.refill_per_second = limit / 60.0
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if reset_seconds and remaining < self.capacity:
+                # The provider refills to its limit by the reset time; never refill slower than that.
+                self.refill_per_second = max(self.refill_per_second, (self.capacity - remaining) / reset_seconds)
+
+
+class ProviderRateLimiter:
+    """Request-per-minute and token-per-minute buckets for one provider."""
+
+    def __init__(self, provider, requests_per_minute, tokens_per_minute):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.blocked_until = 0.0
+
+    def _now(self):
+        return time.monotonic()
+
+    def _reserve(self, estimated_tokens):
+        """Takes one request and the estimated tokens if both are available; else returns the wait in seconds."""
+        now = self._now()
+        wait = max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(estimated_tokens, now)
+        )
+        if wait <= 0:
+            # No await between the check and the consume, so this is atomic on the event loop.
+            self.requests.consume(1, now)
+            self.tokens.consume(estimated_tokens, now)
+        return wait
+
+    async def _reserve_async(self, estimated_tokens):
+        return self._reserve(estimated_tokens)
+
+    async def acquire(self, estimated_tokens):
+        while True:
+            wait = await self._reserve_async(estimated_tokens)
+            if wait <= 0:
+                return
+            logger.info(f"Rate limiter for {self.provider} waiting {wait:.2f}s.")
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+        header_names = _RATE_LIMIT_HEADERS.get(self.provider, {})
+        for budget, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            if budget not in header_names:
+                continue
+            limit_header, remaining_header, reset_header = header_names[budget]
+            limit = _parse_number(headers.get(limit_header))
+            remaining = _parse_number(headers.get(remaining_header))
+            if limit is None and remaining is None:
+                continue
+            bucket.adapt(limit, remaining, _parse_reset_seconds(headers.get(reset_header)), now=self._now())
+
+    def pause(self, seconds):
+        """Holds every new request for this provider, e.g. after a 429 with Retry-After."""
+        self.blocked_until = max(self.blocked_until, self._now() + seconds)
+
+    def close(self):
+        pass
+
+
+class SharedProviderRateLimiter(ProviderRateLimiter):
+    """
+    A ProviderRateLimiter whose buckets and pause live in a SQLite file, so every process
+    using the same `path` (e.g. the workers of src/worker.py) draws from one request and
+    token budget per provider. Each reserve, header update and pause is one short write
+    transaction; times are wall-clock so they mean the same in every process.
+
+    The transactions run in order on one thread per limiter, never on the event loop: waiting
+    for another process's write lock must not stall every other call of this process. Header
+    updates and pauses are queued there without waiting for them, and a later reserve sees them.
+    """
+
+    def __init__(self, provider, requests_per_minute, tokens_per_minute, path):
+        super().__init__(provider, requests_per_minute, tokens_per_minute)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"rate-limit-{provider}")
+        now = self._now()
+        self.requests.updated_at = self.tokens.updated_at = now
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS shared_rate_limits (provider TEXT PRIMARY KEY, state TEXT NOT NULL)")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO shared_rate_limits (provider, state) VALUES (?, ?)",
+            (provider, json.dumps(self._state()))
+        )
+
+    def _now(self):
+        return time.time()
+
+    def _state(self):
+        return {
+            "blocked_until": self.blocked_until,
+            "requests": [self.requests.capacity, self.requests.refill_per_second, self.requests.tokens, self.requests.updated_at],
+            "tokens": [self.tokens.capacity, self.tokens.refill_per_second, self.tokens.tokens, self.tokens.updated_at],
+        }
+
+    def _load_state(self, state):
+        self.blocked_until = state["blocked_until"]
+        for bucket, values in ((self.requests, state["requests"]), (self.tokens, state["tokens"])):
+            bucket.capacity, bucket.refill_per_second, bucket.tokens, bucket.updated_at = values
+
+    def _in_transaction(self, update):
+        """Runs `update()` on the provider's shared state, read and written back in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM shared_rate_limits WHERE provider = ?", (self.provider,)).fetchone()
+                if row is not None:
+                    self._load_state(json.loads(row[0]))
+                result = update()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO shared_rate_limits (provider, state) VALUES (?, ?)",
+                    (self.provider, json.dumps(self._state()))
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _submit(self, update):
+        """Queues `update()` as a transaction on the limiter's thread without waiting for it."""
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.warning(f"Shared rate limiter for {self.provider} failed to save an update: {future.exception()}")
+        self._executor.submit(self._in_transaction, update).add_done_callback(log_failure)
+
+    def _reserve(self, estimated_tokens):
+        return self._in_transaction(lambda: ProviderRateLimiter._reserve(self, estimated_tokens))
+
+    async def _reserve_async(self, estimated_tokens):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._reserve, estimated_tokens)
+
+    def update_from_headers(self, headers):
+        if headers:
+            headers = {name.lower(): value for name, value in headers.items()}
+            self._submit(lambda: ProviderRateLimiter.update_from_headers(self, headers))
+
+    def pause(self, seconds):
+        self._submit(lambda: ProviderRateLimiter.pause(self, seconds))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive server-side failures so calls fail fast,
+    then lets a single trial call through after `reset_seconds` (half-open). The caller
+    reports the trial's outcome; a trial that ends without one (cancelled, or an error that is
+    neither a success nor a server-side failure) goes through record_abandoned(), and one
+    still unresolved after `half_open_timeout` is written off, so the circuit never stays
+    half-open.
+    """
+
+    def __init__(self, provider, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_BREAKER_RESET_SECONDS,
+                 half_open_timeout=CIRCUIT_BREAKER_HALF_OPEN_TIMEOUT_SECONDS):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_timeout = half_open_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_opened_at = 0.0
+
+    def before_call(self):
+        """Raises CircuitOpenError to fail fast; returns True when this call is the half-open trial."""
+        if self.state == "closed":
+            return False
+        now = time.monotonic()
+        if self.state == "half_open" and now - self.half_opened_at >= self.half_open_timeout:
+            logger.warning(f"Circuit for {self.provider} trial request gave no outcome in {self.half_open_timeout}s; sending another.")
+            self.half_opened_at = now
+            return True
+        if self.state == "open" and now - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self.half_opened_at = now
+            logger.info(f"Circuit for {self.provider} half-open; sending a trial request.")
+            return True
+        raise CircuitOpenError(f"{self.provider} circuit is open after {self.consecutive_failures} consecutive failures; failing fast.")
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.provider} closed again.")
+        self.state = "closed"
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit for {self.provider} opened after {self.consecutive_failures} consecutive failures.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """The trial ended without an outcome: open again, so the next trial waits `reset_seconds`."""
+        if self.state == "half_open":
+            logger.info(f"Circuit for {self.provider} trial request ended without an outcome; open again.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+def build_rate_limiters(limits=None, shared_path=None):
+    """Per-provider limiters; with `shared_path`, limiters whose budget is shared through that SQLite file."""
+    limits = PROVIDER_RATE_LIMITS if limits is None else limits
+    if shared_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(shared_path)), exist_ok=True)
+        return {
+            provider: SharedProviderRateLimiter(provider, budget["requests_per_minute"], budget["tokens_per_minute"], shared_path)
+            for provider, budget in limits.items()
+        }
+    return {
+        provider: ProviderRateLimiter(provider, budget["requests_per_minute"], budget["tokens_per_minute"])
+        for provider, budget in limits.items()
+    }
+
+
+def build_circuit_breakers(providers):
+    return {provider: CircuitBreaker(provider) for provider in providers}
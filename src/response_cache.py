@@ -0,0 +1,104 @@
+# src/response_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.config import (
+    RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_STAGES
+)
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class ResponseCache:
+    """
+    Content-addressed, disk-backed cache for LLM response texts.
+    Keys are a SHA-256 of the provider and the complete request (model, prompts, temperature,
+    max_tokens), so any change to a prompt built by PromptManager is a miss.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 enabled_stages=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled_stages = dict(RESPONSE_CACHE_STAGES if enabled_stages is None else enabled_stages)
+        self.stats = {stage: {"hits": 0, "misses": 0} for stage in self.enabled_stages}
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses ("
+            " key TEXT PRIMARY KEY, stage TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access)")
+
+    def is_enabled(self, stage):
+        return self.enabled_stages.get(stage, False)
+
+    @staticmethod
+    def make_key(provider, request):
+        payload = json.dumps({"provider": provider, "request": request}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, stage, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                row = None
+            stage_stats = self.stats.setdefault(stage, {"hits": 0, "misses": 0})
+            if row is None:
+                stage_stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+            stage_stats["hits"] += 1
+        logger.info(f"Response cache hit for {stage} ({key[:12]}).")
+        return row[0]
+
+    def put(self, stage, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, stage, value, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, value, len(value.encode("utf-8")), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses").fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        # Walk entries from least to most recently used until both limits hold again.
+        evict_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_responses ORDER BY last_access ASC"):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evict_keys.append((key,))
+            count -= 1
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", evict_keys)
+        logger.info(f"Response cache evicted {len(evict_keys)} least recently used entries.")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
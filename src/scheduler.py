@@ -0,0 +1,207 @@
+# src/scheduler.py
+"""
+Deadline- and tier-aware scheduling of the queries running on one AIService.
+
+Queries are admitted SCHEDULER_MAX_ACTIVE_QUERIES at a time, and their API calls get the
+per-provider call slots, in priority order instead of arrival order:
+  * a query whose deadline is less than SCHEDULER_URGENT_SECONDS away is urgent; urgent work
+    goes first, earliest deadline first;
+  * all other work is shared between clients by weighted fair queuing: the client with the
+    least service so far, weighted by its tier (CLIENT_TIER_WEIGHTS), goes next.
+Priority queueing is the whole mechanism: an urgent call arriving when every slot of a
+provider is taken gets the next slot that frees up, ahead of every non-urgent waiter. Calls
+already running are never preempted; they are being billed, and cancelling them would only
+waste that work.
+
+A query's priority reaches its API calls through a context variable, which asyncio copies
+into every task the query starts, so the pipeline does not pass it along explicitly.
+"""
+
+import asyncio
+import collections
+import contextvars
+import itertools
+import math
+import time
+
+from src.config import (
+    SCHEDULER_MAX_ACTIVE_QUERIES, SCHEDULER_URGENT_SECONDS,
+    SCHEDULER_LATENCY_WINDOW, CLIENT_TIERS, CLIENT_TIER_WEIGHTS, DEFAULT_CLIENT_TIER
+)
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+_current_priority = contextvars.ContextVar("haro_query_priority", default=None)
+
+
+class QueryPriority:
+    """Who a query is for and when it is due (`deadline` as a Unix timestamp, or None)."""
+
+    def __init__(self, client, tier=DEFAULT_CLIENT_TIER, deadline=None):
+        self.client = client
+        self.tier = tier
+        self.deadline = deadline
+        self.weight = CLIENT_TIER_WEIGHTS.get(tier, CLIENT_TIER_WEIGHTS.get(DEFAULT_CLIENT_TIER, 1.0))
+
+    def is_urgent(self, now=None):
+        return self.deadline is not None and self.deadline - (now or time.time()) <= SCHEDULER_URGENT_SECONDS
+
+    def queue(self):
+        """The latency report queue: "urgent", or the client tier."""
+        return "urgent" if self.is_urgent() else self.tier
+
+
+def priority_for(client_info, deadline=None):
+    """The priority of a query for `client_info`: its "tier", else CLIENT_TIERS by client name."""
+    name = client_info.get("name", "N/A")
+    return QueryPriority(name, client_info.get("tier") or CLIENT_TIERS.get(name, DEFAULT_CLIENT_TIER), deadline)
+
+
+_DEFAULT_PRIORITY = QueryPriority("N/A")
+
+
+class _Holder:
+    def __init__(self, priority):
+        self.priority = priority
+        self.task = None
+
+
+class PrioritySlots:
+    """
+    A fixed number of slots, handed to waiters by the scheduler's priority order rather than
+    first come, first served. Work runs through run().
+    """
+
+    def __init__(self, scheduler, limit):
+        self.scheduler = scheduler
+        self.limit = limit
+        self._holders = set()
+        self._waiters = []
+
+    async def run(self, make_call):
+        """Runs `make_call()` (a coroutine function) in a slot and returns its result."""
+        priority = _current_priority.get() or _DEFAULT_PRIORITY
+        holder = await self._acquire(priority)
+        holder.task = asyncio.ensure_future(make_call())
+        try:
+            return await holder.task
+        finally:
+            if not holder.task.done():
+                holder.task.cancel()
+            self._release(holder)
+
+    def resize(self, limit):
+        """Changes the number of slots; waiters get any added ones at once."""
+        self.limit = limit
+        self._grant_waiters()
+
+    async def _acquire(self, priority):
+        if len(self._holders) < self.limit and not self._waiters:
+            return self._grant(priority)
+        waiter = (priority, next(self.scheduler.sequence), asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            return await waiter[2]
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter[2].done() and not waiter[2].cancelled():
+                self._release(waiter[2].result())
+            raise
+
+    def _grant(self, priority):
+        holder = _Holder(priority)
+        self._holders.add(holder)
+        self.scheduler.charge(priority)
+        return holder
+
+    def _release(self, holder):
+        if holder not in self._holders:
+            return
+        self._holders.discard(holder)
+        self._grant_waiters()
+
+    def _grant_waiters(self):
+        while self._waiters and len(self._holders) < self.limit:
+            now = time.time()
+            waiter = min(self._waiters, key=lambda w: self.scheduler.sort_key(w[0], w[1], now))
+            self._waiters.remove(waiter)
+            if not waiter[2].done():
+                waiter[2].set_result(self._grant(waiter[0]))
+
+class QueryScheduler:
+    """Query admission, the fair-share state behind every PrioritySlots, and the latency report."""
+
+    def __init__(self, max_active_queries=SCHEDULER_MAX_ACTIVE_QUERIES):
+        self.sequence = itertools.count()
+        # Weighted service received per client; new clients start level with the least served.
+        self._virtual_time = {}
+        self._query_slots = PrioritySlots(self, max_active_queries)
+        self._latencies = {}
+
+    def sort_key(self, priority, sequence, now):
+        if priority.is_urgent(now):
+            return (0, priority.deadline, sequence)
+        return (1, self._client_time(priority.client), sequence)
+
+    def _client_time(self, client):
+        if client not in self._virtual_time:
+            self._virtual_time[client] = min(self._virtual_time.values(), default=0.0)
+        return self._virtual_time[client]
+
+    def charge(self, priority):
+        self._virtual_time[priority.client] = self._client_time(priority.client) + 1.0 / priority.weight
+
+    def allow_active_queries(self, count):
+        """
+        Raises the admission limit to `count` queries if it is lower, for callers that bound
+        their own concurrency (the batch CLI and the workers' --concurrency).
+        """
+        if count > self._query_slots.limit:
+            logger.info(f"Admitting up to {count} queries at a time instead of {self._query_slots.limit} (SCHEDULER_MAX_ACTIVE_QUERIES).")
+            self._query_slots.resize(count)
+
+    async def run_query(self, priority, make_query):
+        """Runs `make_query()` once admitted, with `priority` applying to all of its API calls."""
+        queue = priority.queue()
+        queued_at = time.monotonic()
+        started_at = []
+
+        async def admitted():
+            started_at.append(time.monotonic())
+            return await make_query()
+
+        token = _current_priority.set(priority)
+        try:
+            return await self._query_slots.run(admitted)
+        finally:
+            _current_priority.reset(token)
+            if started_at:
+                self._record(queue, priority, started_at[0] - queued_at, time.monotonic() - queued_at)
+
+    def _record(self, queue, priority, wait_seconds, total_seconds):
+        samples = self._latencies.setdefault(queue, collections.deque(maxlen=SCHEDULER_LATENCY_WINDOW))
+        samples.append((wait_seconds, total_seconds, priority.deadline is not None and time.time() > priority.deadline))
+
+    def latency_report(self):
+        """Per queue ("urgent" or client tier) over recent queries: count, p50/p95 wait and total seconds, missed deadlines."""
+        report = {}
+        for queue, samples in self._latencies.items():
+            waits = sorted(sample[0] for sample in samples)
+            totals = sorted(sample[1] for sample in samples)
+            report[queue] = {
+                "queries": len(samples),
+                "p50_wait_seconds": round(_percentile(waits, 0.50), 2),
+                "p95_wait_seconds": round(_percentile(waits, 0.95), 2),
+                "p50_seconds": round(_percentile(totals, 0.50), 2),
+                "p95_seconds": round(_percentile(totals, 0.95), 2),
+                "missed_deadlines": sum(1 for sample in samples if sample[2]),
+            }
+        return report
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
@@ -0,0 +1,74 @@
+# src/service_runtime.py
+
+import asyncio
+import atexit
+import threading
+
+from src.ai_integrations import AIService
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class ServiceRuntime:
+    """
+    A background thread running one event loop for the life of the process, with a single
+    AIService created on it. Its HTTP connection pools, semaphores and rate limiters are bound
+    to that loop, so they survive Streamlit reruns and are shared by every session.
+    """
+
+    def __init__(self):
+        self._closed = False
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="haro-ai-runtime", daemon=True)
+        self._thread.start()
+        self.ai_service = self.run(self._create_service())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _create_service(self):
+        return AIService()
+
+    def submit(self, coro):
+        """Schedules a coroutine on the runtime loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Runs a coroutine on the runtime loop and blocks the calling thread for its result."""
+        return self.submit(coro).result(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.run(self.ai_service.close(), timeout=10)
+        except Exception as e:
+            logger.warning(f"Error while closing the shared AIService: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+        self.loop.close()
+        logger.info("Shared AI service runtime closed.")
+
+
+_shared_runtime = None
+_shared_runtime_lock = threading.Lock()
+
+def get_shared_runtime():
+    """Returns the process-wide ServiceRuntime, starting it on first use."""
+    global _shared_runtime
+    with _shared_runtime_lock:
+        if _shared_runtime is None:
+            _shared_runtime = ServiceRuntime()
+            atexit.register(shutdown_shared_runtime)
+            logger.info("Shared AI service runtime started.")
+        return _shared_runtime
+
+def shutdown_shared_runtime():
+    global _shared_runtime
+    with _shared_runtime_lock:
+        if _shared_runtime is not None:
+            _shared_runtime.close()
+            _shared_runtime = None
@@ -0,0 +1,91 @@
+# src/settings.py
+"""
+Layered lookup of the settings src/config.py reads, so worker and CLI processes can load the
+config without the UI stack. A name is looked up in, first match wins:
+
+  1. Streamlit secrets, only when Streamlit is already imported (i.e. in the app process);
+  2. the secrets TOML file: HARO_SECRETS_PATH if set, else .streamlit/secrets.toml in the
+     project and then in the home directory (the files Streamlit itself reads);
+  3. the environment, after loading .env when python-dotenv is installed;
+  4. the given default.
+
+Each source is read once, on the first lookup.
+"""
+
+import functools
+import logging
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+def _secrets_paths():
+    explicit = os.environ.get("HARO_SECRETS_PATH")
+    if explicit:
+        return [explicit]
+    return [
+        os.path.join(PROJECT_ROOT, ".streamlit", "secrets.toml"),
+        os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+    ]
+
+
+def _read_toml(path):
+    # Imported only when a secrets file exists; the TOML parser costs more than the rest of the config.
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import toml
+        with open(path, encoding="utf-8") as f:
+            return toml.load(f)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def _file_secrets():
+    """The first secrets TOML file that exists, as a dict (empty when there is none or it is unreadable)."""
+    for path in _secrets_paths():
+        if os.path.exists(path):
+            try:
+                return _read_toml(path)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable secrets file {path}: {e}")
+                return {}
+    return {}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_dotenv():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return False
+    return load_dotenv()
+
+
+def _streamlit_secret(name):
+    streamlit = sys.modules.get("streamlit")
+    if streamlit is None:
+        return _MISSING
+    try:
+        return streamlit.secrets.get(name, _MISSING)
+    except Exception:
+        # st.secrets raises when no secrets file exists at all.
+        return _MISSING
+
+
+def get_setting(name, default=None):
+    """The value of setting `name` from the first source that has it (see the module docstring)."""
+    value = _streamlit_secret(name)
+    if value is not _MISSING:
+        return value
+    secrets = _file_secrets()
+    if name in secrets:
+        return secrets[name]
+    _load_dotenv()
+    return os.environ.get(name, default)
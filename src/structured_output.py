@@ -0,0 +1,76 @@
+# src/structured_output.py
+"""
+The JSON returned by the "combined" variant mode calls: {"variants": [{"variant": N, "answer": "..."}]}.
+VARIANTS_SCHEMA is sent to the providers (Claude tool input schema, OpenAI strict json_schema)
+and the same rules are checked locally, entry by entry, so one bad entry only sends its own
+variant back to the per-variant calls.
+"""
+
+import json
+import re
+
+VARIANTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "variants": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "variant": {"type": "integer"},
+                    "answer": {"type": "string"},
+                },
+                "required": ["variant", "answer"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["variants"],
+    "additionalProperties": False,
+}
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def load_json_object(text):
+    """The JSON object in a model response (bare, in a code fence, or with text around it), or None."""
+    text = _CODE_FENCE.sub("", (text or "").strip())
+    candidates = [text]
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end:
+        candidates.append(text[start:end + 1])
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def parse_variant_answers(text, count):
+    """
+    A list of `count` answers (index 0 = variant 1) from a combined-call response. An entry is
+    None when its variant is missing, repeated, or not a non-empty string answer; all are None
+    when the response is not an object with a "variants" list.
+    """
+    answers = [None] * count
+    document = load_json_object(text)
+    if document is None or not isinstance(document.get("variants"), list):
+        return answers
+    seen = set()
+    for entry in document["variants"]:
+        if not isinstance(entry, dict):
+            continue
+        number, answer = entry.get("variant"), entry.get("answer")
+        if isinstance(number, bool) or not isinstance(number, int) or not 1 <= number <= count:
+            continue
+        if number in seen:
+            # Two answers claim the same variant: trust neither.
+            answers[number - 1] = None
+            continue
+        seen.add(number)
+        if isinstance(answer, str) and answer.strip():
+            answers[number - 1] = answer.strip()
+    return answers
@@ -0,0 +1,144 @@
+# src/uniqueness.py
+
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from src.config import (
+    UNIQUENESS_HASH_FEATURES, UNIQUENESS_NGRAM_RANGE,
+    UNIQUENESS_MAX_AVOID_PHRASES, UNIQUENESS_SIMILARITY_THRESHOLD
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_CLAUSE_BREAK = re.compile(r"[.!?;:,\n]+")
+_STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does for from
+had has have how i if in into is it it's its just like more most much my no not now of on one only or
+our out over so some such than that that's the their them then there these they this those through
+to too up us very was way we we're what when where which while who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or "").lower())
+
+
+def ngram_counts(text, ngram_range=UNIQUENESS_NGRAM_RANGE):
+    """
+    Word n-gram counts within each clause (n-grams never span punctuation); n-grams made only
+    of stopwords carry no signal and are dropped.
+    """
+    counts = Counter()
+    for clause in _CLAUSE_BREAK.split(text or ""):
+        tokens = tokenize(clause)
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(tokens) - n + 1):
+                gram = tokens[i:i + n]
+                if all(token in _STOPWORDS for token in gram):
+                    continue
+                counts[" ".join(gram)] += 1
+    return counts
+
+
+def _feature_index(ngram, n_features):
+    # crc32 rather than hash(): stable across processes and Python runs.
+    return zlib.crc32(ngram.encode("utf-8")) % n_features
+
+
+def hashed_tf_matrix(texts, n_features=UNIQUENESS_HASH_FEATURES, ngram_range=UNIQUENESS_NGRAM_RANGE):
+    """Sublinear term frequencies of hashed n-grams, one row per text."""
+    matrix = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        counts = ngram_counts(text, ngram_range)
+        if not counts:
+            continue
+        columns = np.fromiter((_feature_index(g, n_features) for g in counts), dtype=np.int64, count=len(counts))
+        values = np.fromiter((1.0 + np.log(c) for c in counts.values()), dtype=np.float32, count=len(counts))
+        np.add.at(matrix[row], columns, values)
+    return matrix
+
+
+def l2_normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def tfidf_matrix(texts, n_features=UNIQUENESS_HASH_FEATURES, ngram_range=UNIQUENESS_NGRAM_RANGE):
+    """L2-normalized TF-IDF vectors with the IDF taken over `texts` themselves."""
+    tf = hashed_tf_matrix(texts, n_features, ngram_range)
+    document_frequency = np.count_nonzero(tf, axis=0)
+    idf = np.log((1.0 + len(texts)) / (1.0 + document_frequency)) + 1.0
+    return l2_normalize(tf * idf.astype(np.float32))
+
+
+def similarity_matrix(texts):
+    """Pairwise cosine similarity of the texts' TF-IDF vectors (1.0 on the diagonal)."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    vectors = tfidf_matrix(texts)
+    return vectors @ vectors.T
+
+
+def too_similar_indices(texts, threshold=UNIQUENESS_SIMILARITY_THRESHOLD):
+    """
+    Indices of texts that overlap a sibling above `threshold`. For each offending pair only
+    the later text is returned, so the earlier one is kept.
+    """
+    similarities = similarity_matrix(texts)
+    offenders = set()
+    for i in range(len(texts)):
+        for j in range(i + 1, len(texts)):
+            if j not in offenders and i not in offenders and similarities[i, j] > threshold:
+                offenders.add(j)
+    return sorted(offenders)
+
+
+def max_sibling_similarity(texts):
+    """Each text's highest similarity to any other text."""
+    if len(texts) < 2:
+        return [0.0] * len(texts)
+    similarities = similarity_matrix(texts)
+    np.fill_diagonal(similarities, 0.0)
+    return [round(float(value), 3) for value in similarities.max(axis=1)]
+
+
+def avoid_phrases(texts, max_phrases=UNIQUENESS_MAX_AVOID_PHRASES):
+    """
+    A compact list of phrases later variants must not reuse: each text's opening words plus
+    its most distinctive multi-word phrases, taken round-robin so every text is represented.
+    Used in prompts instead of shipping whole previous answers.
+    """
+    texts = [text for text in texts if text and text.strip()]
+    if not texts or max_phrases <= 0:
+        return []
+
+    per_text = [ngram_counts(text, (2, 3)) for text in texts]
+    document_frequency = Counter(gram for counts in per_text for gram in counts)
+    candidates = []
+    for text, counts in zip(texts, per_text):
+        opening = " ".join(text.split()[:6])
+        # Favour longer phrases that are rare across the texts; skip ones starting or ending on a stopword.
+        ranked = sorted(
+            (gram for gram in counts
+             if gram.split()[0] not in _STOPWORDS and gram.split()[-1] not in _STOPWORDS),
+            key=lambda gram: (counts[gram] * len(gram.split()) / document_frequency[gram], gram),
+            reverse=True
+        )
+        candidates.append([opening] + ranked)
+
+    phrases = []
+    for rank in range(max(len(c) for c in candidates)):
+        for text_candidates in candidates:
+            if rank >= len(text_candidates):
+                continue
+            phrase = text_candidates[rank]
+            # Skip phrases already covered by (or covering) one that was picked.
+            if any(phrase.lower() in picked.lower() or picked.lower() in phrase.lower() for picked in phrases):
+                continue
+            phrases.append(phrase)
+            if len(phrases) >= max_phrases:
+                return phrases
+    return phrases
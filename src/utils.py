@@ -2,7 +2,16 @@
 
 import logging
 import asyncio
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import anthropic
+import httpx
+import openai
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception
+
+from src.config import RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -10,14 +19,96 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def get_logger(name):
     return logging.getLogger(name)
 
-@retry(stop=stop_after_attempt(5), wait=wait_fixed(2), retry=retry_if_exception_type(Exception))
+def parse_client_info(client_info_text_raw, default_name):
+    """
+    Parses the "Client Name & Specific Guidelines" text: the client's name on the first line,
+    guidelines on the following lines.
+    """
+    client_name = ""
+    client_guidelines = ""
+    if client_info_text_raw:
+        lines = client_info_text_raw.strip().split('\n', 1)
+        client_name = lines[0].strip()
+        if len(lines) > 1:
+            client_guidelines = lines[1].strip()
+
+    return {
+        "name": client_name if client_name else default_name,
+        "guidelines": client_guidelines
+    }
+
+# Network-level failures that are worth another attempt even though no HTTP status came back.
+_TRANSIENT_ERRORS = (
+    openai.APIConnectionError, anthropic.APIConnectionError,
+    httpx.TransportError, asyncio.TimeoutError, ConnectionError,
+)
+# 408 timeout, 409 lock conflict, 429 rate limit, 5xx server errors, 529 Anthropic overloaded.
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def error_status_code(exc):
+    status_code = getattr(exc, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def retry_after_seconds(exc):
+    """
+    Returns the server-requested wait from the Retry-After / retry-after-ms headers of a
+    failed call, or None when the provider did not send one.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(exc):
+    """Rate limits, overloads, server errors and dropped connections are retried; 400s and auth errors are not."""
+    status_code = error_status_code(exc)
+    if status_code is not None:
+        return status_code in _RETRYABLE_STATUS_CODES
+    return isinstance(exc, _TRANSIENT_ERRORS)
+
+
+_jittered_exponential = wait_random_exponential(multiplier=RETRY_BASE_DELAY_SECONDS, max=RETRY_MAX_DELAY_SECONDS)
+
+def _wait_before_retry(retry_state):
+    """Honours the provider's Retry-After when present, otherwise full-jitter exponential backoff."""
+    retry_after = retry_after_seconds(retry_state.outcome.exception())
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY_SECONDS) + random.uniform(0, RETRY_BASE_DELAY_SECONDS)
+    return _jittered_exponential(retry_state)
+
+
+@retry(
+    stop=stop_after_attempt(RETRY_MAX_ATTEMPTS),
+    wait=_wait_before_retry,
+    retry=retry_if_exception(is_retryable_error),
+    reraise=True
+)
 async def safe_async_call(func, *args, **kwargs):
     """
     A decorator for safe asynchronous function calls with retries.
-    Adjust retry conditions based on specific API error types (e.g., rate limits).
+    Only retryable errors (see is_retryable_error) are retried, with jittered exponential backoff.
     """
     try:
         return await func(*args, **kwargs)
     except Exception as e:
         get_logger(__name__).error(f"Error during async call: {e}")
-        raise # Re-raise to trigger tenacity retry
\ No newline at end of file
+        raise # Re-raise to trigger tenacity retry
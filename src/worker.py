@@ -0,0 +1,191 @@
+# src/worker.py
+"""
+Worker processes that run the queries of queued jobs from the shared job store.
+
+    python -m src.worker --workers 4 [--concurrency 4] [--store .cache/jobs.sqlite3]
+
+Each worker leases queries of queued or running jobs, renews the leases of its in-flight
+queries on a heartbeat and writes every result back as soon as it finishes; a job is done
+when its last query is. If a worker dies, its leases expire and another worker picks the
+queries up. All workers draw from one request and token budget per provider, kept in a
+shared SQLite file, so adding workers adds throughput up to the provider limits instead of
+429s. Run the app with HARO_JOB_EXECUTION=workers so it only queues jobs for the workers.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+
+from src.ai_integrations import AIService
+from src.config import (
+    JOB_STORE_PATH, WORKER_DEFAULT_PROCESSES, WORKER_QUERIES_PER_PROCESS, WORKER_LEASE_SECONDS,
+    WORKER_POLL_SECONDS, WORKER_MAX_QUERY_ATTEMPTS, WORKER_RATE_LIMIT_PATH
+)
+from src.job_queue import JobStore, run_query
+from src.rate_control import build_rate_limiters
+from src.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class QueryWorker:
+    """Claims up to `concurrency` queries at a time from `store` and runs them on `ai_service`."""
+
+    def __init__(self, store, ai_service, worker_id, concurrency=WORKER_QUERIES_PER_PROCESS,
+                 lease_seconds=WORKER_LEASE_SECONDS, poll_seconds=WORKER_POLL_SECONDS,
+                 max_attempts=WORKER_MAX_QUERY_ATTEMPTS):
+        self.store = store
+        self.ai_service = ai_service
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self._in_flight = {}
+        self._slot_freed = asyncio.Event()
+
+    async def run(self, stop):
+        """Works until `stop` (an asyncio.Event) is set, then hands unfinished queries back."""
+        heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info(f"Worker {self.worker_id} started.")
+        try:
+            while not stop.is_set():
+                free_slots = self.concurrency - len(self._in_flight)
+                claimed = []
+                if free_slots > 0:
+                    claimed = self.store.claim_queries(self.worker_id, free_slots, self.lease_seconds, self.max_attempts)
+                for item in claimed:
+                    key = (item["job_id"], item["query_id"])
+                    task = asyncio.create_task(self._run_query(item))
+                    self._in_flight[key] = task
+                    task.add_done_callback(lambda _, key=key: self._query_done(key))
+                if claimed and len(self._in_flight) < self.concurrency:
+                    continue
+                # Full: wait for a slot. Idle: poll the store for new work.
+                await self._wait(stop, None if len(self._in_flight) >= self.concurrency else self.poll_seconds)
+        finally:
+            heartbeat.cancel()
+            unfinished = list(self._in_flight)
+            for task in list(self._in_flight.values()):
+                task.cancel()
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+            self.store.release_leases(self.worker_id, unfinished)
+            logger.info(f"Worker {self.worker_id} stopped; {len(unfinished)} unfinished queries handed back.")
+
+    async def _wait(self, stop, timeout):
+        """Waits for a freed slot, the stop signal or the timeout, whichever comes first."""
+        self._slot_freed.clear()
+        waiters = [asyncio.ensure_future(self._slot_freed.wait()), asyncio.ensure_future(stop.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    def _query_done(self, key):
+        self._in_flight.pop(key, None)
+        self._slot_freed.set()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if self._in_flight:
+                self.store.renew_leases(self.worker_id, list(self._in_flight), self.lease_seconds)
+
+    async def _run_query(self, item):
+        key = (item["job_id"], item["query_id"])
+        try:
+            result = await run_query(self.ai_service, item["query"], item["client_info"], item["parameters"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Handed back for another attempt (up to max_attempts leases in total).
+            logger.exception(f"Worker {self.worker_id}: query {item['query_id']} of job {item['job_id']} failed: {e}")
+            self.store.release_leases(self.worker_id, [key])
+            return
+        self.store.save_result(item["job_id"], result)
+        if self.store.complete_job_if_finished(item["job_id"]):
+            logger.info(f"Job {item['job_id']} finished.")
+
+
+async def _run_worker(args, worker_id):
+    store = JobStore(args.store)
+    ai_service = AIService(rate_limiters=build_rate_limiters(shared_path=args.rate_limit_store))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop.set)
+        except (NotImplementedError, RuntimeError):  # Windows event loops have no signal handlers.
+            pass
+    worker = QueryWorker(
+        store, ai_service, worker_id, concurrency=max(1, args.concurrency),
+        lease_seconds=args.lease_seconds, poll_seconds=args.poll_seconds
+    )
+    # Queries this worker leased should run now, not queue behind SCHEDULER_MAX_ACTIVE_QUERIES.
+    ai_service.scheduler.allow_active_queries(worker.concurrency)
+    try:
+        await worker.run(stop)
+    finally:
+        await ai_service.close()
+        store.close()
+
+
+def run_worker(worker_num, args):
+    """Entry point of one worker process."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{worker_num}"
+    try:
+        asyncio.run(_run_worker(args, worker_id))
+    except KeyboardInterrupt:
+        pass
+
+
+def _interrupt(signal_number, frame):
+    raise KeyboardInterrupt
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Run queued HARO jobs on local worker processes.")
+    parser.add_argument("-w", "--workers", type=int, default=WORKER_DEFAULT_PROCESSES, help="Worker processes to start.")
+    parser.add_argument("-c", "--concurrency", type=int, default=WORKER_QUERIES_PER_PROCESS, help="Queries in flight per worker.")
+    parser.add_argument("--store", default=JOB_STORE_PATH, help="Job store shared with the app.")
+    parser.add_argument("--rate-limit-store", default=WORKER_RATE_LIMIT_PATH, help="SQLite file holding the shared rate budget.")
+    parser.add_argument("--lease-seconds", type=float, default=WORKER_LEASE_SECONDS)
+    parser.add_argument("--poll-seconds", type=float, default=WORKER_POLL_SECONDS)
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.workers <= 1:
+        run_worker(0, args)
+        return 0
+
+    # Stopping the parent (Ctrl-C or SIGTERM) stops every worker it started.
+    signal.signal(signal.SIGTERM, _interrupt)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(i, args), name=f"haro-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} worker processes on {args.store}.")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Each worker hands its unfinished queries back before exiting.
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# tests/test_bulk_batch.py
+"""
+Full bulk runs through the real batch transports, against the batch APIs of
+benchmarks/fake_llm_server.py.
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("anthropic")
+pytest.importorskip("openai")
+test_utils = pytest.importorskip("aiohttp.test_utils")
+
+from fake_llm_server import FakeLLMServer
+from src.ai_integrations import AIService
+from src.angle_index import AngleIndex
+from src.bulk_batch import BatchJobError, BatchTransport, BulkBatchRunner, OpenAIBatchTransport
+from src.config import NUM_VARIANTS_PER_QUERY
+from src.response_cache import ResponseCache
+
+QUERIES = [
+    {"id": 11, "text": "How are small e-commerce brands cutting return rates this season?",
+     "client_info": {"name": "Client A", "guidelines": "Founder of a mid-size agency."}},
+    {"id": 12, "text": "Which hiring mistakes do first-time founders regret most?",
+     "client_info": {"name": "Client B", "guidelines": "Head of people at a startup."}},
+]
+
+
+@pytest.fixture(autouse=True)
+def polish_every_draft(monkeypatch):
+    # The validator would accept some drafts locally, which makes the polish job's size depend on the fake's text.
+    monkeypatch.setattr("src.ai_integrations.POLISH_POLICY", "always")
+
+
+async def _bulk_run(monkeypatch, fake):
+    server = test_utils.TestServer(fake.app(), host="127.0.0.1")
+    await server.start_server()
+    base_url = str(server.make_url("")).rstrip("/")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", base_url)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{base_url}/v1")
+    service = AIService(response_cache=ResponseCache(":memory:"), angle_index=AngleIndex(":memory:"))
+    try:
+        return await BulkBatchRunner(service, poll_seconds=0).process_queries(QUERIES, {"general_instructions": ""})
+    finally:
+        await service.close()
+        await server.close()
+
+
+def test_bulk_run_fans_every_stage_back_into_variant_records(monkeypatch):
+    fake = FakeLLMServer(batch_seconds=0.05)
+    results = asyncio.run(_bulk_run(monkeypatch, fake))
+
+    assert [(r["query_id"], r["query_text"]) for r in results] == [(q["id"], q["text"]) for q in QUERIES]
+    for result in results:
+        assert len(result["variants"]) == NUM_VARIANTS_PER_QUERY
+        assert all(v["status"] == "Success" and v["final_answer"] for v in result["variants"])
+        assert len({v["angle"] for v in result["variants"]}) == NUM_VARIANTS_PER_QUERY
+    # Angles and polishes as OpenAI jobs, drafts as one Anthropic job; no live calls.
+    assert fake.stats["openai_batch"]["requests"] == 2
+    assert fake.stats["anthropic_batch"]["requests"] == 1
+    assert "openai" not in fake.stats and "anthropic" not in fake.stats
+
+
+@pytest.mark.parametrize("openai_status", ["completed", "expired"])
+def test_failed_batch_requests_become_failed_variants(monkeypatch, openai_status):
+    # An expired OpenAI job still returns its output file, with the unfinished requests in the error file.
+    fake = FakeLLMServer(openai_batch_status=openai_status, failing_custom_ids={"q0-v2-draft", "q1-angles", "q1-v3-polish"})
+    results = asyncio.run(_bulk_run(monkeypatch, fake))
+
+    failed = {(r["query_id"], i) for r in results for i, v in enumerate(r["variants"]) if v["status"] != "Success"}
+    assert failed == {(11, 1), (12, 2)}
+    assert "Anthropic batch request errored" in results[0]["variants"][1]["final_answer"]
+    assert "OpenAI batch request failed" in results[1]["variants"][2]["final_answer"]
+    # Angles that failed fall back to the generic perspectives.
+    assert all(v["angle"].startswith("Additional unique perspective") for v in results[1]["variants"])
+
+
+def test_openai_job_that_ended_without_output_raises(monkeypatch):
+    async def run():
+        fake = FakeLLMServer(openai_batch_status="failed", failing_custom_ids={"only"})
+        server = test_utils.TestServer(fake.app(), host="127.0.0.1")
+        await server.start_server()
+        monkeypatch.setenv("OPENAI_BASE_URL", str(server.make_url("/v1")))
+        service = AIService(response_cache=ResponseCache(":memory:"), angle_index=AngleIndex(":memory:"))
+        try:
+            transport = OpenAIBatchTransport(service.openai_client)
+            batch_id = await transport.submit([("only", service.build_angles_request(QUERIES[0]["text"], QUERIES[0]["client_info"]))])
+            with pytest.raises(BatchJobError, match="status 'failed'"):
+                await transport.is_finished(batch_id)
+        finally:
+            await service.close()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_batch_transport_requires_every_method():
+    class SubmitOnly(BatchTransport):
+        async def submit(self, requests):
+            return "batch"
+
+    with pytest.raises(TypeError):
+        BatchTransport()
+    with pytest.raises(TypeError):
+        SubmitOnly()
@@ -0,0 +1,53 @@
+# tests/test_post_processing.py
+"""
+src/post_processing.py must stay byte-for-byte identical to the legacy chain
+(benchmarks/legacy_post_processing.py) on a fixed generated corpus. The timings run only
+with pytest-benchmark installed: `python -m pytest tests/test_post_processing.py --benchmark-only`.
+"""
+
+import pytest
+
+from bench_post_processing import CHECKS, build_corpus, legacy_chain
+from src import post_processing
+
+try:
+    import pytest_benchmark
+except ImportError:
+    pytest_benchmark = None
+
+CORPUS = build_corpus(3000, seed=7)
+EDGE_CASES = [
+    "",
+    "Variant 12:",
+    "Kelvin said today was the day. Yesterday it was not.",
+    "İn the past weeks we doubled bookings, this 2024 year included.",
+    "Sales in Q1 3000 and q12019 and Q3 2023 grew. 2023 12:30:45 was the launch.",
+    "On 12/05/2020 and 1-2-2019 and March 3, 2021 nothing happened.",
+    " ".join(["word"] * 90),
+    " ".join(["Short sentence here."] * 40),
+    "One.\n\nTwo.\n\nThree.\n\nFour.",
+]
+
+needs_benchmark = pytest.mark.skipif(pytest_benchmark is None, reason="pytest-benchmark is not installed")
+
+
+@pytest.mark.parametrize("name, legacy, compiled", CHECKS, ids=[name for name, _, _ in CHECKS])
+def test_matches_legacy_on_fixed_corpus(name, legacy, compiled):
+    mismatches = [text for text in CORPUS + EDGE_CASES if legacy(text) != compiled(text)]
+    assert not mismatches, f"{len(mismatches)} {name} mismatches, first input: {mismatches[0]!r}"
+
+
+def test_process_batch_keeps_order():
+    assert post_processing.process_batch(CORPUS[:200]) == [legacy_chain(text) for text in CORPUS[:200]]
+
+
+@needs_benchmark
+def test_benchmark_legacy_chain(benchmark):
+    benchmark.group = "post_processing"
+    benchmark(lambda: [legacy_chain(text) for text in CORPUS])
+
+
+@needs_benchmark
+def test_benchmark_process_batch(benchmark):
+    benchmark.group = "post_processing"
+    benchmark(post_processing.process_batch, CORPUS)
@@ -0,0 +1,22 @@
+# tests/test_startup.py
+"""
+The headless entry points must start fast and never pull in the UI stack; see
+benchmarks/bench_startup.py for the full report.
+"""
+
+import pytest
+
+pytest.importorskip("anthropic")
+pytest.importorskip("openai")
+
+from bench_startup import run
+
+HEADLESS_MODULES = ["src.ai_integrations", "src.worker", "src.batch_cli"]
+BUDGET_MS = 1500
+
+
+@pytest.mark.parametrize("module", HEADLESS_MODULES)
+def test_headless_import_skips_ui_packages_and_stays_in_budget(module):
+    cumulative_us, _, _, loaded = run(module, repeat=3)
+    assert loaded == [], f"{module} imports UI-only packages: {', '.join(loaded)}"
+    assert cumulative_us / 1000 <= BUDGET_MS, f"{module} takes {cumulative_us / 1000:.0f} ms to import"